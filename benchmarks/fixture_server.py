@@ -0,0 +1,48 @@
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from threading import Thread
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves files without logging every request to stderr.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """
+    Serves a directory over HTTP on a free local port, on a background thread. Use as a context manager.
+    """
+
+    def __init__(self, directory: str, host: str = "127.0.0.1"):
+        """
+        :param directory: The directory to serve.
+        :param host: The interface to listen on.
+        """
+        self.__server = ThreadingHTTPServer((host, 0), partial(QuietHTTPRequestHandler, directory=directory))
+        self.__thread = Thread(target=self.__server.serve_forever, daemon=True)
+
+    def get_url(self, file_name: str = "") -> str:
+        """
+        :param file_name: A file in the served directory.
+        :return: The URL of the file.
+        """
+        host, port = self.__server.server_address[:2]
+        return "http://%s:%d/%s" % (host, port, file_name)
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self) -> 'FixtureServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from random import Random, seed as seed_random
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+from sys import path, exit
+from os import listdir
+from os.path import join, dirname, abspath, getsize, isdir
+path.append(abspath(join(dirname(__file__), '..')))
+
+import numpy as np
+
+from benchmarks.synthetic import make_tree, make_site, get_leaf_ids
+from benchmarks.fixture_server import FixtureServer
+from qubot.config.preset_rewards import QubotPresetRewardFunc
+from qubot.environment.environment import Environment
+from qubot.environment.q_learning_environment import QLearningEnvironment
+from qubot.driver.base_driver import BaseDriver
+from qubot.ui.ui_tree import UITree, TREE_COLUMNS_SUFFIX
+from qubot.utils.io import read_json, write_json
+
+# A benchmark is set up by a function returning a fresh run function, which returns the number of operations it did
+# and any extra metrics. Setup is neither timed nor counted towards the peak memory, and neither is releasing the
+# resources it enters on the given stack, e.g. servers, which happens once the run has been measured.
+Run = Callable[[], Tuple[int, Dict]]
+Setup = Callable[[contextlib.ExitStack], Run]
+
+
+def measure(name: str, params: Dict, setup: Setup, unit: str, track_memory=True) -> Dict:
+    """
+    Times a benchmark, then, on a fresh setup, measures its peak memory. The passes are separate because tracing
+    allocations slows Python code down several times.
+    :param name: The name of the benchmark.
+    :param params: The parameters of the benchmark, e.g. the tree size.
+    :param setup: Function setting the benchmark up and returning its run function.
+    :param unit: The unit of the operations counted by the run function.
+    :param track_memory: Measure the peak memory?
+    :return: The result of the benchmark.
+    """
+    with contextlib.ExitStack() as resources:
+        run = setup(resources)
+        start = perf_counter()
+        operations, extra = run()
+        seconds = perf_counter() - start
+
+    peak_memory_bytes = None
+    if track_memory:
+        with contextlib.ExitStack() as resources:
+            run = setup(resources)
+            tracemalloc.start()
+            try:
+                run()
+                peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    result = {
+        "name": name,
+        "params": params,
+        "unit": unit,
+        "operations": operations,
+        "seconds": seconds,
+        "per_second": operations / seconds if seconds > 0 else None,
+        "peak_memory_bytes": peak_memory_bytes,
+    }
+    result.update(extra)
+    return result
+
+
+def bench_hash_tree(node_count: int, depth: int, branching: int, seed: int, repeats: int) -> Setup:
+    def setup(resources: contextlib.ExitStack) -> Run:
+        tree = make_tree(node_count, depth, branching, seed)
+
+        def run():
+            for _ in range(repeats):
+                tree.hash_tree()
+            return tree.get_node_count() * repeats, {}
+        return run
+    return setup
+
+
+def bench_find_node_by_hash(node_count: int, depth: int, branching: int, seed: int, repeats: int) -> Setup:
+    def setup(resources: contextlib.ExitStack) -> Run:
+        tree = make_tree(node_count, depth, branching, seed)
+        tree.hash_tree()
+        node_hashes = list(tree.get_hash())
+
+        def run():
+            for _ in range(repeats):
+                for node_hash in node_hashes:
+                    tree.find_node_by_hash(node_hash)
+            return len(node_hashes) * repeats, {}
+        return run
+    return setup
+
+
+def bench_tree_file(node_count: int, depth: int, branching: int, seed: int, suffix: str, is_saving: bool) -> Setup:
+    def setup(resources: contextlib.ExitStack) -> Run:
+        tree = make_tree(node_count, depth, branching, seed)
+        directory = tempfile.mkdtemp(prefix="qubot_benchmark_tree_")
+        file_path = join(directory, "tree%s" % suffix)
+        tree.to_file(file_path)
+
+        def run():
+            if is_saving:
+                tree.to_file(file_path)
+            else:
+                UITree.from_file(file_path)
+            return tree.get_node_count(), {"file_bytes": get_file_bytes(join(directory, listdir(directory)[0]))}
+        return run
+    return setup
+
+
+def get_file_bytes(file_path: str) -> int:
+    if isdir(file_path):
+        return sum(getsize(join(file_path, name)) for name in listdir(file_path))
+    return getsize(file_path)
+
+
+def bench_set_terminal_node(node_count: int, depth: int, branching: int, seed: int, lookups: int) -> Setup:
+    def setup(resources: contextlib.ExitStack) -> Run:
+        tree = make_tree(node_count, depth, branching, seed)
+        tree.hash_tree()
+        leaf_ids = get_leaf_ids(tree)
+        html_ids = [Random(seed).choice(leaf_ids) for _ in range(lookups)]
+
+        def run():
+            for html_id in html_ids:
+                tree.set_terminal_node(html_id=html_id)
+            return len(html_ids), {}
+        return run
+    return setup
+
+
+def bench_environment_step(node_count: int, depth: int, branching: int, seed: int, steps: int, step_limit: int) -> Setup:
+    def setup(resources: contextlib.ExitStack) -> Run:
+        tree = make_tree(node_count, depth, branching, seed)
+        env = Environment(tree, QubotPresetRewardFunc.ENCOURAGE_EXPLORATION, step_limit)
+
+        def run():
+            seed_random(seed)
+            for _ in range(steps):
+                _, _, done, _ = env.step(env.get_next_explorative_transition_tuple())
+                if done:
+                    env.reset()
+            return steps, {}
+        return run
+    return setup
+
+
+def make_q_learning_environment(node_count: int, depth: int, branching: int, seed: int, step_limit: int,
+                                sparse_q_table: bool) -> QLearningEnvironment:
+    tree = make_tree(node_count, depth, branching, seed)
+    leaf_ids = get_leaf_ids(tree)
+    tree.set_terminal_node(html_id=leaf_ids[len(leaf_ids) // 2])
+    return QLearningEnvironment(tree, QubotPresetRewardFunc.ENCOURAGE_SUCCESS, 0.5, 0.6, 1, 0.01, step_limit, sparse_q_table)
+
+
+def bench_q_learning(node_count: int, depth: int, branching: int, seed: int, episodes: int, step_limit: int,
+                     sparse_q_table: bool, is_training: bool) -> Setup:
+    def setup(resources: contextlib.ExitStack) -> Run:
+        env = make_q_learning_environment(node_count, depth, branching, seed, step_limit, sparse_q_table)
+        if not is_training:
+            with contextlib.redirect_stdout(io.StringIO()):
+                env.train(episodes)
+
+        def run():
+            seed_random(seed)
+            steps_before = env.get_stats().get(Environment.STAT_STEP_COUNT) or 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                if is_training:
+                    env.train(episodes)
+                else:
+                    env.test(episodes)
+            steps = (env.get_stats().get(Environment.STAT_STEP_COUNT) or 0) - steps_before
+            return steps, {"episodes": episodes, "q_table_bytes": env.get_q_table().get_size_bytes()}
+        return run
+    return setup
+
+
+def bench_crawl(page_count: int, links_per_page: int, elements_per_page: int, seed: int, backend: str) -> Setup:
+    def setup(resources: contextlib.ExitStack) -> Run:
+        directory = tempfile.mkdtemp(prefix="qubot_benchmark_site_")
+        start_page = make_site(directory, page_count, links_per_page, elements_per_page, seed)
+        server = resources.enter_context(FixtureServer(directory))
+        driver = make_driver(backend)
+
+        def run():
+            tree = driver.construct_tree(server.get_url(start_page), deep=True, max_urls_to_visit=page_count)
+            stats = driver.get_stats()
+            pages = stats.get_count(BaseDriver.STAT_URLS_VISITED) + 1
+            return pages, {
+                "nodes": tree.get_node_count(),
+                "elements_encountered": stats.get_count(BaseDriver.STAT_ELEMENTS_ENCOUNTERED),
+            }
+        return run
+    return setup
+
+
+def make_driver(backend: str) -> BaseDriver:
+    if backend == "static":
+        from qubot.driver.static_html_driver import StaticHTMLDriver
+        return StaticHTMLDriver()
+    elif backend == "async":
+        from qubot.driver.async_driver import AsyncDriver
+        return AsyncDriver()
+    elif backend == "selenium":
+        from qubot.driver.driver import Driver
+        return Driver(use_snapshot=True)
+    raise Exception("'%s' is not a driver backend" % backend)
+
+
+def run_benchmarks(args) -> List[Dict]:
+    results = []
+    memory = not args.no_memory
+
+    def add(result: Dict):
+        results.append(result)
+        print("%-20s %14.1f %-10s %12s  %s" % (
+            result["name"], result["per_second"] or 0, "%s/s" % result["unit"],
+            "" if result["peak_memory_bytes"] is None else "%.2f MiB" % (result["peak_memory_bytes"] / 2 ** 20),
+            format_params(result["params"])))
+
+    for node_count in args.sizes:
+        shape = {"nodes": node_count, "depth": args.depth, "branching": args.branching}
+        tree_args = (node_count, args.depth, args.branching, args.seed)
+        add(measure("hash_tree", shape, bench_hash_tree(*tree_args, args.repeats), "nodes", memory))
+        add(measure("find_node_by_hash", shape, bench_find_node_by_hash(*tree_args, args.repeats), "lookups", memory))
+        add(measure("set_terminal_node", shape, bench_set_terminal_node(*tree_args, args.lookups), "lookups", memory))
+        for file_format, suffix in [("pickle", ""), ("columns", TREE_COLUMNS_SUFFIX)]:
+            params = dict(shape, format=file_format)
+            add(measure("save_tree", params, bench_tree_file(*tree_args, suffix, True), "nodes", memory))
+            add(measure("load_tree", params, bench_tree_file(*tree_args, suffix, False), "nodes", memory))
+        add(measure("environment_step", dict(shape, step_limit=args.step_limit),
+                    bench_environment_step(*tree_args, args.steps, args.step_limit), "steps", memory))
+        for sparse_q_table in [False, True]:
+            if not sparse_q_table and node_count > args.max_dense_nodes:
+                # The dense Q-table is quadratic in the number of nodes
+                continue
+            params = dict(shape, episodes=args.episodes, step_limit=args.step_limit, sparse_q_table=sparse_q_table)
+            add(measure("train", params, bench_q_learning(*tree_args, args.episodes, args.step_limit, sparse_q_table, True), "steps", memory))
+            add(measure("test", params, bench_q_learning(*tree_args, args.episodes, args.step_limit, sparse_q_table, False), "steps", memory))
+
+    if args.pages > 0:
+        params = {"pages": args.pages, "links_per_page": args.links_per_page, "elements_per_page": args.elements_per_page, "backend": args.backend}
+        add(measure("crawl", params, bench_crawl(args.pages, args.links_per_page, args.elements_per_page, args.seed, args.backend), "pages", memory))
+    return results
+
+
+def format_params(params: Dict) -> str:
+    return " ".join("%s=%s" % (name, value) for name, value in params.items())
+
+
+def get_environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=dirname(abspath(__file__)), capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    try:
+        from importlib.metadata import version
+        qubot_version = version("qubot")
+    except Exception:
+        qubot_version = None
+    return {
+        "qubot_version": qubot_version,
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Compares the throughput of every benchmark with a baseline run.
+    :param tolerance: The fraction of throughput a benchmark may lose before it counts as a regression.
+    :return: The descriptions of the regressions.
+    """
+    baseline_by_key = {(result["name"], format_params(result["params"])): result for result in baseline}
+    regressions = []
+    for result in results:
+        key = (result["name"], format_params(result["params"]))
+        if key not in baseline_by_key or not baseline_by_key[key]["per_second"] or not result["per_second"]:
+            continue
+        ratio = result["per_second"] / baseline_by_key[key]["per_second"]
+        print("%-20s %6.2fx  %s" % (key[0], ratio, key[1]))
+        if ratio < 1 - tolerance:
+            regressions.append("%s %s: %.2fx the baseline throughput" % (key[0], key[1], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tree indexing, the environment, training and crawling.')
+    parser.add_argument('--output_file', '-o', type=str, dest='output_file', default="benchmark_results.json",
+                        help='the JSON file to write the results to')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='the node counts of the synthetic trees')
+    parser.add_argument('--depth', type=int, default=6, help='the maximum depth of the synthetic trees')
+    parser.add_argument('--branching', type=int, default=8, help='the number of children of interior nodes')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the synthetic trees and of the agent')
+    parser.add_argument('--repeats', type=int, default=5, help='the number of passes over the tree of the indexing benchmarks')
+    parser.add_argument('--lookups', type=int, default=200, help='the number of set_terminal_node lookups')
+    parser.add_argument('--steps', type=int, default=20000, help='the number of Environment.step calls')
+    parser.add_argument('--episodes', type=int, default=200, help='the number of training and testing episodes')
+    parser.add_argument('--step_limit', type=int, default=100, help='the step limit of each episode')
+    parser.add_argument('--max_dense_nodes', type=int, default=20000,
+                        help='the largest tree to also train with a dense Q-table')
+    parser.add_argument('--pages', type=int, default=20, help='the number of pages of the crawled fixture site (0 skips crawling)')
+    parser.add_argument('--links_per_page', type=int, default=3, help='the number of links on each fixture page')
+    parser.add_argument('--elements_per_page', type=int, default=50, help='the number of other elements on each fixture page')
+    parser.add_argument('--backend', type=str, default="static", choices=["static", "selenium", "async"],
+                        help='the driver backend to crawl the fixture site with')
+    parser.add_argument('--no_memory', action='store_true', default=False, help='skip the peak memory passes')
+    parser.add_argument('--baseline', type=str, default=None, help='a results file to compare the throughput with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='the fraction of baseline throughput a benchmark may lose before failing')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    write_json(abspath(args.output_file), {"environment": get_environment(), "results": results})
+
+    if args.baseline:
+        regressions = compare(results, read_json(args.baseline).get("results", []), args.tolerance)
+        for regression in regressions:
+            print("Regression: %s" % regression)
+        if regressions:
+            exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from random import Random
+from typing import List
+from os import makedirs
+from sys import path
+from os.path import join, dirname, abspath
+path.append(abspath(join(dirname(__file__), '..')))
+
+from qubot.ui.ui_snapshot import UIElementSnapshot
+from qubot.ui.ui_tree import UITree, UITreeNode
+
+# Share of leaves of each clickable or inputtable tag; the rest are plain text elements
+LEAF_TAGS = [("a", 0.4), ("button", 0.2), ("input", 0.2), ("span", 0.2)]
+
+
+def make_dom(node_count: int, depth: int = 6, branching: int = 4, seed: int = 0) -> list:
+    """
+    Generates the compact form (see UIElementSnapshot.to_list) of a page, filled breadth first. Elements above the
+    maximum depth are <div>s with `branching` children; elements at the maximum depth are links, buttons, inputs or
+    spans. Every element has a unique id, so no two nodes of the tree hash the same.
+    :param node_count: The number of elements on the page, including <html>.
+    :param depth: The maximum depth of the page's elements below <html>.
+    :param branching: The number of children of each <div>.
+    :param seed: The seed of the random tag choices.
+    :return: The compact page.
+    """
+    rng = Random(seed)
+    root = ["html", ["id", "n0"], []]
+    queue = [(root, 0)]
+    count = 1
+    for parent, parent_depth in queue:
+        if count >= node_count:
+            break
+        for _ in range(branching):
+            if count >= node_count:
+                break
+            if parent_depth + 1 < depth:
+                tag = "div"
+            else:
+                tag = rng.choices([tag for tag, _ in LEAF_TAGS], [share for _, share in LEAF_TAGS])[0]
+            attributes = ["id", "n%d" % count, "class", "c%d" % (count % 16)]
+            if tag == "a":
+                attributes += ["href", "#n%d" % count]
+            element = [tag, attributes, [] if tag == "input" else ["text %d" % count]]
+            parent[2].append(element)
+            count += 1
+            if tag == "div":
+                queue.append((element, parent_depth + 1))
+    return root
+
+
+def make_tree(node_count: int, depth: int = 6, branching: int = 4, seed: int = 0) -> UITree:
+    """
+    Generates a UITree without a browser, with the shape of make_dom's page.
+    :return: The tree.
+    """
+    root = UITreeNode(UIElementSnapshot.from_list(make_dom(node_count, depth, branching, seed)))
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for element in node.get_element().find_elements_by_xpath("./*"):
+            node.add_transition(element)
+        stack.extend(child for _, child in node.get_transition_tuples())
+    return UITree(root)
+
+
+def get_leaf_ids(tree: UITree) -> List[str]:
+    """
+    :return: The html ids of the tree's childless nodes, in tree order.
+    """
+    leaf_ids = []
+    stack = [tree.get_root()]
+    while stack:
+        node = stack.pop()
+        children = [child for _, child in node.get_transition_tuples()]
+        if not children:
+            leaf_ids.append(node.get_html_id())
+        stack.extend(reversed(children))
+    return leaf_ids
+
+
+def make_site(directory: str, page_count: int, links_per_page: int = 3, elements_per_page: int = 50, seed: int = 0) -> str:
+    """
+    Writes a static website to crawl: page_count pages, each linking to links_per_page random other pages and holding
+    elements_per_page other elements (buttons, inputs and text).
+    :param directory: The directory to write the pages to.
+    :return: The file name of the start page.
+    """
+    rng = Random(seed)
+    makedirs(directory, exist_ok=True)
+    for page in range(page_count):
+        body = []
+        for link in range(links_per_page):
+            target = rng.randrange(page_count)
+            body.append('<a id="p%d-l%d" href="page%d.html">Page %d</a>' % (page, link, target, target))
+        for element in range(elements_per_page):
+            element_id = "p%d-e%d" % (page, element)
+            kind = element % 3
+            if kind == 0:
+                body.append('<button id="%s">Button %d</button>' % (element_id, element))
+            elif kind == 1:
+                body.append('<input id="%s" type="text">' % element_id)
+            else:
+                body.append('<p id="%s">Text %d on page %d</p>' % (element_id, element, page))
+        with open(join(directory, "page%d.html" % page), "w") as page_file:
+            page_file.write('<html><head><title>Page %d</title></head><body><div>%s</div></body></html>' % (page, "".join(body)))
+    return "page0.html"
@@ -1,6 +1,39 @@
-from qubot.config.config import QubotConfigModelParameters, QubotConfigTerminalInfo, QubotDriverParameters
-from qubot.config.preset_rewards import QubotPresetRewardFunc, int_to_reward_func, str_to_reward_func
-from qubot.config.qubot import Qubot
-from qubot.stats.stats import Stats
-from qubot.ui.ui_tree import UITree, UITreeNode
-from qubot.ui.ui_action import UIAction
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+# Module of each export. Exports are imported on first access (PEP 562), so importing qubot doesn't load NumPy, gym or
+# Selenium until the parts of Qubot using them are.
+_EXPORTS = {
+    "QubotConfigModelParameters": "qubot.config.config",
+    "QubotConfigTerminalInfo": "qubot.config.config",
+    "QubotDriverParameters": "qubot.config.config",
+    "QubotStatsParameters": "qubot.config.config",
+    "QubotPresetRewardFunc": "qubot.config.preset_rewards",
+    "int_to_reward_func": "qubot.config.preset_rewards",
+    "str_to_reward_func": "qubot.config.preset_rewards",
+    "Qubot": "qubot.config.qubot",
+    "Stats": "qubot.stats.stats",
+    "UITree": "qubot.ui.ui_tree",
+    "UITreeNode": "qubot.ui.ui_tree",
+    "UIAction": "qubot.ui.ui_action",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+    value = getattr(import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+if TYPE_CHECKING:
+    from qubot.config.config import QubotConfigModelParameters, QubotConfigTerminalInfo, QubotDriverParameters, QubotStatsParameters
+    from qubot.config.preset_rewards import QubotPresetRewardFunc, int_to_reward_func, str_to_reward_func
+    from qubot.config.qubot import Qubot
+    from qubot.stats.stats import Stats
+    from qubot.ui.ui_tree import UITree, UITreeNode
+    from qubot.ui.ui_action import UIAction
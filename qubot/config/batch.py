@@ -0,0 +1,224 @@
+import multiprocessing
+import multiprocessing.pool
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+from sys import path
+import os
+from os.path import join, dirname, basename, abspath, isabs
+path.append(join(dirname(__file__), os.pardir))
+
+from qubot.stats.stats import Stats
+from qubot.utils.io import read_json, write_json
+from qubot.utils.profiler import get_profiler
+
+BATCH_STAGE_CRAWLED = "crawled"
+BATCH_STAGE_FINISHED = "finished"
+BATCH_STAGE_FAILED = "failed"
+
+# Written to the output directory once every app has finished
+BATCH_SUMMARY_FILE = "batch.qu.json"
+
+
+class BatchApp:
+    """
+    An app of a batch: a .qu configuration and the name its results are written under.
+    """
+
+    def __init__(self, name: str, config: Dict, config_file: Optional[str] = None):
+        self.name = name
+        self.config = config
+        self.config_file = config_file
+
+
+class BatchResult:
+    """
+    The outcome of a single app of a batch.
+    """
+
+    def __init__(self, app: BatchApp, stats_file: Optional[str] = None, error: Optional[str] = None,
+                 crawl_seconds: Optional[float] = None, train_seconds: Optional[float] = None):
+        self.app = app
+        self.stats_file = stats_file
+        self.error = error
+        self.crawl_seconds = crawl_seconds
+        self.train_seconds = train_seconds
+
+    def is_successful(self) -> bool:
+        return self.error is None
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.app.name,
+            "config_file": self.app.config_file,
+            "stats_file": self.stats_file,
+            "error": self.error,
+            "crawl_seconds": self.crawl_seconds,
+            "train_seconds": self.train_seconds,
+        }
+
+
+def run_batch(apps: List[BatchApp], output_dir: str, crawl_workers: int = 2, processes: Optional[int] = None,
+              on_progress: Callable[[str, BatchResult, int, int], None] = None) -> List[BatchResult]:
+    """
+    Crawls, trains and tests many apps, overlapping the crawls of some apps with the training of others. Crawls run
+    on a pool of threads, as they mostly wait on browsers, and hand their trees over to a separate pool of processes
+    through .qu.tree files in the output directory. Each app's stats are written to <name>.qu.json in the output
+    directory as soon as the app finishes, and a summary of every app to batch.qu.json at the end. An app failing
+    doesn't stop the others.
+    :param apps: The apps to run, with unique names.
+    :param output_dir: The directory to write the trees, the stats and the summary to, created if needed.
+    :param crawl_workers: The number of apps crawled at the same time.
+    :param processes: The number of apps trained and tested at the same time, defaulting to the number of CPUs.
+    :param on_progress: Function called with the stage each app reached (BATCH_STAGE_*), its result so far, the number
+    of apps finished and the total number of apps.
+    :return: One BatchResult per app, in the order of apps.
+    """
+    if len(set(app.name for app in apps)) != len(apps):
+        raise Exception("the apps of a batch must have unique names")
+    os.makedirs(output_dir, exist_ok=True)
+    results = {app.name: BatchResult(app) for app in apps}
+    finished_count = 0
+
+    def report(stage: str, result: BatchResult):
+        if on_progress is not None:
+            on_progress(stage, result, finished_count, len(apps))
+
+    def fail(result: BatchResult, e: Exception):
+        result.error = str(e) or e.__class__.__name__
+        result.stats_file = join(output_dir, "%s.qu.json" % result.app.name)
+        write_json(result.stats_file, {"error": result.error})
+
+    # Workers are spawned rather than forked, as forking while crawl threads run can deadlock the children. Each app
+    # gets a fresh worker, so no module state, e.g. the profiler's, carries over from one app to the next.
+    with ThreadPoolExecutor(max(1, crawl_workers)) as crawl_pool, \
+            multiprocessing.get_context("spawn").Pool(processes, maxtasksperchild=1) as train_pool:
+        pending: Dict[Future, BatchResult] = {
+            crawl_pool.submit(_crawl_app, app, output_dir): results[app.name] for app in apps
+        }
+        is_crawl = {future: True for future in pending}
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                result = pending.pop(future)
+                try:
+                    if is_crawl.pop(future):
+                        tree_file, crawl_stats, result.crawl_seconds = future.result()
+                        report(BATCH_STAGE_CRAWLED, result)
+                        train_future = _submit_to_pool(train_pool, _train_app, result.app, output_dir, tree_file,
+                                                       crawl_stats, get_profiler().is_enabled())
+                        pending[train_future] = result
+                        is_crawl[train_future] = False
+                        continue
+                    result.stats_file, result.train_seconds, profile = future.result()
+                    get_profiler().merge(profile)
+                except Exception as e:
+                    fail(result, e)
+                finished_count += 1
+                report(BATCH_STAGE_FINISHED if result.is_successful() else BATCH_STAGE_FAILED, result)
+
+    ordered_results = [results[app.name] for app in apps]
+    write_json(join(output_dir, BATCH_SUMMARY_FILE), [result.to_dict() for result in ordered_results])
+    return ordered_results
+
+
+def _submit_to_pool(pool: multiprocessing.pool.Pool, func: Callable, *args) -> Future:
+    """
+    Runs a function on a process pool, like ProcessPoolExecutor.submit. Pools limit the tasks of each worker on every
+    Python version, unlike executors.
+    :return: A future resolved with the result or the error of the function.
+    """
+    future = Future()
+    pool.apply_async(func, args, callback=future.set_result, error_callback=future.set_exception)
+    return future
+
+
+def _crawl_app(app: BatchApp, output_dir: str):
+    """
+    Crawls an app and writes its tree to <name>.qu.tree in the output directory.
+    :return: The tree file, the crawl stats and the seconds the crawl took.
+    """
+    from qubot.config.qubot import Qubot
+    from qubot.config.config import QubotStatsParameters
+    from qubot.ui.ui_tree import TREE_COLUMNS_SUFFIX
+    start = perf_counter()
+    args = Qubot.args_from_dict(app.config)
+    stats_params = args["stats_params"] if args["stats_params"] is not None else QubotStatsParameters()
+    stats = Stats(str(Qubot), stats_params.max_events, stats_params.spill_file)
+    tree, driver = Qubot.construct_tree(args["url_to_test"], args["driver_params"], args["input_values"], stats=stats, stats_params=stats_params)
+    stats.close()
+    tree_file = join(output_dir, "%s%s" % (app.name, TREE_COLUMNS_SUFFIX))
+    tree.to_file(tree_file)
+    return tree_file, stats.merge(driver.get_stats()).to_dict(), perf_counter() - start
+
+
+def _train_app(app: BatchApp, output_dir: str, tree_file: str, crawl_stats: Dict, is_profiling: bool):
+    """
+    Trains and tests an app on its crawled tree, in a worker process, and writes its stats to <name>.qu.json in the
+    output directory.
+    :param is_profiling: Profile the app, as spawned workers don't inherit the parent's profiler?
+    :return: The stats file, the seconds training and testing took and the profiled timings.
+    """
+    from qubot.config.qubot import Qubot
+    from qubot.ui.ui_tree import UITree
+    if is_profiling:
+        get_profiler().enable()
+    start = perf_counter()
+    qb = Qubot.from_dict(app.config, tree=UITree.from_file(tree_file))
+    qb.train(verbose=False)
+    qb.test(verbose=False)
+    stats = qb.get_stats()
+    stats.merge(Stats.from_dict(str(Qubot), crawl_stats, stats.get_max_events(), stats.get_spill_path()))
+    stats_file = join(output_dir, "%s.qu.json" % app.name)
+    write_json(stats_file, stats.to_dict())
+    return stats_file, perf_counter() - start, get_profiler().to_dict()
+
+
+def apps_from_files(file_paths: List[str]) -> List[BatchApp]:
+    """
+    Reads the apps of a batch from .qu configuration files and manifests. A manifest is a JSON file with a 'configs'
+    list, each entry either the path of a configuration file, relative to the manifest, or a configuration itself.
+    Apps are named after their configuration file, or the 'name' of an inline configuration, and duplicate names are
+    numbered.
+    :param file_paths: The configuration files and manifests.
+    :return: The apps, in order.
+    """
+    apps = []
+    for file_path in file_paths:
+        data = read_json(file_path)
+        if not data:
+            raise Exception("'%s' isn't a readable .qu configuration or manifest" % file_path)
+        if "configs" not in data:
+            apps.append(BatchApp(get_app_name(file_path), data, file_path))
+            continue
+        manifest_dir = dirname(abspath(file_path))
+        for index, entry in enumerate(data["configs"]):
+            if isinstance(entry, str):
+                config_file = entry if isabs(entry) else join(manifest_dir, entry)
+                config = read_json(config_file)
+                if not config:
+                    raise Exception("'%s' listed in '%s' isn't a readable .qu configuration" % (entry, file_path))
+                apps.append(BatchApp(get_app_name(config_file), config, config_file))
+            else:
+                name = entry["name"] if "name" in entry else "%s_%d" % (get_app_name(file_path), index)
+                apps.append(BatchApp(name, {key: value for key, value in entry.items() if key != "name"}))
+
+    # Numbered names skip those already taken, and those other apps are named after
+    original_names = set(app.name for app in apps)
+    names = set()
+    for app in apps:
+        name, number = app.name, 1
+        while name in names or (number > 1 and name in original_names):
+            number += 1
+            name = "%s_%d" % (app.name, number)
+        app.name = name
+        names.add(name)
+    return apps
+
+
+def get_app_name(file_path: str) -> str:
+    name = basename(file_path)
+    for suffix in [".qu.json", ".json", ".qu"]:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
@@ -6,6 +6,13 @@ class QubotConfigTerminalInfo:
     Abstracts information on the terminal nodes to find.
     """
     def __init__(self, terminal_ids: List[str] = None, terminal_classes: List[str] = None, terminal_contains_text: List[str] = None):
+        """
+        Initializes the terminal info. Every node matching any of the rules is terminal, and matching is case-insensitive.
+        :param terminal_ids: Ids of terminal nodes. Nodes with the exact id match, or if there are none, ids containing it.
+        :param terminal_classes: Classes of terminal nodes. Nodes with the class match, or if there are none, class
+        attributes containing it.
+        :param terminal_contains_text: Texts of terminal nodes, matched against each element's own text and start tag.
+        """
         self.terminal_ids = terminal_ids if terminal_ids is not None else []
         self.terminal_classes = terminal_classes if terminal_classes is not None else []
         self.terminal_contains_text = terminal_contains_text if terminal_contains_text is not None else []
@@ -15,7 +22,7 @@ class QubotConfigModelParameters:
     """
     Abstracts information on the Q-Learning model parameters.
     """
-    def __init__(self, alpha=0.5, gamma=0.6, epsilon=1, decay=0.01, train_episodes=1000, test_episodes=100, step_limit=100):
+    def __init__(self, alpha=0.5, gamma=0.6, epsilon=1, decay=0.01, train_episodes=1000, test_episodes=100, step_limit=100, sparse_q_table=False, batch_episodes=1, q_table_file=None, convergence_tolerance=None, convergence_window=10):
         """
         Initializes the model configuration parameters.
         :param alpha: Higher alpha => consider more recent information (learning rate).
@@ -25,6 +32,17 @@ class QubotConfigModelParameters:
         :param train_episodes: The number of episodes to train Qubot on.
         :param test_episodes: The number of episodes to test Qubot on.
         :param step_limit: Maximum number of steps to take before force-exiting the episode.
+        :param sparse_q_table: Store Q-values only for the tree's edges instead of for every pair of nodes?
+        :param batch_episodes: Number of episodes to run in lockstep as one vectorized batch (1 runs them one by one).
+        Only reward functions declared with RewardRules, like the presets, can be batched; episodes of any other reward
+        function run one by one.
+        :param q_table_file: .npz file to warm-start training from and save the learned Q-table to, with .npz appended
+        if missing. Values are mapped onto the nodes that survived since the saved run, and only the episodes those nodes
+        don't cover are trained.
+        :param convergence_tolerance: Stop training early once both the largest per-episode change to a Q-value and the
+        change in the moving average of episode rewards stay under this value (None always trains every episode).
+        :param convergence_window: Number of episodes the rewards are averaged over, and for which both changes must
+        stay under the tolerance.
         """
         self.alpha = alpha
         self.gamma = gamma
@@ -33,17 +51,67 @@ class QubotConfigModelParameters:
         self.train_episodes = train_episodes
         self.test_episodes = test_episodes
         self.step_limit = step_limit
+        self.sparse_q_table = sparse_q_table
+        self.batch_episodes = batch_episodes
+        self.q_table_file = q_table_file
+        self.convergence_tolerance = convergence_tolerance
+        self.convergence_window = convergence_window
 
 class QubotDriverParameters:
     """
     Abstracts information on the Selenium Driver parameters.
     """
 
-    def __init__(self, use_cache: bool = False, max_urls: int = 10):
+    def __init__(self, use_cache: bool = False, max_urls: int = 10, use_snapshot: bool = True, pool_size: int = 1, workers: int = 1, tree_file: str = None, backend: str = "selenium", webdriver_url: str = None, action_timeout: float = 10, crawl_timeout: float = None, max_retries: int = 2, ready_state_timeout: float = 10, network_idle_timeout: float = 5, dom_quiet_timeout: float = 5):
         """
         Initializes the Selenium configuration parameters.
         :param use_cache: Use the cache when scraping the website under test?
         :param max_urls: Maximum number of recursive URLs to visit during scraping.
+        :param use_snapshot: Scrape each page in a single WebDriver call instead of querying every element?
+        :param pool_size: Maximum number of idle browser sessions reused across deep crawling actions.
+        :param workers: Number of headless browsers crawling in parallel. Values above 1 always scrape snapshots.
+        :param tree_file: File to keep the crawled tree in between runs. Each crawl only replays the clicks and inputs
+        that changed since the tree in the file, then overwrites it. Paths ending with .qu.tree are kept as a directory
+        of memory-mapped columns instead of a pickle.
+        :param backend: "selenium" drives the browsers through Selenium. "async" drives `workers` sessions concurrently
+        over the WebDriver protocol with asyncio, always scraping snapshots and never using the cache. "static" parses
+        static HTML from files or a local server without a browser, following links to pages on the same origin.
+        :param webdriver_url: URL of a running WebDriver server for the "async" backend. Defaults to launching a local
+        geckodriver per session.
+        :param action_timeout: Seconds each attempt at a deep crawling action may take before it is abandoned.
+        :param crawl_timeout: Seconds after which the crawl stops starting new actions (None crawls until done).
+        :param max_retries: Number of times a failed action is retried, backing off exponentially with jitter.
+        :param ready_state_timeout: Maximum seconds to wait for a page's document.readyState to be "complete" before
+        scraping it (None doesn't wait).
+        :param network_idle_timeout: Maximum seconds to wait for a page's fetch/XHR requests to settle (None doesn't wait).
+        :param dom_quiet_timeout: Maximum seconds to wait for a page's DOM to stop changing (None doesn't wait).
         """
         self.use_cache = use_cache
         self.max_urls = max_urls
+        self.use_snapshot = use_snapshot
+        self.pool_size = pool_size
+        self.workers = workers
+        self.tree_file = tree_file
+        self.backend = backend
+        self.webdriver_url = webdriver_url
+        self.action_timeout = action_timeout
+        self.crawl_timeout = crawl_timeout
+        self.max_retries = max_retries
+        self.ready_state_timeout = ready_state_timeout
+        self.network_idle_timeout = network_idle_timeout
+        self.dom_quiet_timeout = dom_quiet_timeout
+
+class QubotStatsParameters:
+    """
+    Abstracts information on how stats are kept.
+    """
+
+    def __init__(self, max_events: int = None, spill_file: str = None):
+        """
+        Initializes the stats configuration parameters.
+        :param max_events: Number of most recent events to keep in memory per stat (None keeps all of them). Counts,
+        sums, averages and percentiles still cover every event.
+        :param spill_file: Path of a JSONL file to append every event to as it is recorded.
+        """
+        self.max_events = max_events
+        self.spill_file = spill_file
@@ -5,6 +5,7 @@ path.append(abspath(join(dirname(__file__), '..')))
 
 from qubot.ui.ui_action import UIAction
 from qubot.ui.ui_tree import UITreeNode
+from qubot.environment.reward_rules import RewardRule, RewardRules, reward_rules
 
 LARGE_REWARD = 100
 MEDIUM_REWARD = 10
@@ -14,60 +15,81 @@ SMALL_PENALTY = -1
 MEDIUM_PENALTY = -10
 LARGE_PENALTY = -100
 
+# Presets are declared as RewardRules, so training can precompute their rewards for every node instead of calling them
+# on every step. Each function evaluates its rules, so both always agree.
+
+ENCOURAGE_EXPLORATION_RULES = RewardRules([
+    RewardRule(LARGE_PENALTY, is_terminal=True),
+    RewardRule(SMALL_PENALTY, is_leaf=True),
+    RewardRule(MEDIUM_REWARD, actions=[UIAction.LEFT_CLICK]),
+], NO_REWARD)
+
+DISCOURAGE_EXPLORATION_RULES = RewardRules([
+    RewardRule(LARGE_REWARD, is_terminal=True),
+    RewardRule(SMALL_PENALTY, is_leaf=True),
+    RewardRule(MEDIUM_REWARD, actions=[UIAction.LEFT_CLICK]),
+], NO_REWARD)
+
+HEAVILY_ENCOURAGE_EXPLORATION_RULES = RewardRules([
+    RewardRule(SMALL_PENALTY, is_terminal=True),
+    RewardRule(SMALL_PENALTY, is_leaf=True),
+    RewardRule(LARGE_REWARD, actions=[UIAction.LEFT_CLICK]),
+], SMALL_PENALTY)
+
+HEAVILY_DISCOURAGE_EXPLORATION_RULES = RewardRules([
+    RewardRule(SMALL_PENALTY, is_terminal=True),
+    RewardRule(SMALL_PENALTY, is_leaf=True),
+    RewardRule(LARGE_REWARD, actions=[UIAction.LEFT_CLICK]),
+], SMALL_PENALTY)
+
+# Visits count the current one, so a repeat visit is a second one
+REWARD_REPEAT_VISITS_RULES = RewardRules([
+    RewardRule(LARGE_REWARD, min_visits=2),
+    RewardRule(LARGE_PENALTY, is_terminal=True),
+    RewardRule(SMALL_PENALTY, is_leaf=True),
+    RewardRule(MEDIUM_REWARD, actions=[UIAction.LEFT_CLICK]),
+], NO_REWARD)
+
+PENALIZE_REPEAT_VISITS_RULES = RewardRules([
+    RewardRule(LARGE_PENALTY, min_visits=2),
+    RewardRule(LARGE_PENALTY, is_terminal=True),
+    RewardRule(SMALL_PENALTY, is_leaf=True),
+    RewardRule(MEDIUM_REWARD, actions=[UIAction.LEFT_CLICK]),
+], NO_REWARD)
+
+ENCOURAGE_SUCCESS_RULES = RewardRules([
+    RewardRule(LARGE_REWARD, is_terminal=True),
+    RewardRule(SMALL_PENALTY, is_leaf=True),
+    RewardRule(MEDIUM_REWARD, actions=[UIAction.LEFT_CLICK]),
+], NO_REWARD)
+
+@reward_rules(ENCOURAGE_EXPLORATION_RULES)
 def encourage_exploration(action: UIAction, node: UITreeNode):
-    if node.is_terminal():
-        return LARGE_PENALTY
-    elif not node.get_children():
-        return SMALL_PENALTY
-    elif action == UIAction.LEFT_CLICK:
-        return MEDIUM_REWARD
-    return NO_REWARD
+    return ENCOURAGE_EXPLORATION_RULES(action, node)
 
+@reward_rules(DISCOURAGE_EXPLORATION_RULES)
 def discourage_exploration(action: UIAction, node: UITreeNode):
-    if node.is_terminal():
-        return LARGE_REWARD
-    elif not node.get_children():
-        return SMALL_PENALTY
-    elif action == UIAction.LEFT_CLICK:
-        return MEDIUM_REWARD
-    return NO_REWARD
+    return DISCOURAGE_EXPLORATION_RULES(action, node)
 
+@reward_rules(HEAVILY_ENCOURAGE_EXPLORATION_RULES)
 def heavily_encourage_exploration(action: UIAction, node: UITreeNode):
-    if node.is_terminal():
-        return SMALL_PENALTY
-    elif not node.get_children():
-        return SMALL_PENALTY
-    elif action == UIAction.LEFT_CLICK:
-        return LARGE_REWARD
-    return SMALL_PENALTY
+    return HEAVILY_ENCOURAGE_EXPLORATION_RULES(action, node)
 
+@reward_rules(HEAVILY_DISCOURAGE_EXPLORATION_RULES)
 def heavily_discourage_exploration(action: UIAction, node: UITreeNode):
-    if node.is_terminal():
-        return SMALL_PENALTY
-    elif not node.get_children():
-        return SMALL_PENALTY
-    elif action == UIAction.LEFT_CLICK:
-        return LARGE_REWARD
-    return SMALL_PENALTY
+    return HEAVILY_DISCOURAGE_EXPLORATION_RULES(action, node)
 
+@reward_rules(REWARD_REPEAT_VISITS_RULES)
 def reward_repeat_visits(action: UIAction, node: UITreeNode):
-    if node.get_visits():
-        return LARGE_REWARD
-    return encourage_exploration(action, node)
+    return REWARD_REPEAT_VISITS_RULES(action, node)
 
+@reward_rules(PENALIZE_REPEAT_VISITS_RULES)
 def penalize_repeat_visits(action: UIAction, node: UITreeNode):
-    if node.get_visits():
-        return LARGE_PENALTY
-    return encourage_exploration(action, node)
+    return PENALIZE_REPEAT_VISITS_RULES(action, node)
 
+@reward_rules(ENCOURAGE_SUCCESS_RULES)
 def encourage_success(action: UIAction, node: UITreeNode):
-    if node.is_terminal():
-        return LARGE_REWARD
-    elif not node.get_children():
-        return SMALL_PENALTY
-    elif action == UIAction.LEFT_CLICK:
-        return MEDIUM_REWARD
-    return NO_REWARD
+    return ENCOURAGE_SUCCESS_RULES(action, node)
 
 class QubotPresetRewardFunc(Enum):
     ENCOURAGE_EXPLORATION = encourage_exploration
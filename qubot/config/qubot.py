@@ -1,38 +1,49 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from copy import copy, deepcopy
 from sys import path
 import os
 from os.path import join, dirname
 path.append(join(dirname(__file__), os.pardir))
 
-from qubot.config.config import QubotConfigTerminalInfo, QubotConfigModelParameters, QubotDriverParameters
+from qubot.config.config import QubotConfigTerminalInfo, QubotConfigModelParameters, QubotDriverParameters, QubotStatsParameters
 from qubot.environment.q_learning_environment import QLearningEnvironment
-from qubot.driver.driver import Driver
+from qubot.driver.base_driver import BaseDriver
+from qubot.driver.page_readiness import PageReadiness
 from qubot.config.preset_rewards import QubotPresetRewardFunc, int_to_reward_func, str_to_reward_func
 from qubot.stats.stats import Stats
+from qubot.utils.deadline import CancelToken
 from qubot.utils.io import read_json
-from qubot.ui.ui_tree import UITree
+from qubot.ui.ui_tree import UITree, UITreeNode
+from qubot.config.sweep import SweepResult, run_sweep
 
 class Qubot:
 
     STAT_CONSTRUCT_UI_TREE_TIME = "construct_ui_tree_time"
     STAT_TRAINING_TIME = "training_time"
     STAT_TESTING_TIME = "testing_time"
+    STAT_WARM_START_COVERAGE = "warm_start_coverage"
 
-    def __init__(self, url_to_test: str, terminal_info_testing: QubotConfigTerminalInfo, terminal_info_training: QubotConfigTerminalInfo = None, driver_params: QubotDriverParameters = None, model_params: QubotConfigModelParameters = None, reward_func: QubotPresetRewardFunc = QubotPresetRewardFunc.ENCOURAGE_EXPLORATION, input_values: Dict[str, str] = None):
+    def __init__(self, url_to_test: str, terminal_info_testing: QubotConfigTerminalInfo, terminal_info_training: QubotConfigTerminalInfo = None, driver_params: QubotDriverParameters = None, model_params: QubotConfigModelParameters = None, reward_func: QubotPresetRewardFunc = QubotPresetRewardFunc.ENCOURAGE_EXPLORATION, input_values: Dict[str, str] = None, tree: UITree = None, stats_params: QubotStatsParameters = None, cancel_token: CancelToken = None):
         self.__url_to_test = url_to_test
         self.__terminal_info_testing = terminal_info_testing
         self.__terminal_info_training = terminal_info_training if terminal_info_training is not None else copy(terminal_info_testing)
         self.__driver_info = driver_params if driver_params is not None else QubotDriverParameters()
         self.__model_info = model_params if model_params is not None else QubotConfigModelParameters()
         self.__input_values = input_values
+        self.__cancel_token = cancel_token
+        # Terminal nodes of the training and testing rules, and the (tree, version) they were resolved on
+        self.__terminal_nodes: Tuple[List[UITreeNode], List[UITreeNode]] = ([], [])
+        self.__terminal_nodes_key = None
+        # Passed on to the driver's and the environment's stats
+        self.__stats_info = stats_params if stats_params is not None else QubotStatsParameters()
+        self.__stats = Stats(str(self.__class__), self.__stats_info.max_events, self.__stats_info.spill_file)
 
-        self.__driver = Driver(self.__input_values, use_cache=self.__driver_info.use_cache)
-        self.__stats = Stats(str(self.__class__))
-
-        self.__stats.start_timer(Qubot.STAT_CONSTRUCT_UI_TREE_TIME)
-        self.__tree = self.__driver.construct_tree(self.__url_to_test, deep=True, max_urls_to_visit=self.__driver_info.max_urls)
-        self.__stats.stop_timer(Qubot.STAT_CONSTRUCT_UI_TREE_TIME)
+        if tree is not None:
+            # Reuse an already crawled tree instead of launching a browser
+            self.__driver: Optional[BaseDriver] = None
+            self.__tree = tree
+        else:
+            self.__construct_tree()
 
         self.__reward_func = reward_func
 
@@ -43,7 +54,13 @@ class Qubot:
             self.__model_info.gamma,
             self.__model_info.epsilon,
             self.__model_info.decay,
-            self.__model_info.step_limit
+            self.__model_info.step_limit,
+            self.__model_info.sparse_q_table,
+            self.__model_info.batch_episodes,
+            self.__model_info.convergence_tolerance,
+            self.__model_info.convergence_window,
+            self.__stats_info.max_events,
+            self.__stats_info.spill_file
         )
 
     def run(self):
@@ -55,8 +72,18 @@ class Qubot:
         self.__set_terminal_nodes(True)
 
         self.__stats.start_timer(Qubot.STAT_TRAINING_TIME)
-        self.__env.train(self.__model_info.train_episodes)
+        episode_count = self.__model_info.train_episodes
+        q_table_file = self.__model_info.q_table_file
+        if q_table_file is not None and os.path.exists(QLearningEnvironment.get_q_table_file(q_table_file)):
+            # Saved episodes only count for the part of the tree that survived
+            coverage = self.__env.load(q_table_file)
+            self.__stats.record(Qubot.STAT_WARM_START_COVERAGE, coverage)
+            episode_count = max(0, episode_count - int(round(self.__env.get_trained_episode_count() * coverage)))
+        self.__env.train(episode_count)
+        if q_table_file is not None:
+            self.__env.save(q_table_file)
         self.__stats.stop_timer(Qubot.STAT_TRAINING_TIME)
+        self.__stats.close()
 
         if verbose:
             self.__env.render()
@@ -67,6 +94,7 @@ class Qubot:
         self.__stats.start_timer(Qubot.STAT_TESTING_TIME)
         self.__env.test(self.__model_info.test_episodes)
         self.__stats.stop_timer(Qubot.STAT_TESTING_TIME)
+        self.__stats.close()
 
         if verbose:
             self.__env.render()
@@ -75,38 +103,105 @@ class Qubot:
         return self.__env
 
     def get_stats(self) -> Stats:
+        if self.__driver is None:
+            return self.__stats.merge(self.__env.get_stats())
         return self.__stats.merge(self.__driver.get_stats().merge(self.__env.get_stats()))
 
     def get_tree(self) -> UITree:
         return self.__tree
 
+    def sweep(self, model_params_grid: List[QubotConfigModelParameters], reward_funcs: List[QubotPresetRewardFunc] = None, processes: Optional[int] = None) -> List[SweepResult]:
+        """
+        Trains and tests every (model parameters, reward function) configuration on this Qubot's tree, in parallel
+        worker processes. The tree isn't re-crawled, and this Qubot's own environment is left untouched.
+        :param model_params_grid: The model parameters to try (see expand_model_params_grid).
+        :param reward_funcs: The reward functions to try with each of the model parameters, defaulting to this Qubot's.
+        :param processes: The number of worker processes, defaulting to the number of CPUs.
+        :return: One SweepResult per configuration.
+        """
+        reward_funcs = reward_funcs if reward_funcs is not None else [self.__reward_func]
+        return run_sweep(self.__url_to_test, self.__tree, self.__terminal_info_testing, self.__terminal_info_training, model_params_grid, reward_funcs, processes, self.__stats_info)
+
     def __set_terminal_nodes(self, is_training=False):
-        training_func = self.__tree.set_terminal_node if is_training else self.__tree.unset_terminal_node
-        testing_func = self.__tree.set_terminal_node if not is_training else self.__tree.unset_terminal_node
-        # Set for training
-        for terminal_html_id in self.__terminal_info_training.terminal_ids:
-            training_func(html_id=terminal_html_id)
-        for terminal_html_class in self.__terminal_info_training.terminal_classes:
-            training_func(html_class=terminal_html_class)
-        for terminal_contains_test in self.__terminal_info_training.terminal_contains_text:
-            training_func(contains_text=terminal_contains_test)
-        # Set for testing
-        for terminal_html_id in self.__terminal_info_testing.terminal_ids:
-            testing_func(html_id=terminal_html_id)
-        for terminal_html_class in self.__terminal_info_testing.terminal_classes:
-            testing_func(html_class=terminal_html_class)
-        for terminal_contains_test in self.__terminal_info_testing.terminal_contains_text:
-            testing_func(contains_text=terminal_contains_test)
+        training_nodes, testing_nodes = self.__get_terminal_nodes()
+        # Unset the other set first, so nodes terminal in both sets stay terminal
+        for node in (testing_nodes if is_training else training_nodes):
+            node.set_terminal(False)
+        for node in (training_nodes if is_training else testing_nodes):
+            node.set_terminal(True)
+
+    def __get_terminal_nodes(self) -> Tuple[List[UITreeNode], List[UITreeNode]]:
+        """
+        Resolves every training and testing terminal rule on the tree's metadata index, matching all of their texts in
+        one traversal. The nodes are kept until the tree changes, so switching between training and testing only
+        flips their terminal flags.
+        :return: The training and the testing terminal nodes.
+        """
+        key = (self.__tree, self.__tree.get_root().get_version())
+        if self.__terminal_nodes_key != key:
+            infos = [self.__terminal_info_training, self.__terminal_info_testing]
+            index = self.__tree.get_metadata_index([text for info in infos for text in info.terminal_contains_text])
+
+            def resolve(info: QubotConfigTerminalInfo) -> List[UITreeNode]:
+                nodes = {}
+                for html_id in info.terminal_ids:
+                    nodes.update((id(node), node) for node in index.find_nodes(html_id=html_id))
+                for html_class in info.terminal_classes:
+                    nodes.update((id(node), node) for node in index.find_nodes(html_class=html_class))
+                for contains_text in info.terminal_contains_text:
+                    nodes.update((id(node), node) for node in index.find_nodes(contains_text=contains_text))
+                return list(nodes.values())
+
+            self.__terminal_nodes = (resolve(self.__terminal_info_training), resolve(self.__terminal_info_testing))
+            self.__terminal_nodes_key = key
+        return self.__terminal_nodes
 
     def set_driver_config(self, driver_params: QubotDriverParameters = None, input_values: Dict[str, str] = None):
         self.__driver_info = driver_params if driver_params is not None else self.__driver_info
         self.__input_values = input_values if input_values is not None else self.__input_values
         if driver_params is not None or input_values is not None:
-            self.__stats.start_timer(Qubot.STAT_CONSTRUCT_UI_TREE_TIME)
-            self.__driver = Driver(self.__input_values, use_cache=self.__driver_info.use_cache)
-            self.__tree = self.__driver.construct_tree(self.__url_to_test, deep=True,
-                                                       max_urls_to_visit=self.__driver_info.max_urls)
-            self.__stats.stop_timer(Qubot.STAT_CONSTRUCT_UI_TREE_TIME)
+            self.__construct_tree()
+
+    def __construct_tree(self):
+        self.__tree, self.__driver = Qubot.construct_tree(self.__url_to_test, self.__driver_info, self.__input_values, self.__cancel_token, self.__stats, self.__stats_info)
+        self.__stats.close()
+
+    @staticmethod
+    def construct_tree(url_to_test: str, driver_params: QubotDriverParameters = None, input_values: Dict[str, str] = None, cancel_token: CancelToken = None, stats: Stats = None, stats_params: QubotStatsParameters = None) -> Tuple[UITree, BaseDriver]:
+        """
+        Crawls a tree the way a Qubot does, without setting up training on it.
+        :param url_to_test: The URL to crawl.
+        :param driver_params: The driver parameters, defaulting to QubotDriverParameters's defaults.
+        :param input_values: Values to fill inputs with, keyed by input type.
+        :param cancel_token: Token stopping the crawl from another thread or process.
+        :param stats: Receives the time the crawl took, if given.
+        :param stats_params: The retention and spilling of the driver's stats.
+        :return: The tree, and the driver that crawled it, holding the crawl stats.
+        """
+        driver_info = driver_params if driver_params is not None else QubotDriverParameters()
+        stats_info = stats_params if stats_params is not None else QubotStatsParameters()
+        readiness = PageReadiness(driver_info.ready_state_timeout, driver_info.network_idle_timeout, driver_info.dom_quiet_timeout)
+        # Backends are imported on use, so Selenium is only loaded by the backends driving a browser through it
+        if driver_info.backend == "async":
+            from qubot.driver.async_driver import AsyncDriver
+            driver = AsyncDriver(input_values, sessions=driver_info.workers, webdriver_url=driver_info.webdriver_url, action_timeout_s=driver_info.action_timeout, crawl_timeout_s=driver_info.crawl_timeout, max_retries=driver_info.max_retries, cancel_token=cancel_token, readiness=readiness, max_events=stats_info.max_events, spill_path=stats_info.spill_file)
+        elif driver_info.backend == "selenium":
+            from qubot.driver.driver import Driver
+            driver = Driver(input_values, use_cache=driver_info.use_cache, use_snapshot=driver_info.use_snapshot, pool_size=driver_info.pool_size, workers=driver_info.workers, action_timeout_s=driver_info.action_timeout, crawl_timeout_s=driver_info.crawl_timeout, max_retries=driver_info.max_retries, cancel_token=cancel_token, readiness=readiness, max_events=stats_info.max_events, spill_path=stats_info.spill_file)
+        elif driver_info.backend == "static":
+            from qubot.driver.static_html_driver import StaticHTMLDriver
+            driver = StaticHTMLDriver(max_events=stats_info.max_events, spill_path=stats_info.spill_file)
+        else:
+            raise Exception("'%s' is not a driver backend" % driver_info.backend)
+        previous_tree = UITree.from_file(driver_info.tree_file) if driver_info.tree_file else None
+        if stats is not None:
+            stats.start_timer(Qubot.STAT_CONSTRUCT_UI_TREE_TIME)
+        tree = driver.construct_tree(url_to_test, deep=True, max_urls_to_visit=driver_info.max_urls, previous_tree=previous_tree)
+        if stats is not None:
+            stats.stop_timer(Qubot.STAT_CONSTRUCT_UI_TREE_TIME)
+        if driver_info.tree_file:
+            tree.to_file(driver_info.tree_file)
+        return tree, driver
 
     def set_model_config(self, model_params: Optional[QubotConfigModelParameters] = None, reward_func: Optional[QubotPresetRewardFunc] = None):
         self.__model_info = model_params if model_params is not None else self.__model_info
@@ -119,7 +214,13 @@ class Qubot:
                 self.__model_info.gamma,
                 self.__model_info.epsilon,
                 self.__model_info.decay,
-                self.__model_info.step_limit
+                self.__model_info.step_limit,
+                self.__model_info.sparse_q_table,
+                self.__model_info.batch_episodes,
+                self.__model_info.convergence_tolerance,
+                self.__model_info.convergence_window,
+                self.__stats_info.max_events,
+                self.__stats_info.spill_file
             )
 
     @staticmethod
@@ -127,7 +228,22 @@ class Qubot:
         return Qubot.from_dict(read_json(file_path))
 
     @staticmethod
-    def from_dict(config: Dict):
+    def from_dict(config: Dict, tree: UITree = None):
+        """
+        Creates a Qubot from a parsed .qu file.
+        :param config: The parsed .qu file.
+        :param tree: An already crawled tree to train on, instead of crawling the configured URL.
+        :return: The Qubot.
+        """
+        return Qubot(**Qubot.args_from_dict(config), tree=tree)
+
+    @staticmethod
+    def args_from_dict(config: Dict) -> Dict:
+        """
+        Validates a parsed .qu file and converts it into the arguments of a Qubot, without crawling anything.
+        :param config: The parsed .qu file.
+        :return: The keyword arguments of Qubot, besides the tree and the cancel token.
+        """
         if "url" not in config:
             raise Exception(".qu file missing 'url'")
         if not isinstance(config["url"], str):
@@ -164,6 +280,18 @@ class Qubot:
             driver_parameters = QubotDriverParameters(
                 config["driver_parameters"]["use_cache"] if "use_cache" in config["driver_parameters"] else None,
                 config["driver_parameters"]["max_urls"] if "max_urls" in config["driver_parameters"] else None,
+                config["driver_parameters"]["use_snapshot"] if "use_snapshot" in config["driver_parameters"] else True,
+                config["driver_parameters"]["pool_size"] if "pool_size" in config["driver_parameters"] else 1,
+                config["driver_parameters"]["workers"] if "workers" in config["driver_parameters"] else 1,
+                config["driver_parameters"]["tree_file"] if "tree_file" in config["driver_parameters"] else None,
+                config["driver_parameters"]["backend"] if "backend" in config["driver_parameters"] else "selenium",
+                config["driver_parameters"]["webdriver_url"] if "webdriver_url" in config["driver_parameters"] else None,
+                config["driver_parameters"]["action_timeout"] if "action_timeout" in config["driver_parameters"] else 10,
+                config["driver_parameters"]["crawl_timeout"] if "crawl_timeout" in config["driver_parameters"] else None,
+                config["driver_parameters"]["max_retries"] if "max_retries" in config["driver_parameters"] else 2,
+                config["driver_parameters"]["ready_state_timeout"] if "ready_state_timeout" in config["driver_parameters"] else 10,
+                config["driver_parameters"]["network_idle_timeout"] if "network_idle_timeout" in config["driver_parameters"] else 5,
+                config["driver_parameters"]["dom_quiet_timeout"] if "dom_quiet_timeout" in config["driver_parameters"] else 5,
             )
 
         if "model_parameters" not in config:
@@ -177,14 +305,35 @@ class Qubot:
                 config["model_parameters"]["train_episodes"] if "train_episodes" in config["model_parameters"] else None,
                 config["model_parameters"]["test_episodes"] if "test_episodes" in config["model_parameters"] else None,
                 config["model_parameters"]["step_limit"] if "step_limit" in config["model_parameters"] else None,
+                config["model_parameters"]["sparse_q_table"] if "sparse_q_table" in config["model_parameters"] else False,
+                config["model_parameters"]["batch_episodes"] if "batch_episodes" in config["model_parameters"] else 1,
+                config["model_parameters"]["q_table_file"] if "q_table_file" in config["model_parameters"] else None,
+                config["model_parameters"]["convergence_tolerance"] if "convergence_tolerance" in config["model_parameters"] else None,
+                config["model_parameters"]["convergence_window"] if "convergence_window" in config["model_parameters"] else 10,
             )
         if "reward_func" not in config:
-            reward_func = None
+            reward_func = QubotPresetRewardFunc.ENCOURAGE_EXPLORATION
         elif isinstance(config["reward_func"], str) and config["reward_func"] in str_to_reward_func:
             reward_func = str_to_reward_func[config["reward_func"]]
         elif int(config["reward_func"]) in int_to_reward_func:
             reward_func = int_to_reward_func[int(config["reward_func"])]
         else:
-            reward_func = None
+            raise Exception("'reward_func' in .qu file must be the name or number of a preset reward function")
+        if "stats_parameters" not in config:
+            stats_parameters = None
+        else:
+            stats_parameters = QubotStatsParameters(
+                config["stats_parameters"]["max_events"] if "max_events" in config["stats_parameters"] else None,
+                config["stats_parameters"]["spill_file"] if "spill_file" in config["stats_parameters"] else None,
+            )
         input_values = config["input_values"] if "input_values" in config else None
-        return Qubot(url, terminal_info_testing, terminal_info_training, driver_parameters, model_parameters, reward_func, input_values)
+        return {
+            "url_to_test": url,
+            "terminal_info_testing": terminal_info_testing,
+            "terminal_info_training": terminal_info_training,
+            "driver_params": driver_parameters,
+            "model_params": model_parameters,
+            "reward_func": reward_func,
+            "input_values": input_values,
+            "stats_params": stats_parameters,
+        }
@@ -0,0 +1,152 @@
+import multiprocessing
+from itertools import product
+from typing import Dict, List, Optional, Tuple
+from sys import path
+import os
+from os.path import join, dirname
+path.append(join(dirname(__file__), os.pardir))
+
+from qubot.config.config import QubotConfigTerminalInfo, QubotConfigModelParameters, QubotStatsParameters
+from qubot.config.preset_rewards import QubotPresetRewardFunc, int_to_reward_func, str_to_reward_func
+from qubot.stats.stats import Stats
+from qubot.ui.ui_tree import UITree
+from qubot.utils.profiler import get_profiler
+
+# The sweep being run, set in the parent before the pool starts. Forked workers inherit it copy-on-write, so neither
+# the tree nor the reward functions are ever pickled.
+_sweep = None
+
+
+class SweepResult:
+    """
+    The stats of a single configuration of a sweep.
+    """
+
+    def __init__(self, model_params: QubotConfigModelParameters, reward_func: QubotPresetRewardFunc, stats: Stats):
+        self.model_params = model_params
+        self.reward_func = reward_func
+        self.stats = stats
+
+    def to_dict(self) -> Dict:
+        return {
+            "model_parameters": vars(self.model_params),
+            "reward_func": get_reward_func_name(self.reward_func),
+            "stats": self.stats.to_dict(),
+        }
+
+
+def run_sweep(url_to_test: str, tree: UITree, terminal_info_testing: QubotConfigTerminalInfo,
+              terminal_info_training: QubotConfigTerminalInfo, model_params_grid: List[QubotConfigModelParameters],
+              reward_funcs: List[QubotPresetRewardFunc], processes: Optional[int] = None,
+              stats_params: QubotStatsParameters = None) -> List[SweepResult]:
+    """
+    Trains and tests a Qubot for every (model parameters, reward function) pair, all on the same crawled tree.
+    :param url_to_test: The URL the tree was crawled from.
+    :param tree: The crawled tree, shared read-only by every configuration.
+    :param terminal_info_testing: The terminal info to test with.
+    :param terminal_info_training: The terminal info to train with.
+    :param model_params_grid: The model parameters to try.
+    :param reward_funcs: The reward functions to try with each of the model parameters.
+    :param processes: The number of worker processes, defaulting to the number of CPUs.
+    :param stats_params: How the stats of each configuration are kept.
+    :return: One SweepResult per configuration, in grid order (model parameters major).
+    """
+    global _sweep
+    configurations = list(product(model_params_grid, reward_funcs))
+    stats_params = stats_params if stats_params is not None else QubotStatsParameters()
+    _sweep = (url_to_test, tree, terminal_info_testing, terminal_info_training, configurations, stats_params)
+    try:
+        if "fork" in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context("fork").Pool(processes) as pool:
+                outcomes = pool.map(_run_configuration, range(len(configurations)))
+            # Workers profile if this process does, as they inherit its profiler
+            for _, profile in outcomes:
+                get_profiler().merge(profile)
+        else:
+            # Without fork the workers can't inherit the sweep, so run it in this process
+            outcomes = [_run_configuration(index, is_worker=False) for index in range(len(configurations))]
+    finally:
+        _sweep = None
+    stats_dicts = [stats for stats, _ in outcomes]
+
+    return [
+        SweepResult(model_params, reward_func, Stats.from_dict(str(SweepResult), stats, stats_params.max_events, stats_params.spill_file))
+        for (model_params, reward_func), stats in zip(configurations, stats_dicts)
+    ]
+
+
+def _run_configuration(index: int, is_worker=True) -> Tuple[Dict, Dict]:
+    """
+    Trains and tests a configuration of the sweep.
+    :return: The stats, and the timings profiled by the configuration if it ran in a worker process.
+    """
+    from qubot.config.qubot import Qubot
+    if is_worker:
+        # Forked workers start with a copy of the parent's timings, and are reused across configurations
+        get_profiler().reset()
+    url_to_test, tree, terminal_info_testing, terminal_info_training, configurations, stats_params = _sweep
+    model_params, reward_func = configurations[index]
+    qb = Qubot(url_to_test, terminal_info_testing, terminal_info_training, model_params=model_params,
+               reward_func=reward_func, tree=tree, stats_params=stats_params)
+    qb.train(verbose=False)
+    qb.test(verbose=False)
+    return qb.get_stats().to_dict(), get_profiler().to_dict() if is_worker else {}
+
+
+def expand_model_params_grid(base_params: QubotConfigModelParameters,
+                             grid: Dict[str, List]) -> List[QubotConfigModelParameters]:
+    """
+    Expands a grid of model parameter values into every combination of them.
+    :param base_params: The values of the parameters missing from the grid.
+    :param grid: Lists of values to try, keyed by QubotConfigModelParameters property name.
+    :return: The model parameters of every combination.
+    """
+    for name in grid:
+        if not hasattr(base_params, name):
+            raise Exception("'%s' is not a model parameter" % name)
+    names = list(grid.keys())
+    grid_params = []
+    for values in product(*[grid[name] for name in names]):
+        params = QubotConfigModelParameters(**vars(base_params))
+        for name, value in zip(names, values):
+            setattr(params, name, value)
+        grid_params.append(params)
+    return grid_params
+
+
+def get_reward_func(value) -> QubotPresetRewardFunc:
+    if isinstance(value, str) and value in str_to_reward_func:
+        return str_to_reward_func[value]
+    elif not isinstance(value, str) and int(value) in int_to_reward_func:
+        return int_to_reward_func[int(value)]
+    raise Exception("'%s' is not a preset reward function" % str(value))
+
+
+def get_reward_func_name(reward_func: QubotPresetRewardFunc) -> str:
+    for name, preset_reward_func in str_to_reward_func.items():
+        if preset_reward_func == reward_func:
+            return name
+    return getattr(reward_func, "__name__", str(reward_func))
+
+
+def sweep_grid_from_dict(config: Dict) -> Tuple[List[QubotConfigModelParameters], List[QubotPresetRewardFunc]]:
+    """
+    Reads the 'sweep' section of a .qu file.
+    :param config: The whole .qu configuration.
+    :return: The model parameters grid and the reward functions to sweep over.
+    """
+    if "sweep" not in config:
+        raise Exception(".qu file missing 'sweep'")
+    if not isinstance(config["sweep"], dict):
+        raise Exception("'sweep' in .qu file must be a dict")
+    base_params = QubotConfigModelParameters()
+    for name, value in (config["model_parameters"] if "model_parameters" in config else {}).items():
+        setattr(base_params, name, value)
+    grid = config["sweep"]["model_parameters"] if "model_parameters" in config["sweep"] else {}
+    if "reward_funcs" in config["sweep"]:
+        reward_funcs = [get_reward_func(value) for value in config["sweep"]["reward_funcs"]]
+    elif "reward_func" in config:
+        reward_funcs = [get_reward_func(config["reward_func"])]
+    else:
+        reward_funcs = [QubotPresetRewardFunc.ENCOURAGE_EXPLORATION]
+    return expand_model_params_grid(base_params, grid), reward_funcs
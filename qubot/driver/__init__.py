@@ -1 +1,12 @@
-from .driver import Driver
+from typing import TYPE_CHECKING
+
+# Driver is imported on first access (PEP 562), so the other backends can be used without loading Selenium
+def __getattr__(name: str):
+    if name == "Driver":
+        from .driver import Driver
+        globals()["Driver"] = Driver
+        return Driver
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+if TYPE_CHECKING:
+    from .driver import Driver
@@ -0,0 +1,340 @@
+from typing import Dict, List, Optional, Set, Tuple
+from subprocess import Popen, DEVNULL
+import asyncio
+import socket
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../../..'))
+
+from qubot.ui.ui_action import UIAction
+from qubot.ui.ui_tree import UITree, UITreeNode
+from qubot.ui.ui_snapshot import UIElementSnapshot, SNAPSHOT_SCRIPT, RESOLVE_SCRIPT
+from qubot.driver.base_driver import BaseDriver
+from qubot.driver.session_pool import CLEAR_STORAGE_SCRIPT
+from qubot.driver.page_readiness import PageReadiness
+from qubot.driver.crawl_frontier import CrawlFrontier, PreviousCrawl, get_known_action_url
+from qubot.driver.geckodriver import install_geckodriver
+from qubot.driver.async_webdriver import AsyncWebDriverClient, AsyncWebDriverSession, is_element_reference
+from qubot.utils.errors import inline_try
+from qubot.utils.deadline import CancelToken, Deadline, DeadlineExecutor
+from qubot.utils.input_generation import generate_input
+from qubot.stats.stats import Stats
+
+class AsyncDriver(BaseDriver):
+    """
+    Crawls a website over the W3C WebDriver protocol with asyncio, keeping several browser sessions in flight at once.
+    While one session waits on a page load, the pages already scraped by the others are merged into the UITree. Pages
+    are always scraped as snapshots. Records the same stats as the Driver.
+    """
+
+    SERVER_START_TIMEOUT_S = 10
+
+    def __init__(self, input_values: Dict[str, str] = None, sessions: int = 4, webdriver_url: str = None, headless=True,
+                 action_timeout_s: Optional[float] = 10, crawl_timeout_s: Optional[float] = None, max_retries=2,
+                 cancel_token: CancelToken = None, readiness: PageReadiness = None, max_events: Optional[int] = None,
+                 spill_path: Optional[str] = None):
+        """
+        Initializes the driver. Browsers are only launched by construct_tree.
+        :param input_values: Values to type into inputs, keyed by input type.
+        :param sessions: The number of browser sessions to crawl with concurrently.
+        :param webdriver_url: The URL of a running WebDriver server that accepts several sessions. Defaults to launching
+        a local geckodriver per session, as geckodriver only drives one session at a time.
+        :param headless: Launch the browsers without a window?
+        :param action_timeout_s: Time budget of each attempt at a WebDriver step of a deep action, or None for no budget.
+        :param crawl_timeout_s: Time after which the crawl is stopped, or None for no limit.
+        :param max_retries: Number of times a failed step is retried, with exponential backoff.
+        :param cancel_token: Token stopping the crawl from another thread or process.
+        :param readiness: Decides when a loaded page is ready to be scraped. Defaults to PageReadiness's defaults.
+        :param max_events: The number of most recent events to keep per stat, or None to keep all of them.
+        :param spill_path: A JSONL file to append every recorded event to, or None.
+        """
+        self.__input_values = input_values
+        self.__session_count = max(1, sessions)
+        self.__webdriver_url = webdriver_url
+        self.__headless = headless
+        self.__action_timeout_s = action_timeout_s
+        self.__crawl_timeout_s = crawl_timeout_s
+        self.__max_retries = max_retries
+        self.__cancel_token = cancel_token
+        self.__readiness = readiness if readiness is not None else PageReadiness()
+        self.__stats = Stats(str(self.__class__), max_events, spill_path)
+
+    def construct_tree(self, url: str = None, deep=True, max_urls_to_visit=10, previous_tree: UITree = None) -> UITree:
+        """
+        Crawls a website into a UITree.
+        :param url: The URL to start crawling from.
+        :param deep: Perform clicks and inputs to reach other pages?
+        :param max_urls_to_visit: Maximum number of URLs to crawl.
+        :param previous_tree: A tree from an earlier crawl of the website. The subtrees of elements that haven't changed,
+        and the elements of pages that haven't changed, are grafted from it up to their clicks and inputs, whose pages
+        are still loaded.
+        :return: The crawled tree.
+        """
+        return asyncio.run(self.construct_tree_async(url, deep, max_urls_to_visit, previous_tree))
+
+    async def construct_tree_async(self, url: str = None, deep=True, max_urls_to_visit=10, previous_tree: UITree = None) -> Optional[UITree]:
+        """
+        Same as construct_tree, from within a running event loop.
+        """
+        if not url:
+            return None
+        servers: List[Popen] = []
+        sessions: List[AsyncWebDriverSession] = []
+        try:
+            if self.__webdriver_url is not None:
+                server_urls = [self.__webdriver_url] * self.__session_count
+            else:
+                server_urls = await self.__launch_servers(servers)
+            created = await asyncio.gather(*[AsyncWebDriverSession.create(server_url, self.__headless)
+                                             for server_url in server_urls], return_exceptions=True)
+            sessions = [session for session in created if isinstance(session, AsyncWebDriverSession)]
+            if not sessions:
+                raise created[0]
+            for session in sessions:
+                await session.set_page_load_timeout(BaseDriver.PAGE_LOAD_TIMEOUT_S)
+            return await self.__crawl(sessions, url, deep, max_urls_to_visit, previous_tree)
+        finally:
+            await asyncio.gather(*[session.quit() for session in sessions], return_exceptions=True)
+            for server in servers:
+                inline_try(lambda: server.terminate())
+
+    def get_stats(self) -> Stats:
+        return self.__stats
+
+    async def __crawl(self, sessions: List[AsyncWebDriverSession], url: str, deep: bool, max_urls_to_visit: int,
+                      previous_tree: Optional[UITree]) -> UITree:
+        executor = DeadlineExecutor(self.__action_timeout_s, self.__max_retries,
+                                    deadline=Deadline(self.__crawl_timeout_s), cancel_token=self.__cancel_token)
+        idle_sessions = asyncio.Queue()
+        for session in sessions:
+            idle_sessions.put_nowait(session)
+        frontier = CrawlFrontier(max_urls_to_visit)
+        pending: Set[asyncio.Future] = set()
+
+        def expand(node: UITreeNode, elements: List[UIElementSnapshot], page_url: str):
+            for element in elements:
+                if frontier.claim_element(page_url, element.path, element.get_hash()):
+                    node.add_transition(element)
+            visit(node.get_transition_tuples(), page_url)
+
+        def visit(children: List[Tuple[UIAction, UITreeNode]], page_url: str):
+            """
+            Expands the children of a node that stay on its page, grafting the unchanged ones, and explores the others.
+            """
+            for action, child in children:
+                self.__stats.record(BaseDriver.STAT_ELEMENTS_ENCOUNTERED, child.get_description())
+                if not deep or action == UIAction.NAVIGATE:
+                    grafted = previous_crawl.graft(child, page_url) if previous_crawl is not None else None
+                    if grafted is None:
+                        expand(child, child.get_element().find_elements_by_xpath("./*"), page_url)
+                    else:
+                        self.__stats.record(BaseDriver.STAT_SUBTREES_GRAFTED, child.get_description())
+                        visit(grafted, page_url)
+                else:
+                    pending.add(asyncio.ensure_future(explore(action, child, page_url)))
+
+        async def explore(action: UIAction, node: UITreeNode, page_url: str):
+            if frontier.is_exhausted():
+                return
+            known_url = get_known_action_url(previous_tree, node, page_url)
+            if known_url is not None:
+                self.__stats.record(BaseDriver.STAT_ACTIONS_REUSED, node.get_description())
+                tree.set_action_url(page_url, node.get_hash(), known_url)
+                if not frontier.claim_url(known_url):
+                    return
+
+            def on_fail(e: Exception):
+                self.__stats.record(BaseDriver.STAT_CRASH_DETECTED, {
+                    "on_action": action.name,
+                    "element": node.get_description(),
+                    "error": str(e),
+                })
+
+            session = await idle_sessions.get()
+            try:
+                if known_url is None:
+                    sub_url = await executor.run_async(lambda: self.__perform_action(session, node, action, page_url), on_fail)
+                    tree.set_action_url(page_url, node.get_hash(), sub_url)
+                    if not frontier.claim_url(sub_url):
+                        return
+                else:
+                    sub_url = known_url
+                    await executor.run_async(lambda: self.__open(session, sub_url), on_fail)
+                sub_html_tag = await executor.run_async(lambda: AsyncDriver.__snapshot(session), on_fail)
+            except Exception:
+                # Failed attempts are recorded by on_fail
+                return
+            finally:
+                # The snapshot doesn't need the page anymore, so let another action use the session while it's merged
+                await self.__release(session, idle_sessions)
+
+            # Errors merging the page aren't action failures, so they stop the crawl (see the loop below)
+            self.__stats.record(BaseDriver.STAT_URLS_VISITED, sub_url)
+            tree.set_page_hash(sub_url, sub_html_tag.get_hash())
+            grafted = previous_crawl.graft_page(node, sub_url, sub_html_tag.get_hash()) if previous_crawl is not None else None
+            if grafted is None:
+                expand(node, sub_html_tag.find_elements_by_xpath("./*"), sub_url)
+            else:
+                self.__stats.record(BaseDriver.STAT_SUBTREES_GRAFTED, node.get_description())
+                visit(grafted, sub_url)
+
+        session = await idle_sessions.get()
+        await self.__open(session, url)
+        html_tag = await AsyncDriver.__snapshot(session)
+        root_url = await session.get_current_url()
+        idle_sessions.put_nowait(session)
+
+        root = UITreeNode(html_tag)
+        tree = UITree(root)
+        if not frontier.claim_url(root_url):
+            # Without budget for the start page, only the start page is scraped
+            deep = False
+        tree.set_page_hash(root_url, root.get_hash())
+        self.__stats.record(BaseDriver.STAT_ELEMENTS_ENCOUNTERED, root.get_description())
+        previous_crawl = PreviousCrawl(previous_tree, root_url) if previous_tree is not None else None
+        grafted = previous_crawl.graft(root, root_url) if previous_crawl is not None else None
+        if grafted is None:
+            expand(root, html_tag.find_elements_by_xpath("./*"), root_url)
+        else:
+            self.__stats.record(BaseDriver.STAT_SUBTREES_GRAFTED, root.get_description())
+            visit(grafted, root_url)
+
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=0.1, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            error = next((task.exception() for task in done if not task.cancelled() and task.exception() is not None), None)
+            if error is not None or executor.is_stopped():
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                if error is not None:
+                    raise error
+                break
+
+        return tree
+
+    async def __perform_action(self, session: AsyncWebDriverSession, node: UITreeNode, action: UIAction, page_url: str) -> str:
+        """
+        Opens a page and performs a deep action on it.
+        :return: The URL the action led to.
+        """
+        await self.__open(session, page_url)
+        if action == UIAction.LEFT_CLICK:
+            await self.__perform(session, node, action)
+            self.__stats.record(BaseDriver.STAT_ELEMENTS_LEFT_CLICKED, node.get_description())
+        elif action == UIAction.INPUT:
+            await self.__perform(session, node, action)
+            self.__stats.record(BaseDriver.STAT_ELEMENTS_INPUTTED, node.get_description())
+        else:
+            self.__stats.record(BaseDriver.STAT_ELEMENTS_NAVIGATED, node.get_description())
+        return await session.get_current_url()
+
+    async def __perform(self, session: AsyncWebDriverSession, node: UITreeNode, action: UIAction):
+        """
+        Clicks or types into the element of a node on the page a session is displaying. The element is looked up by
+        hash in a fresh snapshot, in case the page has moved it.
+        """
+        page = await AsyncDriver.__snapshot(session)
+        element = AsyncDriver.__find_element_by_hash(page, node.get_hash())
+        if element is None:
+            return
+        reference = await session.execute_script(RESOLVE_SCRIPT, list(element.path))
+        if not is_element_reference(reference):
+            return
+        if action == UIAction.LEFT_CLICK:
+            error = await AsyncDriver.__try(session.click(reference))
+        else:
+            error = await AsyncDriver.__try(session.send_keys(reference, generate_input(node.get_element(), self.__input_values)))
+        if error:
+            self.__stats.record(BaseDriver.STAT_CRASH_DETECTED, {
+                "on_action": action.name,
+                "element": node.get_description()
+            })
+        await self.__wait_until_ready(session)
+
+    async def __open(self, session: AsyncWebDriverSession, url: str):
+        await session.get(url)
+        await self.__wait_until_ready(session)
+
+    async def __wait_until_ready(self, session: AsyncWebDriverSession):
+        """
+        Waits until the page a session is displaying is ready to be scraped, recording the signals that timed out.
+        """
+        timed_out = await self.__readiness.wait_async(session)
+        if timed_out:
+            self.__stats.record(BaseDriver.STAT_PAGES_NOT_READY, {
+                "url": await session.get_current_url(),
+                "signals": timed_out,
+            })
+
+    async def __launch_servers(self, servers: List[Popen]) -> List[str]:
+        """
+        Launches a local geckodriver per session and waits until they all accept connections.
+        :param servers: Receives the launched processes, so they can be stopped even if one fails to start.
+        :return: The URL of each server.
+        """
+        install_geckodriver()
+        server_urls = []
+        for _ in range(self.__session_count):
+            port = AsyncDriver.__get_free_port()
+            servers.append(Popen(["geckodriver", "--port", str(port)], stdout=DEVNULL, stderr=DEVNULL))
+            server_urls.append("http://127.0.0.1:%d" % port)
+        await asyncio.gather(*[AsyncDriver.__wait_until_server_ready(server_url) for server_url in server_urls])
+        return server_urls
+
+    @staticmethod
+    async def __wait_until_server_ready(server_url: str):
+        client = AsyncWebDriverClient(server_url)
+        deadline = asyncio.get_running_loop().time() + AsyncDriver.SERVER_START_TIMEOUT_S
+        try:
+            while True:
+                try:
+                    status = await client.request("GET", "/status")
+                    if not isinstance(status, dict) or status.get("ready", True):
+                        return
+                except OSError:
+                    await client.close()
+                if asyncio.get_running_loop().time() > deadline:
+                    raise Exception("WebDriver server at %s did not start" % server_url)
+                await asyncio.sleep(0.1)
+        finally:
+            await client.close()
+
+    @staticmethod
+    async def __snapshot(session: AsyncWebDriverSession) -> UIElementSnapshot:
+        return UIElementSnapshot.from_list(await session.execute_script(SNAPSHOT_SCRIPT))
+
+    @staticmethod
+    async def __release(session: AsyncWebDriverSession, idle_sessions: asyncio.Queue):
+        # Clear the storage of the page's origin, so the next action doesn't carry state over
+        await AsyncDriver.__try(session.execute_script(CLEAR_STORAGE_SCRIPT))
+        await AsyncDriver.__try(session.delete_all_cookies())
+        idle_sessions.put_nowait(session)
+
+    @staticmethod
+    async def __try(command) -> Optional[Exception]:
+        """
+        Awaits a command without throwing an error, like inline_try.
+        :return: None if no exception is thrown or the Exception object thrown.
+        """
+        try:
+            await command
+            return None
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def __find_element_by_hash(root: UIElementSnapshot, element_hash: str) -> Optional[UIElementSnapshot]:
+        stack = [root]
+        while stack:
+            element = stack.pop()
+            if element.get_hash() == element_hash:
+                return element
+            stack.extend(reversed(element.get_element_children()))
+        return None
+
+    @staticmethod
+    def __get_free_port() -> int:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            probe.bind(("127.0.0.1", 0))
+            return probe.getsockname()[1]
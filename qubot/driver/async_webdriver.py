@@ -0,0 +1,197 @@
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import json
+import socket
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../../..'))
+
+from qubot.utils.profiler import get_profiler
+
+# The key under which the W3C WebDriver protocol returns element references
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+
+
+class WebDriverError(Exception):
+    """
+    An error returned by a WebDriver server.
+    """
+
+    def __init__(self, error: str, message: str = ""):
+        super().__init__("%s: %s" % (error, message))
+        self.error = error
+
+
+class AsyncWebDriverClient:
+    """
+    A minimal asyncio HTTP/1.1 client for the JSON endpoints of a W3C WebDriver server. Keeps a single connection alive,
+    so commands sent through one client are serialized; use a client per session to keep several in flight.
+    """
+
+    def __init__(self, server_url: str):
+        """
+        Initializes the client. The connection is opened lazily.
+        :param server_url: The URL of the WebDriver server, e.g. http://127.0.0.1:4444.
+        """
+        parsed = urlparse(server_url)
+        self.__host = parsed.hostname or "127.0.0.1"
+        self.__port = parsed.port or 80
+        self.__base_path = parsed.path.rstrip("/")
+        self.__reader: Optional[asyncio.StreamReader] = None
+        self.__writer: Optional[asyncio.StreamWriter] = None
+        self.__lock = asyncio.Lock()
+
+    async def request(self, method: str, endpoint: str, body: Optional[Dict] = None):
+        """
+        Sends a command to the server.
+        :param method: The HTTP method.
+        :param endpoint: The endpoint, relative to the server URL, e.g. /session.
+        :param body: The JSON body of the command, if any.
+        :return: The "value" of the response.
+        """
+        payload = json.dumps(body).encode('utf-8') if body is not None else b""
+        async with self.__lock:
+            try:
+                try:
+                    status, response = await self.__send(method, endpoint, payload)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # The server closed the kept-alive connection, so retry once on a new one
+                    await self.close()
+                    status, response = await self.__send(method, endpoint, payload)
+            except BaseException:
+                # A cancelled or failed command leaves its response unread, so the connection can't be reused
+                self.__discard()
+                raise
+
+        value = json.loads(response.decode('utf-8'))["value"] if response else None
+        if status >= 400 or (isinstance(value, dict) and "error" in value):
+            if isinstance(value, dict) and "error" in value:
+                raise WebDriverError(value["error"], value.get("message", ""))
+            raise WebDriverError("http error %d" % status)
+        return value
+
+    async def close(self):
+        if self.__writer is not None:
+            self.__writer.close()
+            try:
+                await self.__writer.wait_closed()
+            except Exception:
+                pass
+        self.__reader, self.__writer = None, None
+
+    def __discard(self):
+        if self.__writer is not None:
+            self.__writer.close()
+        self.__reader, self.__writer = None, None
+
+    async def __send(self, method: str, endpoint: str, payload: bytes) -> Tuple[int, bytes]:
+        if self.__writer is None:
+            self.__reader, self.__writer = await asyncio.open_connection(self.__host, self.__port)
+            # Commands are small and latency-bound, so don't let Nagle's algorithm hold them back
+            self.__writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        request_head = "%s %s%s HTTP/1.1\r\nHost: %s:%d\r\nAccept: application/json\r\n" \
+                       "Content-Type: application/json; charset=utf-8\r\nContent-Length: %d\r\n\r\n" % (
+                           method, self.__base_path, endpoint, self.__host, self.__port, len(payload))
+        self.__writer.write(request_head.encode('latin-1') + payload)
+        await self.__writer.drain()
+
+        status_line = await self.__reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.__reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.__reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await self.__reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            response = b"".join(chunks)
+        elif "content-length" in headers:
+            response = await self.__reader.readexactly(int(headers["content-length"]))
+        else:
+            response = await self.__reader.read()
+            headers["connection"] = "close"
+
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, response
+
+
+class AsyncWebDriverSession:
+    """
+    A browser session on a W3C WebDriver server (geckodriver or any server implementing the protocol), driven through
+    its own AsyncWebDriverClient.
+    """
+
+    def __init__(self, client: AsyncWebDriverClient, session_id: str):
+        self.__client = client
+        self.__session_id = session_id
+
+    @staticmethod
+    async def create(server_url: str, headless: bool = True) -> 'AsyncWebDriverSession':
+        """
+        Starts a new Firefox session.
+        :param server_url: The URL of the WebDriver server.
+        :param headless: Launch the browser without a window?
+        :return: The session.
+        """
+        client = AsyncWebDriverClient(server_url)
+        capabilities = {"browserName": "firefox"}
+        if headless:
+            capabilities["moz:firefoxOptions"] = {"args": ["-headless"]}
+        with get_profiler().time("webdriver.newSession"):
+            value = await client.request("POST", "/session", {"capabilities": {"alwaysMatch": capabilities}})
+        return AsyncWebDriverSession(client, value["sessionId"])
+
+    async def get(self, url: str):
+        await self.__command("get", "POST", "/url", {"url": url})
+
+    async def get_current_url(self) -> str:
+        return await self.__command("getCurrentUrl", "GET", "/url")
+
+    async def execute_script(self, script: str, *args):
+        return await self.__command("executeScript", "POST", "/execute/sync", {"script": script, "args": list(args)})
+
+    async def click(self, element: Dict[str, str]):
+        """
+        :param element: An element reference, as returned by execute_script.
+        """
+        await self.__command("clickElement", "POST", "/element/%s/click" % element[ELEMENT_KEY], {})
+
+    async def send_keys(self, element: Dict[str, str], text: str):
+        await self.__command("sendKeysToElement", "POST", "/element/%s/value" % element[ELEMENT_KEY], {"text": text})
+
+    async def set_page_load_timeout(self, seconds: float):
+        await self.__command("setTimeouts", "POST", "/timeouts", {"pageLoad": int(seconds * 1000)})
+
+    async def delete_all_cookies(self):
+        await self.__command("deleteAllCookies", "DELETE", "/cookie")
+
+    async def quit(self):
+        try:
+            with get_profiler().time("webdriver.quit"):
+                await self.__client.request("DELETE", "/session/%s" % self.__session_id)
+        finally:
+            await self.__client.close()
+
+    async def __command(self, name: str, method: str, endpoint: str, body: Optional[Dict] = None):
+        """
+        Sends a command of this session.
+        :param name: The name of the command in profiles, matching Selenium's command names.
+        """
+        with get_profiler().time("webdriver.%s" % name):
+            return await self.__client.request(method, "/session/%s%s" % (self.__session_id, endpoint), body)
+
+
+def is_element_reference(value) -> bool:
+    return isinstance(value, dict) and ELEMENT_KEY in value
+
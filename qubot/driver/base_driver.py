@@ -0,0 +1,41 @@
+from abc import ABC, abstractmethod
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../../..'))
+
+from qubot.ui.ui_tree import UITree
+from qubot.stats.stats import Stats
+
+class BaseDriver(ABC):
+    """
+    Crawls a website into a UITree. Qubot only depends on this interface, so crawling backends are interchangeable.
+    """
+
+    PAGE_LOAD_TIMEOUT_S = 10
+
+    STAT_URLS_VISITED = "urls_visited"
+    STAT_ELEMENTS_ENCOUNTERED = "elements_encountered"
+    STAT_ELEMENTS_NAVIGATED = "elements_navigated"
+    STAT_ELEMENTS_LEFT_CLICKED = "elements_left_clicked"
+    STAT_ELEMENTS_INPUTTED = "elements_inputted"
+    STAT_CRASH_DETECTED = "crash_detected"
+    STAT_CACHE_HITS = "cache_hits"
+    STAT_ACTIONS_REUSED = "actions_reused"
+    STAT_SUBTREES_GRAFTED = "subtrees_grafted"
+    STAT_PAGES_NOT_READY = "pages_not_ready"
+
+    @abstractmethod
+    def construct_tree(self, url: str = None, deep=True, max_urls_to_visit=10, previous_tree: UITree = None) -> UITree:
+        """
+        Crawls a website into a UITree.
+        :param url: The URL to start crawling from.
+        :param deep: Perform clicks and inputs to reach other pages?
+        :param max_urls_to_visit: Maximum number of URLs to crawl.
+        :param previous_tree: A tree from an earlier crawl of the website, whose actions may be reused.
+        :return: The crawled tree.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_stats(self) -> Stats:
+        raise NotImplementedError
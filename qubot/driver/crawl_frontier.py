@@ -0,0 +1,207 @@
+from typing import Dict, List, Tuple, Optional, Set
+from collections import deque
+from threading import Condition
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../../..'))
+
+from qubot.ui.ui_action import UIAction
+from qubot.ui.ui_tree import UITree, UITreeNode
+
+class CrawlTask:
+    """
+    A unit of exploration: load a URL, replay a path of actions on it, and attach the resulting page to a node. Paths
+    grow by one action each time an action changes the page without leaving its URL, e.g. by opening a menu.
+    """
+
+    def __init__(self, url: str, action_path: List[Tuple[UIAction, UITreeNode]]):
+        """
+        Initializes the task.
+        :param url: The URL to load before replaying the actions.
+        :param action_path: The actions to perform, in order, with the nodes to perform them on. The resulting page is
+        attached to the last node.
+        """
+        self.url = url
+        self.action_path = action_path
+
+    def get_node(self) -> UITreeNode:
+        return self.action_path[-1][1]
+
+    def extend(self, action: UIAction, node: UITreeNode) -> 'CrawlTask':
+        """
+        :return: A task replaying this task's actions, then performing an action on a node of the page they led to.
+        """
+        return CrawlTask(self.url, self.action_path + [(action, node)])
+
+
+class CrawlFrontier:
+    """
+    A thread-safe queue of CrawlTasks shared by the crawl workers. Also enforces the URL budget, and deduplicates the
+    page states and the elements explored across workers.
+    """
+
+    def __init__(self, max_urls_to_visit: int, visited_urls: Set[str] = None):
+        self.__max_urls_to_visit = max_urls_to_visit
+        self.__visited_urls = visited_urls if visited_urls is not None else set()
+        self.__seen_page_states: Set[Tuple[str, str]] = set()
+        self.__seen_elements: Set[Tuple[str, tuple, str]] = set()
+        self.__tasks = deque()
+        self.__in_flight = 0
+        self.__is_stopped = False
+        self.__condition = Condition()
+
+    def put(self, task: CrawlTask):
+        with self.__condition:
+            self.__tasks.append(task)
+            self.__condition.notify()
+
+    def get(self) -> Optional[CrawlTask]:
+        """
+        Blocks until a task is available.
+        :return: The next task, or None once the frontier is empty and no task is still being explored.
+        """
+        with self.__condition:
+            while not self.__tasks and self.__in_flight > 0 and not self.__is_stopped:
+                self.__condition.wait()
+            if not self.__tasks or self.__is_stopped:
+                return None
+            self.__in_flight += 1
+            return self.__tasks.popleft()
+
+    def task_done(self):
+        with self.__condition:
+            self.__in_flight -= 1
+            self.__condition.notify_all()
+
+    def stop(self):
+        with self.__condition:
+            self.__is_stopped = True
+            self.__tasks.clear()
+            self.__condition.notify_all()
+
+    def claim_url(self, url: str) -> bool:
+        """
+        Marks a URL as visited if it hasn't been yet and the budget allows it.
+        :param url: The URL to claim.
+        :return: True if the caller should explore the URL.
+        """
+        with self.__condition:
+            if url in self.__visited_urls or len(self.__visited_urls) >= self.__max_urls_to_visit:
+                return False
+            self.__visited_urls.add(url)
+            return True
+
+    def claim_page_state(self, url: str, page_hash: str) -> bool:
+        """
+        Marks a state of a page as explored. Actions that don't leave a page can still change it, into new states.
+        :param url: The URL of the page.
+        :param page_hash: The hash of the page's <html> element in that state.
+        :return: True if the caller should explore the state.
+        """
+        with self.__condition:
+            if (url, page_hash) in self.__seen_page_states:
+                return False
+            self.__seen_page_states.add((url, page_hash))
+            return True
+
+    def claim_element(self, url: str, element_path: tuple, element_hash: str) -> bool:
+        """
+        Marks an element of a page as in the tree. Elements are told apart by their position on the page, so identical
+        siblings are all kept, while the elements a new state of the page shares with earlier states aren't added again.
+        :param url: The URL of the page.
+        :param element_path: The index path of the element within the page.
+        :param element_hash: The hash of the element.
+        :return: True if the caller should add the element to the tree.
+        """
+        with self.__condition:
+            key = (url, element_path, element_hash)
+            if key in self.__seen_elements:
+                return False
+            self.__seen_elements.add(key)
+            return True
+
+    def is_exhausted(self) -> bool:
+        with self.__condition:
+            return len(self.__visited_urls) >= self.__max_urls_to_visit
+
+    def get_visited_urls(self) -> Set[str]:
+        return self.__visited_urls
+
+
+def get_known_action_url(previous_tree: Optional[UITree], node: UITreeNode, page_url: str) -> Optional[str]:
+    """
+    Looks up where a deep action led during a previous crawl. The action is assumed to still lead there if the element
+    acted on is unchanged, even if other parts of its page changed.
+    :param previous_tree: The tree of the previous crawl, if any.
+    :param node: The node to perform the action on.
+    :param page_url: The URL of the page the node is on.
+    :return: The URL the action led to, or None if the action has to be performed.
+    """
+    if previous_tree is None:
+        return None
+    return previous_tree.get_action_url(page_url, node.get_hash())
+
+
+class PreviousCrawl:
+    """
+    The tree of an earlier crawl, indexed by page and node hash, so the parts of pages that haven't changed since can be
+    grafted into a new tree instead of being explored again. A subtree is unchanged if the element at its root hashes
+    the same, on the same page. Grafts stop at clicks and inputs: the pages they lead to are still loaded, as they may
+    have changed even if the elements leading to them haven't, and their elements are only grafted if their page
+    hashes the same as during the earlier crawl.
+    """
+
+    GRAFT_STOP_ACTIONS = (UIAction.LEFT_CLICK, UIAction.INPUT)
+
+    def __init__(self, previous_tree: UITree, root_url: str):
+        """
+        Indexes a tree.
+        :param previous_tree: The tree of the earlier crawl.
+        :param root_url: The URL the earlier crawl started from.
+        """
+        self.__tree = previous_tree
+        self.__page_nodes: Dict[str, Dict[str, UITreeNode]] = {}
+        # Node whose children are the elements of each page
+        self.__page_roots: Dict[str, UITreeNode] = {root_url: previous_tree.get_root()}
+        stack = [(previous_tree.get_root(), root_url)]
+        while stack:
+            node, page_url = stack.pop()
+            self.__page_nodes.setdefault(page_url, {}).setdefault(node.get_hash(), node)
+            children = node.get_children()
+            if children:
+                action_url = previous_tree.get_action_url(page_url, node.get_hash())
+                # Actions staying on their page lead to other states of it, rather than to its elements
+                if action_url is not None and action_url != page_url:
+                    self.__page_roots.setdefault(action_url, node)
+                stack.extend((child, action_url or page_url) for child in reversed(children))
+
+    def graft(self, node: UITreeNode, page_url: str) -> Optional[List[Tuple[UIAction, UITreeNode]]]:
+        """
+        Grafts the descendants an element had during the earlier crawl under its node, if the element is unchanged.
+        :param node: A node of the tree being crawled, without children yet, whose children are its element's children.
+        :param page_url: The URL of the page the node is on.
+        :return: The grafted clicks and inputs, left for the caller to explore, or None if nothing was grafted and the
+        node should be explored.
+        """
+        previous_node = self.__page_nodes.get(page_url, {}).get(node.get_hash())
+        if previous_node is None or not previous_node.get_children() \
+                or self.__tree.get_action_url(page_url, node.get_hash()) is not None:
+            # Nodes the earlier crawl didn't get to explore, or whose children were the page an action led to, are
+            # explored now
+            return None
+        return node.graft(previous_node, PreviousCrawl.GRAFT_STOP_ACTIONS)
+
+    def graft_page(self, node: UITreeNode, page_url: str, page_hash: str) -> Optional[List[Tuple[UIAction, UITreeNode]]]:
+        """
+        Grafts the elements a page had during the earlier crawl under the node whose action loaded it, if the page is
+        unchanged.
+        :param node: A node of the tree being crawled, without children yet, whose action led to the page.
+        :param page_url: The URL of the page.
+        :param page_hash: The hash of the page's <html> element, as just loaded.
+        :return: The grafted clicks and inputs, left for the caller to explore, or None if nothing was grafted and the
+        page's elements should be added to the node.
+        """
+        previous_node = self.__page_roots.get(page_url)
+        if previous_node is None or not previous_node.get_children() or self.__tree.get_page_hash(page_url) != page_hash:
+            return None
+        return node.graft(previous_node, PreviousCrawl.GRAFT_STOP_ACTIONS)
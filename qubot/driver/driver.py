@@ -1,74 +1,171 @@
-from typing import Optional, Set, Dict
+from typing import Optional, Set, Dict, List, Tuple
+from threading import Thread, Lock
 from selenium import webdriver
 from selenium.webdriver import ActionChains
 from sys import path
 from os import getcwd
 from os.path import join, dirname
-import geckodriver_autoinstaller
-import timeout_decorator
 path.append(join(dirname(__file__), '../../..'))
 
 from qubot.ui.ui_action import UIAction
 from qubot.ui.ui_tree import UITree, UITreeNode
-from qubot.utils.errors import inline_try, try_again_on_fail
+from qubot.ui.ui_snapshot import UIElementSnapshot, snapshot_dom, parse_html
+from qubot.driver.session_pool import DriverSessionPool
+from qubot.driver.base_driver import BaseDriver
+from qubot.driver.page_readiness import PageReadiness
+from qubot.driver.crawl_frontier import CrawlFrontier, CrawlTask, PreviousCrawl, get_known_action_url
+from qubot.driver.geckodriver import install_geckodriver
+from qubot.utils.errors import inline_try
+from qubot.utils.deadline import CancelToken, Deadline, DeadlineExecutor
 from qubot.utils.input_generation import generate_input
-from qubot.utils.io import write_pickle, safe_filename
+from qubot.utils.io import read_pickle, write_pickle, safe_filename
+from qubot.utils.profiler import profile_web_driver
 from qubot.stats.stats import Stats
 
-class Driver:
+class Driver(BaseDriver):
+    """
+    Crawls a website with Selenium and Firefox.
+    """
 
     PKL_CACHE = ".driver_cache"
+    CACHE_VERSION = 4
 
-    STAT_URLS_VISITED = "urls_visited"
-    STAT_ELEMENTS_ENCOUNTERED = "elements_encountered"
-    STAT_ELEMENTS_NAVIGATED = "elements_navigated"
-    STAT_ELEMENTS_LEFT_CLICKED = "elements_left_clicked"
-    STAT_ELEMENTS_INPUTTED = "elements_inputted"
-    STAT_CRASH_DETECTED = "crash_detected"
+    # Longest sequence of actions replayed on a page to reach the states it changes into without leaving its URL
+    MAX_ACTION_PATH_LENGTH = 3
 
-    def __init__(self, input_values: Dict[str, str] = None, use_cache=True):
-        inline_try(lambda: geckodriver_autoinstaller.install())
-        self.__driver = webdriver.Firefox()
+    def __init__(self, input_values: Dict[str, str] = None, use_cache=True, use_snapshot=True, pool_size=1, workers=1,
+                 action_timeout_s: Optional[float] = 10, crawl_timeout_s: Optional[float] = None, max_retries=2,
+                 cancel_token: CancelToken = None, readiness: PageReadiness = None, max_events: Optional[int] = None,
+                 spill_path: Optional[str] = None):
+        """
+        Initializes the driver and launches its browser.
+        :param input_values: Values to type into inputs, keyed by input type.
+        :param use_cache: Reuse the tree cached by an earlier crawl if the site hasn't changed?
+        :param use_snapshot: Scrape each page in a single WebDriver call instead of querying every element?
+        :param pool_size: Maximum number of idle browser sessions reused across deep crawling actions.
+        :param workers: Number of headless browsers crawling in parallel.
+        :param action_timeout_s: Time budget of each attempt at a deep action, or None for no budget.
+        :param crawl_timeout_s: Time after which a crawl stops starting new actions, or None for no limit.
+        :param max_retries: Number of times a failed deep action is retried, with exponential backoff.
+        :param cancel_token: Token stopping the crawl from another thread or process.
+        :param readiness: Decides when a loaded page is ready to be scraped. Defaults to PageReadiness's defaults.
+        :param max_events: The number of most recent events to keep per stat, or None to keep all of them.
+        :param spill_path: A JSONL file to append every recorded event to, or None.
+        """
+        install_geckodriver()
+        self.__driver = profile_web_driver(webdriver.Firefox())
+        self.__owns_driver = True
+        self.__pool = DriverSessionPool(pool_size)
         self.__input_values = input_values
-        self.__stats = Stats(str(self.__class__))
+        self.__stats = Stats(str(self.__class__), max_events, spill_path)
+        self.__shared_stats = self.__stats
+        self.__readiness = readiness if readiness is not None else PageReadiness()
         self.__use_cache = use_cache
+        self.__use_snapshot = use_snapshot
+        self.__workers = workers
+        self.__action_timeout_s = action_timeout_s
+        self.__crawl_timeout_s = crawl_timeout_s
+        self.__max_retries = max_retries
+        self.__cancel_token = cancel_token
+        self.__executor = DeadlineExecutor(action_timeout_s, max_retries, cancel_token=cancel_token)
         self.__last_tree = None
         self.__did_visit = False
 
+    @staticmethod
+    def __from_session(parent: 'Driver', session: webdriver.Firefox) -> 'Driver':
+        """
+        Wraps a pooled browser session in a Driver without launching a new browser.
+        :param parent: The Driver whose settings and pool are shared.
+        :param session: The Selenium WebDriver session to wrap.
+        :return: A Driver that doesn't quit the session when it is destroyed.
+        """
+        driver = Driver.__new__(Driver)
+        driver.__driver = session
+        driver.__owns_driver = False
+        driver.__pool = parent.__pool
+        driver.__input_values = parent.__input_values
+        driver.__stats = Stats(str(Driver), parent.__stats.get_max_events(), parent.__stats.get_spill_path())
+        driver.__shared_stats = parent.__shared_stats
+        driver.__readiness = parent.__readiness
+        driver.__use_cache = False
+        driver.__use_snapshot = parent.__use_snapshot
+        driver.__workers = 1
+        driver.__action_timeout_s = parent.__action_timeout_s
+        driver.__crawl_timeout_s = parent.__crawl_timeout_s
+        driver.__max_retries = parent.__max_retries
+        driver.__cancel_token = parent.__cancel_token
+        driver.__executor = parent.__executor
+        driver.__last_tree = None
+        driver.__did_visit = False
+        return driver
+
     def open(self, url: str):
         self.__driver.get(url)
+        self.__wait_until_ready()
 
-    def construct_tree(self, url: str = None, deep=True, max_urls_to_visit=10) -> UITree:
+    def construct_tree(self, url: str = None, deep=True, max_urls_to_visit=10, previous_tree: UITree = None) -> UITree:
+        """
+        Crawls a website into a UITree.
+        :param url: The URL to start crawling from.
+        :param deep: Perform clicks and inputs to reach other pages?
+        :param max_urls_to_visit: Maximum number of URLs to crawl.
+        :param previous_tree: A tree from an earlier crawl of the website. The subtrees of elements that haven't changed,
+        and the elements of pages that haven't changed, are grafted from it up to their clicks and inputs, whose pages
+        are still loaded. Defaults to the cached tree when the cache is used but out of date.
+        :return: The crawled tree.
+        """
         if self.__did_visit:
-            self.__driver = webdriver.Firefox()
+            self.__driver = profile_web_driver(webdriver.Firefox())
             self.__did_visit = False
+        self.__executor = DeadlineExecutor(self.__action_timeout_s, self.__max_retries,
+                                           deadline=Deadline(self.__crawl_timeout_s), cancel_token=self.__cancel_token)
 
         visited_urls: Set[str] = set()
 
         def on_url_visit():
-            self.open(url)
+            if not self.__use_cache:
+                self.open(url)
             visited_urls.add(url)
-            self.__last_tree = self.__visit(visited_urls, deep=deep, max_urls_to_visit=max_urls_to_visit)
+            if self.__workers > 1:
+                self.__last_tree = self.__visit_parallel(visited_urls, deep=deep, max_urls_to_visit=max_urls_to_visit, previous_tree=previous_tree)
+            else:
+                self.__last_tree = self.__visit(visited_urls, deep=deep, max_urls_to_visit=max_urls_to_visit, previous_tree=previous_tree)
             if self.__use_cache:
-                write_pickle(join(getcwd(), Driver.PKL_CACHE, safe_filename(url)), {
-                    "stats": self.__stats,
-                    "last_tree": self.__last_tree
+                write_pickle(self.__get_cache_path(url), {
+                    "version": Driver.CACHE_VERSION,
+                    "url": url,
+                    "deep": deep,
+                    "max_urls_to_visit": max_urls_to_visit,
+                    "input_values": self.__input_values,
+                    "use_snapshot": self.__use_snapshot,
+                    "page_hashes": self.__last_tree.get_page_hashes(),
+                    "last_tree": self.__last_tree.to_dict(),
+                    "stats": self.__stats.to_dict(),
                 })
 
         if url:
             if self.__use_cache:
-                raise Exception("caching not yet implemented! sorry...")
-                # driver_from_pkl = read_pickle(join(getcwd(), Driver.PKL_CACHE, safe_filename(url)))
-                # print(driver_from_pkl)
-                # if driver_from_pkl:
-                #     self.stats = driver_from_pkl["stats"]
-                #     self.last_tree = driver_from_pkl["last_tree"]
-                # else:
-                #     on_url_visit()
+                self.open(url)
+                cached = read_pickle(self.__get_cache_path(url))
+                if cached and cached.get("version") == Driver.CACHE_VERSION and cached["deep"] == deep \
+                        and cached["max_urls_to_visit"] == max_urls_to_visit and cached["input_values"] == self.__input_values \
+                        and cached["use_snapshot"] == self.__use_snapshot and self.__is_cache_fresh(cached["page_hashes"]):
+                    self.__last_tree = UITree.from_dict(cached["last_tree"])
+                    # Keep what was recorded while checking the cache, e.g. the pages that weren't ready, and point the
+                    # session drivers to the same stats
+                    self.__stats = self.__shared_stats = self.__stats.merge(Stats.from_dict(
+                        str(self.__class__), cached["stats"], self.__stats.get_max_events(), self.__stats.get_spill_path()))
+                    self.__stats.increment(Driver.STAT_CACHE_HITS)
+                else:
+                    if previous_tree is None and cached and cached.get("version") == Driver.CACHE_VERSION:
+                        # The site changed since it was cached, so only re-explore what changed
+                        previous_tree = UITree.from_dict(cached["last_tree"])
+                    on_url_visit()
             else:
                 on_url_visit()
 
         self.__driver.quit()
+        self.__pool.close()
         self.__did_visit = True
 
         return self.__last_tree
@@ -76,75 +173,341 @@ class Driver:
     def get_stats(self) -> Stats:
         return self.__stats
 
-    def __visit(self, visited_urls: Set[str] = None, visited_nodes: Set[str] = None, deep=False, max_urls_to_visit=10) -> UITree:
+    def __visit(self, visited_urls: Set[str] = None, visited_nodes: Set[str] = None, deep=False, max_urls_to_visit=10, previous_tree: UITree = None) -> UITree:
         if not visited_urls:
             visited_urls = set()
         if not visited_nodes:
             visited_nodes = set()
 
         # Get root tag
-        html_tag = self.__driver.find_elements_by_tag_name("html")[0]
+        html_tag = self.__get_root_element()
         root = UITreeNode(html_tag)
         tree = UITree(root)
+        tree.set_page_hash(self.__driver.current_url, root.get_hash())
+        previous_crawl = PreviousCrawl(previous_tree, self.__driver.current_url) if previous_tree is not None else None
 
-        def visit_dfs(action: UIAction, node: UITreeNode, driver: Driver):
-            if len(visited_urls) > max_urls_to_visit:
+        def visit_dfs(action: UIAction, node: UITreeNode, page_url: str):
+            if len(visited_urls) > max_urls_to_visit or self.__executor.is_stopped():
                 return
 
-            self.__stats.record(Driver.STAT_ELEMENTS_ENCOUNTERED, str(node))
+            self.__stats.record(Driver.STAT_ELEMENTS_ENCOUNTERED, node.get_description())
 
             visited_nodes.add(node.get_id())
 
             if not deep or action == UIAction.NAVIGATE:
-                child_tags = node.get_element().find_elements_by_xpath("./*")
-                for child_tag in child_tags:
-                    node.add_transition(child_tag)
-                for act, child in node.get_transition_tuples():
+                grafted = previous_crawl.graft(node, page_url) if previous_crawl is not None else None
+                if grafted is None:
+                    node.add_element_children(node.get_element().find_elements_by_xpath("./*"), node.get_snapshot())
+                else:
+                    self.__stats.record(Driver.STAT_SUBTREES_GRAFTED, node.get_description())
+                for act, child in node.get_transition_tuples() if grafted is None else grafted:
                     if child.get_id() not in visited_nodes:
-                        visit_dfs(act, child, driver)
-            else:
-                @timeout_decorator.timeout(10, timeout_exception=StopIteration)
-                def visit_new_page():
-                    sub_driver = Driver()
-                    sub_driver.open(driver.__driver.current_url)
-
-                    if action == UIAction.LEFT_CLICK:
-                        sub_driver.__left_click(node)
-                        self.__stats.record(Driver.STAT_ELEMENTS_LEFT_CLICKED, str(node))
-                    elif action == UIAction.INPUT:
-                        sub_driver.__input(node)
-                        self.__stats.record(Driver.STAT_ELEMENTS_INPUTTED, str(node))
-                    else:
-                        self.__stats.record(Driver.STAT_ELEMENTS_NAVIGATED, str(node))
+                        visit_dfs(act, child, page_url)
+                return
 
-                    sub_html_tag = sub_driver.__driver.find_elements_by_tag_name("html")[0]
+            known_url = get_known_action_url(previous_tree, node, page_url)
+            if known_url is not None:
+                self.__stats.record(Driver.STAT_ACTIONS_REUSED, node.get_description())
+                tree.set_action_url(page_url, node.get_hash(), known_url)
+                if known_url in visited_urls or len(visited_urls) >= max_urls_to_visit:
+                    return
+
+            def perform_action():
+                """
+                Performs the action in a pooled session and scrapes the page it leads to, if that page is to be
+                explored. Runs within the action's time budget.
+                :return: The session, the URL of the page and its root element (None if it isn't to be explored).
+                """
+                session = self.__pool.acquire(page_url if known_url is None else known_url)
+                try:
+                    sub_driver = Driver.__from_session(self, session)
+                    sub_driver.__wait_until_ready()
+
+                    # Reused actions already have the page they lead to open
+                    if known_url is None:
+                        if action == UIAction.LEFT_CLICK:
+                            sub_driver.__left_click(node)
+                            self.__stats.record(Driver.STAT_ELEMENTS_LEFT_CLICKED, node.get_description())
+                        elif action == UIAction.INPUT:
+                            sub_driver.__input(node)
+                            self.__stats.record(Driver.STAT_ELEMENTS_INPUTTED, node.get_description())
+                        else:
+                            self.__stats.record(Driver.STAT_ELEMENTS_NAVIGATED, node.get_description())
+
+                    url = session.current_url
+                    if url in visited_urls or len(visited_urls) >= max_urls_to_visit:
+                        return session, url, None
+                    return session, url, sub_driver.__get_root_element()
+                except Exception:
+                    self.__pool.release(session)
+                    raise
+
+            def on_fail(e):
+                self.__stats.record(Driver.STAT_CRASH_DETECTED, {
+                    "on_action": action.name,
+                    "element": node.get_description(),
+                    "error": str(e),
+                })
 
-                    if sub_driver.__driver.current_url not in visited_urls and len(visited_urls) < max_urls_to_visit:
-                        self.__stats.record(Driver.STAT_URLS_VISITED, sub_driver.__driver.current_url)
-                        visited_urls.add(sub_driver.__driver.current_url)
+            try:
+                # Attempts abandoned for running over their budget still give their session back once they finish
+                session, sub_url, sub_html_tag = self.__executor.run(
+                    perform_action, on_fail, on_late_result=lambda result: self.__pool.release(result[0]))
+            except Exception:
+                return
 
-                        sub_child_tags = sub_html_tag.find_elements_by_xpath("./*")
-                        for sub_child_tag in sub_child_tags:
-                            node.add_transition(sub_child_tag)
-                        for sub_act, sub_child in node.get_transition_tuples():
-                            if sub_child.get_id() not in visited_nodes:
-                                visit_dfs(sub_act, sub_child, sub_driver)
+            is_released = False
+            try:
+                tree.set_action_url(page_url, node.get_hash(), sub_url)
+                if sub_html_tag is not None and sub_url not in visited_urls and len(visited_urls) < max_urls_to_visit:
+                    self.__stats.record(Driver.STAT_URLS_VISITED, sub_url)
+                    visited_urls.add(sub_url)
+
+                    # Live pages are parsed once here, and their nodes look their snapshots up in it
+                    sub_page = sub_html_tag if isinstance(sub_html_tag, UIElementSnapshot) else parse_html(sub_html_tag.get_attribute('outerHTML'))
+                    tree.set_page_hash(sub_url, sub_page.get_hash())
+                    if self.__use_snapshot:
+                        # Snapshots don't need the page anymore, so let the next action reuse the session
+                        self.__pool.release(session)
+                        is_released = True
+
+                    grafted = previous_crawl.graft_page(node, sub_url, sub_page.get_hash()) if previous_crawl is not None else None
+                    if grafted is None:
+                        node.add_element_children(sub_html_tag.find_elements_by_xpath("./*"), sub_page)
+                    else:
+                        self.__stats.record(Driver.STAT_SUBTREES_GRAFTED, node.get_description())
+                    for sub_act, sub_child in node.get_transition_tuples() if grafted is None else grafted:
+                        if sub_child.get_id() not in visited_nodes:
+                            visit_dfs(sub_act, sub_child, sub_url)
+            finally:
+                if not is_released:
+                    self.__pool.release(session)
 
-                    del sub_driver
+        inline_try(lambda: visit_dfs(UIAction.NAVIGATE, root, self.__driver.current_url))
 
-                def on_fail(e):
-                    self.__stats.record(Driver.STAT_CRASH_DETECTED, {
-                        "on_action": action.name,
-                        "element": str(node),
-                        "error": str(e),
-                    })
+        return tree
 
-                try_again_on_fail(visit_new_page, 5, 5, on_fail)
+    def __visit_parallel(self, visited_urls: Set[str], deep=False, max_urls_to_visit=10, previous_tree: UITree = None) -> UITree:
+        """
+        Crawls the current page with several headless browser workers taking CrawlTasks from a shared frontier. Pages
+        are always scraped as snapshots, so any worker can merge them into the tree. Actions that change a page without
+        leaving its URL are explored further by replaying them, up to MAX_ACTION_PATH_LENGTH actions deep.
+        """
+        frontier = CrawlFrontier(max_urls_to_visit, visited_urls)
+        pool = DriverSessionPool(self.__workers, headless=True)
+        tree_lock = Lock()
+
+        def expand(node: UITreeNode, elements: List[UIElementSnapshot], task: CrawlTask):
+            """
+            Adds the elements of a page to a node, and queues the deep actions on them.
+            :param task: The task whose actions reached the page, or a task without actions for a newly loaded page.
+            Must be called while holding the tree lock.
+            """
+            for element in elements:
+                if frontier.claim_element(task.url, element.path, element.get_hash()):
+                    node.add_transition(element)
+            visit(node.get_transition_tuples(), task)
+
+        def visit(children: List[Tuple[UIAction, UITreeNode]], task: CrawlTask):
+            """
+            Expands the children of a node that stay on its page, grafting the unchanged ones, and queues the others.
+            Must be called while holding the tree lock.
+            """
+            for action, child in children:
+                self.__stats.record(Driver.STAT_ELEMENTS_ENCOUNTERED, child.get_description())
+                if not deep or action == UIAction.NAVIGATE:
+                    grafted = previous_crawl.graft(child, task.url) if previous_crawl is not None else None
+                    if grafted is None:
+                        expand(child, child.get_element().find_elements_by_xpath("./*"), task)
+                    else:
+                        self.__stats.record(Driver.STAT_SUBTREES_GRAFTED, child.get_description())
+                        visit(grafted, task)
+                else:
+                    frontier.put(task.extend(action, child))
+
+        def explore(sub_driver: Driver, task: CrawlTask):
+            with tree_lock:
+                # Only single actions are recorded, as longer paths depend on the state the earlier actions left
+                is_recorded = len(task.action_path) == 1
+                known_url = get_known_action_url(previous_tree, task.get_node(), task.url) if is_recorded else None
+                if known_url == task.url:
+                    # The action stayed on its page, so it has to be replayed to reach the state it led to
+                    known_url = None
+                if known_url is not None:
+                    self.__stats.record(Driver.STAT_ACTIONS_REUSED, task.get_node().get_description())
+                    tree.set_action_url(task.url, task.get_node().get_hash(), known_url)
+            if known_url is not None:
+                if frontier.claim_url(known_url):
+                    sub_driver.open(known_url)
+                    explore_page(sub_driver, task, known_url)
+                return
 
-        inline_try(lambda: visit_dfs(UIAction.NAVIGATE, root, self))
+            sub_driver.open(task.url)
+            for action, node in task.action_path:
+                if action == UIAction.LEFT_CLICK:
+                    sub_driver.__left_click(node)
+                    stat_name = Driver.STAT_ELEMENTS_LEFT_CLICKED
+                elif action == UIAction.INPUT:
+                    sub_driver.__input(node)
+                    stat_name = Driver.STAT_ELEMENTS_INPUTTED
+                else:
+                    stat_name = Driver.STAT_ELEMENTS_NAVIGATED
+                with tree_lock:
+                    self.__stats.record(stat_name, node.get_description())
+
+            sub_url = sub_driver.__driver.current_url
+            if is_recorded:
+                with tree_lock:
+                    tree.set_action_url(task.url, task.get_node().get_hash(), sub_url)
+            if sub_url == task.url:
+                if len(task.action_path) < Driver.MAX_ACTION_PATH_LENGTH:
+                    explore_state(sub_driver, task)
+            elif frontier.claim_url(sub_url):
+                explore_page(sub_driver, task, sub_url)
+
+        def explore_page(sub_driver: Driver, task: CrawlTask, sub_url: str):
+            sub_html_tag = snapshot_dom(sub_driver.__driver)
+            with tree_lock:
+                self.__stats.record(Driver.STAT_URLS_VISITED, sub_url)
+                tree.set_page_hash(sub_url, sub_html_tag.get_hash())
+                frontier.claim_page_state(sub_url, sub_html_tag.get_hash())
+                grafted = previous_crawl.graft_page(task.get_node(), sub_url, sub_html_tag.get_hash()) if previous_crawl is not None else None
+                if grafted is None:
+                    expand(task.get_node(), sub_html_tag.find_elements_by_xpath("./*"), CrawlTask(sub_url, []))
+                else:
+                    self.__stats.record(Driver.STAT_SUBTREES_GRAFTED, task.get_node().get_description())
+                    visit(grafted, CrawlTask(sub_url, []))
+
+        def explore_state(sub_driver: Driver, task: CrawlTask):
+            """
+            Explores the state an action left its page in, if the action changed it. Actions on the elements it added
+            or changed replay the task's actions first.
+            """
+            sub_html_tag = snapshot_dom(sub_driver.__driver)
+            if frontier.claim_page_state(task.url, sub_html_tag.get_hash()):
+                with tree_lock:
+                    expand(task.get_node(), sub_html_tag.find_elements_by_xpath("./*"), task)
+
+        def work():
+            session = pool.acquire()
+            try:
+                # Workers own their sessions, so budget actions through the browser's timeouts rather than by
+                # abandoning them
+                session.set_page_load_timeout(min(Driver.PAGE_LOAD_TIMEOUT_S, self.__action_timeout_s or Driver.PAGE_LOAD_TIMEOUT_S))
+                sub_driver = Driver.__from_session(self, session)
+                sub_driver.__use_snapshot = True
+                while True:
+                    task = frontier.get()
+                    if task is None:
+                        break
+
+                    def on_fail(e):
+                        with tree_lock:
+                            self.__stats.record(Driver.STAT_CRASH_DETECTED, {
+                                "on_action": task.action_path[-1][0].name,
+                                "element": task.get_node().get_description(),
+                                "error": str(e),
+                            })
+
+                    try:
+                        if not frontier.is_exhausted():
+                            self.__executor.run(lambda: explore(sub_driver, task), on_fail, use_timeout=False)
+                    except Exception:
+                        pass
+                    finally:
+                        frontier.task_done()
+            finally:
+                pool.release(session)
+
+        html_tag = snapshot_dom(self.__driver)
+        root = UITreeNode(html_tag)
+        tree = UITree(root)
+        root_url = self.__driver.current_url
+        tree.set_page_hash(root_url, root.get_hash())
+        frontier.claim_page_state(root_url, root.get_hash())
+        self.__stats.record(Driver.STAT_ELEMENTS_ENCOUNTERED, root.get_description())
+        previous_crawl = PreviousCrawl(previous_tree, root_url) if previous_tree is not None else None
+        grafted = previous_crawl.graft(root, root_url) if previous_crawl is not None else None
+        if grafted is None:
+            expand(root, html_tag.find_elements_by_xpath("./*"), CrawlTask(root_url, []))
+        else:
+            self.__stats.record(Driver.STAT_SUBTREES_GRAFTED, root.get_description())
+            visit(grafted, CrawlTask(root_url, []))
+
+        workers = [Thread(target=work, daemon=True) for _ in range(self.__workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(0.1)
+                if self.__executor.is_stopped():
+                    # Let the workers finish their current task, but don't hand out new ones
+                    frontier.stop()
+        pool.close()
 
         return tree
 
+    def __is_cache_fresh(self, page_hashes: Dict[str, str]) -> bool:
+        """
+        Checks that every page of a cached crawl is unchanged, so a change to any page invalidates the cached tree. The
+        start page is checked on the current page, and the others are loaded in a pooled session.
+        :param page_hashes: The hash of each page of the cached crawl, keyed by URL.
+        :return: True if every page hashes the same as when it was cached.
+        """
+        # Parallel crawls always scrape snapshots
+        is_snapshot = self.__use_snapshot or self.__workers > 1
+        start_url = self.__driver.current_url
+        if page_hashes.get(start_url) != self.__get_page_hash(is_snapshot):
+            return False
+        for page_url, page_hash in page_hashes.items():
+            if page_url == start_url:
+                continue
+            session = self.__pool.acquire(page_url)
+            try:
+                sub_driver = Driver.__from_session(self, session)
+                sub_driver.__wait_until_ready()
+                # Redirects away from a page change it as much as new markup does
+                if session.current_url != page_url or sub_driver.__get_page_hash(is_snapshot) != page_hash:
+                    return False
+            except Exception:
+                return False
+            finally:
+                self.__pool.release(session)
+        return True
+
+    def __get_page_hash(self, is_snapshot: bool) -> str:
+        """
+        :param is_snapshot: Hash the page's snapshot, rather than its live markup?
+        :return: The hash of the current page's <html> element, as recorded by crawls.
+        """
+        if is_snapshot:
+            return snapshot_dom(self.__driver).get_hash()
+        return UITreeNode.get_element_hash(self.__driver.find_elements_by_tag_name("html")[0])
+
+    @staticmethod
+    def __get_cache_path(url: str) -> str:
+        return join(getcwd(), Driver.PKL_CACHE, safe_filename(url))
+
+    def __get_root_element(self):
+        """
+        Gets the <html> element of the current page, either as a detached snapshot scraped in one round-trip or as a
+        live element.
+        """
+        if self.__use_snapshot:
+            return snapshot_dom(self.__driver)
+        return self.__driver.find_elements_by_tag_name("html")[0]
+
+    def __get_live_element(self, node: UITreeNode):
+        """
+        Gets the live element for a node, resolving it lazily if the node was built from a snapshot.
+        :param node: The node to get the element of.
+        :return: The live WebElement.
+        """
+        element = node.get_element()
+        if isinstance(element, UIElementSnapshot):
+            return element.resolve(self.__driver)
+        return element
+
     def __find_node_in_dom(self, node: UITreeNode) -> Optional[UITreeNode]:
         """
         Finds a node in the current DOM, in case the passed-in node has had its window displaced.
@@ -158,24 +521,40 @@ class Driver:
     def __left_click(self, node: UITreeNode):
         node_in_dom = self.__find_node_in_dom(node)
         if node_in_dom:
-            if inline_try(lambda: ActionChains(self.__driver).click(node_in_dom.get_element()).perform()):
+            if inline_try(lambda: ActionChains(self.__driver).click(self.__get_live_element(node_in_dom)).perform()):
                 self.__stats.record(Driver.STAT_CRASH_DETECTED, {
                     "on_action": "LEFT_CLICK",
-                    "element": str(node_in_dom)
+                    "element": node_in_dom.get_description()
                 })
+            self.__wait_until_ready()
 
     def __input(self, node: UITreeNode):
         node_in_dom = self.__find_node_in_dom(node)
         value = generate_input(node.get_element(), self.__input_values)
         if node_in_dom:
-            if inline_try(lambda: ActionChains(self.__driver).send_keys(value).perform()):
+            if inline_try(lambda: ActionChains(self.__driver).send_keys_to_element(self.__get_live_element(node_in_dom), value).perform()):
                 self.__stats.record(Driver.STAT_CRASH_DETECTED, {
                     "on_action": "INPUT",
-                    "element": str(node_in_dom)
+                    "element": node_in_dom.get_description()
                 })
+            self.__wait_until_ready()
+
+    def __wait_until_ready(self):
+        """
+        Waits until the current page is ready to be scraped, recording the signals that timed out.
+        """
+        timed_out = self.__readiness.wait(self.__driver)
+        if timed_out:
+            # Session drivers record into the stats of the driver they were created from
+            self.__shared_stats.record(Driver.STAT_PAGES_NOT_READY, {
+                "url": self.__driver.current_url,
+                "signals": timed_out,
+            })
 
     def __del__(self):
         """
         Destroy the driver when the application quits.
         """
-        self.__driver.quit()
+        if self.__owns_driver:
+            inline_try(lambda: self.__driver.quit())
+            self.__pool.close()
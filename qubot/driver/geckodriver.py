@@ -0,0 +1,21 @@
+from threading import Lock
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../../..'))
+
+from qubot.utils.errors import inline_try
+
+_install_lock = Lock()
+_is_installed = False
+
+def install_geckodriver():
+    """
+    Makes sure a geckodriver matching the installed Firefox is on the PATH. Resolving it checks the Firefox version and
+    may download geckodriver, so it's only done once per process, by whichever driver needs it first.
+    """
+    global _is_installed
+    with _install_lock:
+        if not _is_installed:
+            import geckodriver_autoinstaller
+            inline_try(lambda: geckodriver_autoinstaller.install())
+            _is_installed = True
@@ -0,0 +1,162 @@
+from typing import List, Optional, Tuple
+from time import monotonic, sleep
+import asyncio
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../../..'))
+
+# Instruments the page once, counting fetch/XHR requests in flight and observing DOM mutations, then reports
+# [document.readyState, requests in flight, ms since the last network activity, ms since the last DOM mutation].
+# Activity from before the instrumentation is dated with the Resource and Navigation Timing APIs.
+READINESS_SCRIPT = """
+var w = window;
+if (!w.__qubotReadiness) {
+    var now = Date.now();
+    var lastResource = 0;
+    if (w.performance && w.performance.getEntriesByType) {
+        var resources = w.performance.getEntriesByType('resource');
+        for (var i = 0; i < resources.length; i++) {
+            lastResource = Math.max(lastResource, resources[i].responseEnd);
+        }
+        lastResource = lastResource ? (w.performance.timeOrigin || w.performance.timing.navigationStart) + lastResource : 0;
+    }
+    var loadEnd = w.performance && w.performance.timing ? w.performance.timing.loadEventEnd : 0;
+    var state = {pending: 0, lastNetwork: Math.max(lastResource, loadEnd) || now, lastMutation: loadEnd || now};
+    w.__qubotReadiness = state;
+    var onDone = function () {
+        state.pending = Math.max(0, state.pending - 1);
+        state.lastNetwork = Date.now();
+    };
+    if (w.fetch) {
+        var fetch = w.fetch;
+        w.fetch = function () {
+            state.pending++;
+            state.lastNetwork = Date.now();
+            return fetch.apply(this, arguments).then(
+                function (response) { onDone(); return response; },
+                function (error) { onDone(); throw error; }
+            );
+        };
+    }
+    if (w.XMLHttpRequest) {
+        var send = w.XMLHttpRequest.prototype.send;
+        w.XMLHttpRequest.prototype.send = function () {
+            state.pending++;
+            state.lastNetwork = Date.now();
+            this.addEventListener('loadend', onDone);
+            return send.apply(this, arguments);
+        };
+    }
+    if (w.MutationObserver && document.documentElement) {
+        new w.MutationObserver(function () { state.lastMutation = Date.now(); }).observe(
+            document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true}
+        );
+    }
+}
+var s = w.__qubotReadiness;
+var t = Date.now();
+return [document.readyState, s.pending, t - s.lastNetwork, t - s.lastMutation];
+"""
+
+
+class PageReadiness:
+    """
+    Waits until a page is ready to be scraped, based on concrete signals rather than fixed sleeps: the document has
+    loaded, no fetch/XHR requests have been in flight for a while, and the DOM has stopped changing. Each signal has its
+    own timeout, after which the page is scraped anyway.
+    """
+
+    SIGNAL_READY_STATE = "ready_state"
+    SIGNAL_NETWORK_IDLE = "network_idle"
+    SIGNAL_DOM_QUIET = "dom_quiet"
+
+    # Stands in for the status of a probe that failed, e.g. because the document was unloading after a click
+    __PROBE_FAILED = object()
+
+    def __init__(self, ready_state_timeout_s: Optional[float] = 10, network_idle_timeout_s: Optional[float] = 5,
+                 dom_quiet_timeout_s: Optional[float] = 5, network_idle_s: float = 0.5, dom_quiet_s: float = 0.25,
+                 poll_interval_s: float = 0.05):
+        """
+        Initializes the readiness engine.
+        :param ready_state_timeout_s: Maximum seconds to wait for document.readyState to be "complete", or None to not
+        wait for it.
+        :param network_idle_timeout_s: Maximum seconds to wait for the network to be idle, or None to not wait for it.
+        :param dom_quiet_timeout_s: Maximum seconds to wait for the DOM to stop changing, or None to not wait for it.
+        :param network_idle_s: Seconds without fetch/XHR activity for the network to count as idle.
+        :param dom_quiet_s: Seconds without DOM mutations for the DOM to count as quiet.
+        :param poll_interval_s: Seconds between checks of the signals.
+        """
+        self.__timeouts = {
+            PageReadiness.SIGNAL_READY_STATE: ready_state_timeout_s,
+            PageReadiness.SIGNAL_NETWORK_IDLE: network_idle_timeout_s,
+            PageReadiness.SIGNAL_DOM_QUIET: dom_quiet_timeout_s,
+        }
+        self.__network_idle_ms = network_idle_s * 1000
+        self.__dom_quiet_ms = dom_quiet_s * 1000
+        self.__poll_interval_s = poll_interval_s
+
+    def wait(self, web_driver) -> List[str]:
+        """
+        Blocks until the page displayed by a Selenium WebDriver is ready, or until all signals timed out. Failing to
+        probe the page counts as it not being ready yet.
+        :param web_driver: The WebDriver displaying the page.
+        :return: The signals that timed out.
+        """
+        start = monotonic()
+        # Always check twice, so mutations right after the instrumentation are seen
+        is_first_check = True
+        while True:
+            try:
+                status = web_driver.execute_script(READINESS_SCRIPT)
+            except Exception:
+                status = PageReadiness.__PROBE_FAILED
+            waiting, timed_out = self.__check(status, monotonic() - start)
+            if not waiting and not is_first_check:
+                return timed_out
+            is_first_check = False
+            sleep(self.__poll_interval_s)
+
+    async def wait_async(self, session) -> List[str]:
+        """
+        Same as wait, for an AsyncWebDriverSession.
+        """
+        start = monotonic()
+        is_first_check = True
+        while True:
+            try:
+                status = await session.execute_script(READINESS_SCRIPT)
+            except Exception:
+                status = PageReadiness.__PROBE_FAILED
+            waiting, timed_out = self.__check(status, monotonic() - start)
+            if not waiting and not is_first_check:
+                return timed_out
+            is_first_check = False
+            await asyncio.sleep(self.__poll_interval_s)
+
+    def __check(self, status, elapsed_s: float) -> Tuple[List[str], List[str]]:
+        """
+        :param status: The result of READINESS_SCRIPT, or __PROBE_FAILED.
+        :param elapsed_s: The number of seconds spent waiting so far.
+        :return: The signals still worth waiting for, and those that timed out.
+        """
+        if status is PageReadiness.__PROBE_FAILED:
+            is_met = {signal: False for signal in self.__timeouts}
+        elif not isinstance(status, list) or len(status) < 4:
+            # The page can't be instrumented (e.g. it isn't HTML), so there is nothing to wait for
+            return [], []
+        else:
+            ready_state, pending_requests, network_idle_ms, dom_quiet_ms = status[:4]
+            is_met = {
+                PageReadiness.SIGNAL_READY_STATE: ready_state == "complete",
+                PageReadiness.SIGNAL_NETWORK_IDLE: pending_requests == 0 and network_idle_ms >= self.__network_idle_ms,
+                PageReadiness.SIGNAL_DOM_QUIET: dom_quiet_ms >= self.__dom_quiet_ms,
+            }
+        waiting, timed_out = [], []
+        for signal, timeout_s in self.__timeouts.items():
+            if timeout_s is None or is_met[signal]:
+                continue
+            if elapsed_s >= timeout_s:
+                timed_out.append(signal)
+            else:
+                waiting.append(signal)
+        return waiting, timed_out
@@ -0,0 +1,97 @@
+from typing import List, TYPE_CHECKING
+from threading import Lock
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../../..'))
+
+from qubot.utils.errors import inline_try
+from qubot.utils.profiler import profile_web_driver
+
+if TYPE_CHECKING:
+    from selenium import webdriver
+
+# Clears the storage of the current origin, so a reused session doesn't carry state over from the last action
+CLEAR_STORAGE_SCRIPT = """
+try { window.localStorage.clear(); } catch (e) {}
+try { window.sessionStorage.clear(); } catch (e) {}
+"""
+
+class DriverSessionPool:
+    """
+    A pool of reusable Selenium browser sessions. Sessions are reset through navigation instead of being relaunched,
+    so deep crawls don't start a new browser for every action.
+    """
+
+    def __init__(self, size: int = 1, headless: bool = False):
+        """
+        Initializes the pool. Sessions are launched lazily.
+        :param size: Maximum number of idle sessions kept alive between actions.
+        :param headless: Launch the browsers without a window?
+        """
+        self.__size = max(size, 1)
+        self.__headless = headless
+        self.__idle: List['webdriver.Firefox'] = []
+        self.__lock = Lock()
+        self.__launch_count = 0
+
+    def acquire(self, url: str = None) -> 'webdriver.Firefox':
+        """
+        Takes an idle session from the pool, or launches a new one if none are idle.
+        :param url: URL to navigate the session to.
+        :return: The Selenium WebDriver session.
+        """
+        with self.__lock:
+            session = self.__idle.pop() if self.__idle else None
+        if session is None:
+            session = self.__launch()
+        if url:
+            session.get(url)
+        return session
+
+    def release(self, session: 'webdriver.Firefox'):
+        """
+        Resets a session and returns it to the pool, or quits it if the pool is already full.
+        :param session: The session to give back.
+        """
+        if inline_try(lambda: self.__reset(session)):
+            inline_try(lambda: session.quit())
+            return
+        with self.__lock:
+            if len(self.__idle) < self.__size:
+                self.__idle.append(session)
+                return
+        inline_try(lambda: session.quit())
+
+    def close(self):
+        """
+        Quits all idle sessions.
+        """
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+        for session in idle:
+            inline_try(lambda: session.quit())
+
+    def get_size(self) -> int:
+        return self.__size
+
+    def get_launch_count(self) -> int:
+        return self.__launch_count
+
+    def __launch(self) -> 'webdriver.Firefox':
+        # Selenium is only loaded once a browser is needed, which the async backend never does
+        from selenium import webdriver
+        options = webdriver.FirefoxOptions()
+        options.headless = self.__headless
+        session = profile_web_driver(webdriver.Firefox(options=options))
+        with self.__lock:
+            self.__launch_count += 1
+        return session
+
+    @staticmethod
+    def __reset(session: 'webdriver.Firefox'):
+        session.execute_script(CLEAR_STORAGE_SCRIPT)
+        session.delete_all_cookies()
+        session.get("about:blank")
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,187 @@
+from typing import List, Optional, Set, Tuple
+from urllib.parse import urljoin, urldefrag, urlparse
+from urllib.request import urlopen
+from pathlib import Path
+import posixpath
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../../..'))
+
+from qubot.ui.ui_action import UIAction
+from qubot.ui.ui_tree import UITree, UITreeNode
+from qubot.ui.ui_snapshot import UIElementSnapshot, parse_html
+from qubot.driver.base_driver import BaseDriver
+from qubot.driver.crawl_frontier import PreviousCrawl, get_known_action_url
+from qubot.stats.stats import Stats
+from qubot.utils.profiler import get_profiler
+
+class StaticHTMLDriver(BaseDriver):
+    """
+    Crawls static HTML without a browser, from files or from any HTTP server (e.g. a local http.server fixture). Pages
+    are parsed into snapshots with the standard library's HTML parser. Clicking a link navigates to its href; other
+    clicks and inputs are recorded but, without scripts, lead nowhere.
+    """
+
+    NON_NAVIGABLE_SCHEMES = ("javascript", "mailto", "tel", "data")
+
+    def __init__(self, same_origin_only=True, page_load_timeout_s: float = BaseDriver.PAGE_LOAD_TIMEOUT_S,
+                 max_events: Optional[int] = None, spill_path: Optional[str] = None):
+        """
+        Initializes the driver.
+        :param same_origin_only: Only follow links to the origin (or, for files, the directory tree) of the start URL?
+        :param page_load_timeout_s: Seconds to wait for each page to download.
+        :param max_events: The number of most recent events to keep per stat, or None to keep all of them.
+        :param spill_path: A JSONL file to append every recorded event to, or None.
+        """
+        self.__same_origin_only = same_origin_only
+        self.__page_load_timeout_s = page_load_timeout_s
+        self.__stats = Stats(str(self.__class__), max_events, spill_path)
+
+    def construct_tree(self, url: str = None, deep=True, max_urls_to_visit=10, previous_tree: UITree = None) -> Optional[UITree]:
+        """
+        Crawls a website into a UITree.
+        :param url: The URL or file path to start crawling from.
+        :param deep: Follow links to other pages?
+        :param max_urls_to_visit: Maximum number of URLs to crawl.
+        :param previous_tree: A tree from an earlier crawl of the website. The subtrees of unchanged elements, and the
+        elements of unchanged pages, are grafted from it up to their links, whose pages are still loaded.
+        :return: The crawled tree.
+        """
+        if not url:
+            return None
+        url = StaticHTMLDriver.to_url(url)
+        root_url, html_tag = self.__load(url)
+        root = UITreeNode(html_tag)
+        tree = UITree(root)
+        tree.set_page_hash(root_url, UITreeNode.get_element_hash(html_tag))
+        visited_urls: Set[str] = {url, root_url}
+        visited_nodes: Set[str] = set()
+        previous_crawl = PreviousCrawl(previous_tree, root_url) if previous_tree is not None else None
+
+        # Iterative depth-first search, in the order Driver visits nodes
+        stack: List[Tuple[UIAction, UITreeNode, str]] = [(UIAction.NAVIGATE, root, root_url)]
+        while stack:
+            action, node, page_url = stack.pop()
+            if len(visited_urls) > max_urls_to_visit:
+                break
+            if node.get_id() in visited_nodes:
+                continue
+            self.__stats.record(BaseDriver.STAT_ELEMENTS_ENCOUNTERED, node.get_description())
+            visited_nodes.add(node.get_id())
+
+            grafted = None
+            if not deep or action == UIAction.NAVIGATE:
+                grafted = previous_crawl.graft(node, page_url) if previous_crawl is not None else None
+                elements = node.get_element().find_elements_by_xpath("./*") if grafted is None else []
+            else:
+                sub_url = self.__perform(action, node, page_url, root_url, previous_tree)
+                tree.set_action_url(page_url, node.get_hash(), sub_url)
+                if sub_url is None or sub_url in visited_urls or len(visited_urls) >= max_urls_to_visit:
+                    continue
+                try:
+                    loaded_url, sub_html_tag = self.__load(sub_url)
+                except Exception as e:
+                    self.__stats.record(BaseDriver.STAT_CRASH_DETECTED, {
+                        "on_action": action.name,
+                        "element": node.get_description(),
+                        "error": str(e),
+                    })
+                    continue
+                visited_urls.add(sub_url)
+                # Redirects land on a page that may already have been visited
+                if loaded_url != sub_url:
+                    if loaded_url in visited_urls:
+                        continue
+                    visited_urls.add(loaded_url)
+                self.__stats.record(BaseDriver.STAT_URLS_VISITED, loaded_url)
+                page_hash = UITreeNode.get_element_hash(sub_html_tag)
+                tree.set_page_hash(loaded_url, page_hash)
+                grafted = previous_crawl.graft_page(node, loaded_url, page_hash) if previous_crawl is not None else None
+                elements = sub_html_tag.find_elements_by_xpath("./*") if grafted is None else []
+                page_url = loaded_url
+
+            if grafted is not None:
+                self.__stats.record(BaseDriver.STAT_SUBTREES_GRAFTED, node.get_description())
+            for element in elements:
+                node.add_transition(element)
+            for child_action, child in reversed(node.get_transition_tuples() if grafted is None else grafted):
+                if child.get_id() not in visited_nodes:
+                    stack.append((child_action, child, page_url))
+
+        return tree
+
+    def get_stats(self) -> Stats:
+        return self.__stats
+
+    def load_page(self, url: str) -> UIElementSnapshot:
+        """
+        :param url: The URL or file path of a page.
+        :return: The snapshot of the page's <html> element.
+        """
+        return self.__load(StaticHTMLDriver.to_url(url))[1]
+
+    @staticmethod
+    def to_url(location: str) -> str:
+        """
+        :param location: A URL or a path to a local file.
+        :return: The URL of the location.
+        """
+        if urlparse(location).scheme in ("http", "https", "file"):
+            return location
+        return Path(location).resolve().as_uri()
+
+    def __perform(self, action: UIAction, node: UITreeNode, page_url: str, start_url: str, previous_tree: Optional[UITree]) -> Optional[str]:
+        """
+        Simulates an action.
+        :param start_url: The URL the crawl started from, which bounds the links followed.
+        :return: The URL the action leads to, or the page's own URL if it doesn't navigate.
+        """
+        known_url = get_known_action_url(previous_tree, node, page_url)
+        if known_url is not None:
+            self.__stats.record(BaseDriver.STAT_ACTIONS_REUSED, node.get_description())
+            return known_url
+
+        if action == UIAction.INPUT:
+            self.__stats.record(BaseDriver.STAT_ELEMENTS_INPUTTED, node.get_description())
+            return page_url
+        if action != UIAction.LEFT_CLICK:
+            self.__stats.record(BaseDriver.STAT_ELEMENTS_NAVIGATED, node.get_description())
+            return page_url
+        self.__stats.record(BaseDriver.STAT_ELEMENTS_LEFT_CLICKED, node.get_description())
+
+        href = node.get_element().get_attribute("href") if node.get_tag_name() == "a" else None
+        if not href:
+            return page_url
+        target_url, _ = urldefrag(urljoin(page_url, href.strip()))
+        target = urlparse(target_url)
+        if target.scheme in StaticHTMLDriver.NON_NAVIGABLE_SCHEMES:
+            return page_url
+        if self.__same_origin_only and not StaticHTMLDriver.__is_in_scope(start_url, target_url):
+            return page_url
+        return target_url
+
+    @staticmethod
+    def __is_in_scope(start_url: str, target_url: str) -> bool:
+        """
+        :return: Is the target on the origin of the start URL or, for files, in the directory tree of the start file?
+        """
+        start, target = urlparse(start_url), urlparse(target_url)
+        if start.scheme == "file" or target.scheme == "file":
+            # urljoin already resolved the dot segments of the target's path
+            start_dir = posixpath.dirname(start.path).rstrip("/") + "/"
+            return start.scheme == target.scheme and start.netloc == target.netloc and target.path.startswith(start_dir)
+        return (start.scheme, start.netloc) == (target.scheme, target.netloc)
+
+    def __load(self, url: str) -> Tuple[str, UIElementSnapshot]:
+        """
+        Downloads and parses a page.
+        :param url: The URL of the page.
+        :return: The URL the page was loaded from, after redirects, and the snapshot of its <html> element.
+        """
+        with get_profiler().time("static.load"), urlopen(url, timeout=self.__page_load_timeout_s) as response:
+            content_type = response.headers.get_content_type() if response.headers else "text/html"
+            if content_type not in ("text/html", "application/xhtml+xml", "application/octet-stream", "text/plain"):
+                raise Exception("'%s' is not an HTML page (%s)" % (url, content_type))
+            charset = response.headers.get_content_charset() if response.headers else None
+            html = response.read().decode(charset or "utf-8", errors="replace")
+            return response.geturl(), parse_html(html)
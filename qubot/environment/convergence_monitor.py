@@ -0,0 +1,37 @@
+from collections import deque
+from numbers import Number
+
+
+class ConvergenceMonitor:
+    """
+    Decides when training has converged: the largest Q-value update of an episode and the change in the moving average
+    of episode rewards must both stay under a tolerance for a number of consecutive episodes.
+    """
+
+    def __init__(self, tolerance: float, window: int):
+        """
+        Initializes the monitor.
+        :param tolerance: The largest |ΔQ| and moving average change still considered converged.
+        :param window: The number of episodes averaged, and the number of consecutive converged episodes required.
+        """
+        self.__tolerance = tolerance
+        self.__window = max(1, window)
+        self.__rewards = deque(maxlen=self.__window)
+        self.__moving_average = None
+        self.__stable_count = 0
+
+    def update(self, max_delta_q: Number, episode_reward: Number) -> bool:
+        """
+        Adds an episode.
+        :param max_delta_q: The largest absolute change made to a Q-value during the episode.
+        :param episode_reward: The reward collected during the episode.
+        :return: True if training has converged.
+        """
+        self.__rewards.append(episode_reward)
+        moving_average = sum(self.__rewards) / len(self.__rewards)
+        is_full = len(self.__rewards) == self.__window
+        is_stable = is_full and self.__moving_average is not None and max_delta_q < self.__tolerance \
+            and abs(moving_average - self.__moving_average) < self.__tolerance
+        self.__moving_average = moving_average if is_full else None
+        self.__stable_count = self.__stable_count + 1 if is_stable else 0
+        return self.__stable_count >= self.__window
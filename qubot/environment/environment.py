@@ -1,5 +1,5 @@
 from random import choice
-from typing import Callable, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
 from gym import spaces, Env as GymEnvironment
 from sys import path
 from os.path import join, dirname
@@ -15,21 +15,20 @@ class Environment(GymEnvironment):
     STAT_STEP_COUNT = "step_count"
     STAT_REWARD_SUM = "reward_sum"
 
-    def __init__(self, tree: UITree, reward_func: Callable[[UIAction, UITreeNode], int], step_limit=1000):
+    def __init__(self, tree: UITree, reward_func: Callable[[UIAction, UITreeNode], int], step_limit=1000,
+                 max_events: Optional[int] = None, spill_path: Optional[str] = None):
         super().__init__()
         self._tree = tree
-        self.__reward_func = reward_func
+        self._reward_func = reward_func
 
         self._current_node = self._tree.get_root()
-        self._stats = Stats(str(self.__class__))
+        self._stats = Stats(str(self.__class__), max_events, spill_path)
         self._stats.empty_counter(Environment.STAT_STEP_COUNT)
-        self._stats.empty_events(Environment.STAT_REWARD_SUM)
+        self._stats.empty_counter(Environment.STAT_REWARD_SUM)
 
-        self._tree.hash_tree()
         self._step_limit = step_limit
+        # Transitions taken from each node, keyed by the hashes of the nodes, added as nodes are first left
         self.__history = {}
-        for node_hash in self._tree.get_hash():
-            self.__history[node_hash] = {}
 
         # Actions are an embedding of nodes
         self.action_space = spaces.Discrete(tree.get_node_count())
@@ -52,7 +51,7 @@ class Environment(GymEnvironment):
 
         # Record the next observation as an embedding
         if next_node is not None:
-            self.__record_transition_in_history(self._current_node, next_node, action)
+            self._record_transition_in_history(self._current_node, next_node, action)
             self._current_node = next_node
         obs = self.get_state_embedding()
 
@@ -93,8 +92,6 @@ class Environment(GymEnvironment):
         self._stats.empty_counter(Environment.STAT_STEP_COUNT)
         self._stats.empty_counter(Environment.STAT_REWARD_SUM)
         self.__history = {}
-        for node_hash in self._tree.get_hash():
-            self.__history[node_hash] = {}
         return self._current_node
 
     def render(self, mode='human', close=False):
@@ -104,21 +101,45 @@ class Environment(GymEnvironment):
     def __get_reward(self, action: UIAction, node: UITreeNode):
         if action is None or node is None:
             return 0
-        return self.__reward_func(action, node)
+        return self._reward_func(action, node)
 
-    def __record_transition_in_history(self, from_node: UITreeNode, to_node: UITreeNode, action: UIAction):
+    def _record_transition_in_history(self, from_node: UITreeNode, to_node: UITreeNode, action: UIAction, count=1):
+        self.__history.setdefault(from_node.get_hash(), {})
         if to_node.get_hash() not in self.__history[from_node.get_hash()]:
-            self.__history[from_node.get_hash()][to_node.get_hash()] = [1, action, to_node]
+            self.__history[from_node.get_hash()][to_node.get_hash()] = [count, action, to_node]
         else:
-            self.__history[from_node.get_hash()][to_node.get_hash()][0] += 1
+            self.__history[from_node.get_hash()][to_node.get_hash()][0] += count
+
+    def _get_history_counts(self) -> List[Tuple[str, str, int, UIAction]]:
+        """
+        :return: The from-node hash, to-node hash, count and action of every transition in the history.
+        """
+        return [(from_hash, to_hash, count, action)
+                for from_hash, transitions in self.__history.items()
+                for to_hash, (count, action, _) in transitions.items()]
+
+    def _restore_history_count(self, from_hash: str, to_hash: str, count: int, action: UIAction) -> bool:
+        """
+        Adds a transition from another run's history, if both of its nodes are in the tree.
+        :return: True if the transition was restored.
+        """
+        _, to_node = self._tree.find_node_by_hash(to_hash)
+        if to_node is None or self._tree.find_node_by_hash(from_hash)[1] is None:
+            return False
+        self.__history.setdefault(from_hash, {})
+        if to_hash in self.__history[from_hash]:
+            self.__history[from_hash][to_hash][0] += count
+        else:
+            self.__history[from_hash][to_hash] = [count, action, to_node]
+        return True
 
     def __get_transition_from_history(self, from_node: UITreeNode, to_node: UITreeNode) -> Tuple[int, Optional[UIAction]]:
-        if to_node.get_hash() not in self.__history[from_node.get_hash()]:
+        if to_node.get_hash() not in self.__history.get(from_node.get_hash(), {}):
             return 0, None
         return self.__history[from_node.get_hash()][to_node.get_hash()][:2]
 
     def __get_likely_transition_tuple_from_history(self, from_node: UITreeNode) -> Tuple[Optional[UIAction], Optional[UITreeNode]]:
-        if len(self.__history[from_node.get_hash()].keys()) == 0:
+        if len(self.__history.get(from_node.get_hash(), {}).keys()) == 0:
             return None, None
         max_transitions = 0
         max_action = None
@@ -1,13 +1,19 @@
 import numpy as np
-from random import uniform
-from typing import Callable, List, Tuple, Optional
+from random import uniform, randrange
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
 from sys import path
 from os.path import join, dirname
 path.append(join(dirname(__file__), '../..'))
 
 from qubot.ui.ui_action import UIAction
 from qubot.ui.ui_tree import UITree, UITreeNode
+from qubot.ui.ui_tree_graph import UITreeGraph
 from qubot.environment.environment import Environment
+from qubot.environment.q_table import QTable, DenseQTable, SparseQTable
+from qubot.environment.convergence_monitor import ConvergenceMonitor
+from qubot.environment.reward_rules import get_reward_rules
+from qubot.utils.profiler import get_profiler
 
 
 class QLearningEnvironment(Environment):
@@ -17,73 +23,51 @@ class QLearningEnvironment(Environment):
     STAT_EPSILON_HISTORY = "epsilon_history"
     STAT_TESTING_REWARDS = "testing_rewards"
     STAT_TESTING_PENALTIES = "testing_penalties"
+    STAT_CONVERGED_EPISODE = "converged_episode"
+
+    # Appended by NumPy to saved files that lack it
+    Q_TABLE_FILE_SUFFIX = ".npz"
 
     def __init__(self, tree: UITree, reward_func: Callable[[UIAction, UITreeNode], int], alpha: float, gamma: float,
-                 epsilon: float, decay: float = 0.1, step_limit=1000):
-        super().__init__(tree, reward_func, step_limit)
+                 epsilon: float, decay: float = 0.1, step_limit=1000, sparse_q_table=False, batch_episodes=1,
+                 convergence_tolerance: float = None, convergence_window=10, max_events: Optional[int] = None,
+                 spill_path: Optional[str] = None):
+        super().__init__(tree, reward_func, step_limit, max_events, spill_path)
         self.__alpha = alpha
         self.__gamma = gamma
         self.__original_epsilon = epsilon
         self.__epsilon = epsilon
         self.__decay = decay
-        self.__Q = np.zeros((self.observation_space.n, self.action_space.n))
+        # Training episodes already run since the last reset, including those of a loaded run, so epsilon keeps decaying
+        self.__trained_episode_count = 0
+        self.__batch_episodes = max(1, batch_episodes)
+        self.__convergence_tolerance = convergence_tolerance
+        self.__convergence_window = convergence_window
+        self.__graph = UITreeGraph(self._tree)
+        # Rules to precompute the rewards with, or None to call the reward function on every step
+        self.__reward_rules = get_reward_rules(reward_func)
+        if sparse_q_table:
+            self.__Q: QTable = SparseQTable.from_graph(self.__graph)
+        else:
+            self.__Q: QTable = DenseQTable(self.__graph.get_node_count(), self.__graph.get_node_count())
+        # Nodes visited during the current episode, so resetting their visits doesn't traverse the whole tree
+        self.__visited_nodes: List[UITreeNode] = []
         self._stats.empty_events(QLearningEnvironment.STAT_TRAINING_REWARDS)
         self._stats.empty_events(QLearningEnvironment.STAT_EPSILON_HISTORY)
         self._stats.empty_events(QLearningEnvironment.STAT_TESTING_REWARDS)
         self._stats.empty_events(QLearningEnvironment.STAT_TESTING_PENALTIES)
+        self._stats.empty_events(QLearningEnvironment.STAT_CONVERGED_EPISODE)
 
     def train(self, episode_count: int):
         print("Training on %d episodes..." % episode_count)
-        total_training_rewards = 0
-        for episode in range(episode_count):
-            self.__soft_reset()
-            for step in range(self._step_limit):
-                state_embedding = self.get_state_embedding()
-                action, node_action = self.__get_next_transition()
-                node_action.increment_visits()
-
-                new_state_embedding, reward, done, info = self.step((action, node_action))
-
-                total_training_rewards += reward
-
-                if action is not None:
-                    action_embedding = self._tree.get_node_embedding(node_action)
-                    self.__Q[state_embedding, action_embedding]\
-                        += self.__alpha * (reward + self.__gamma * np.max(self.__Q[new_state_embedding]) - self.__Q[state_embedding, action_embedding])
-
-                if done or step == self._step_limit - 1:
-                    self.__update_epsilon(episode)
-
-                    self._stats.record(QLearningEnvironment.STAT_TRAINING_REWARDS, total_training_rewards)
-                    self._stats.record(QLearningEnvironment.STAT_EPSILON_HISTORY, self.__epsilon)
-
-                    break
+        episodes_run, is_converged = self.__run(episode_count, is_training=True)
+        if is_converged:
+            print("Converged after %d episodes." % episodes_run)
         print("Training done.")
 
     def test(self, episode_count: int):
         print("Testing on %d episodes..." % episode_count)
-        total_testing_rewards = 0
-        total_testing_penalty = 0
-        for episode in range(episode_count):
-            self.__soft_reset()
-
-            for step in range(self._step_limit):
-                action, node_action = self.__get_next_transition()
-                node_action.increment_visits()
-
-                new_state_embedding, reward, done, info = self.step((action, node_action))
-
-                # Record reward
-                total_testing_rewards += reward
-                # Record penalty
-                if reward < 0:
-                    total_testing_penalty += 1
-
-                if done or step == self._step_limit - 1:
-                    self._stats.record(QLearningEnvironment.STAT_TESTING_REWARDS, total_testing_rewards)
-                    self._stats.record(QLearningEnvironment.STAT_TESTING_PENALTIES, total_testing_penalty)
-
-                    break
+        self.__run(episode_count, is_training=False)
         print("Testing done.")
 
     def render(self, mode='human', close=False):
@@ -96,22 +80,111 @@ class QLearningEnvironment(Environment):
         print("Original epsilon:     % 1.4f" % self.__original_epsilon)
         print("Current epsilon:      % 1.4f" % self.__epsilon)
         print("Decay:                % 1.4f" % self.__decay)
-        print("Training rewards:      % 6d" % sum(self.get_training_rewards_history()))
-        print("Training score:       % 1.4f" % (0 if not self.get_training_rewards_history() else float(sum(self.get_training_rewards_history()) / len(self.get_training_rewards_history()))))
-        print("Testing rewards:       % 6d" % sum(self.get_testing_rewards_history()))
-        print("Testing score:        % 1.4f" % (0 if not self.get_testing_rewards_history() else float(sum(self.get_testing_rewards_history()) / len(self.get_testing_rewards_history()))))
-        print("Testing penalties:     % 6d" % sum(self.get_testing_penalties_history()))
-        print("Testing penalty rate: % 1.4f" % (0 if not self.get_testing_penalties_history() else float(sum(self.get_testing_penalties_history()) / len(self.get_testing_penalties_history()))))
+        # Use the running aggregates, as the histories may only retain the most recent episodes
+        print("Training rewards:      % 6d" % self._stats.get_sum(QLearningEnvironment.STAT_TRAINING_REWARDS))
+        print("Training score:       % 1.4f" % (self._stats.get_mean(QLearningEnvironment.STAT_TRAINING_REWARDS) or 0))
+        print("Testing rewards:       % 6d" % self._stats.get_sum(QLearningEnvironment.STAT_TESTING_REWARDS))
+        print("Testing score:        % 1.4f" % (self._stats.get_mean(QLearningEnvironment.STAT_TESTING_REWARDS) or 0))
+        print("Testing penalties:     % 6d" % self._stats.get_sum(QLearningEnvironment.STAT_TESTING_PENALTIES))
+        print("Testing penalty rate: % 1.4f" % (self._stats.get_mean(QLearningEnvironment.STAT_TESTING_PENALTIES) or 0))
 
     def reset(self):
         self._stats.empty_events(QLearningEnvironment.STAT_TRAINING_REWARDS)
         self._stats.empty_events(QLearningEnvironment.STAT_EPSILON_HISTORY)
         self._stats.empty_events(QLearningEnvironment.STAT_TESTING_REWARDS)
         self._stats.empty_events(QLearningEnvironment.STAT_TESTING_PENALTIES)
+        self._stats.empty_events(QLearningEnvironment.STAT_CONVERGED_EPISODE)
         self.__epsilon = self.__original_epsilon
-        self._tree.for_each_pair(lambda _, node: node.set_visits(0))
+        self.__trained_episode_count = 0
+        self._tree.reset_visits()
+        self.__visited_nodes = []
         return super().reset()
 
+    @staticmethod
+    def get_q_table_file(file_path: str) -> str:
+        """
+        :param file_path: The path a Q-table is saved to or loaded from, with or without its .npz suffix.
+        :return: The path of the file actually written and read.
+        """
+        return file_path if file_path.endswith(QLearningEnvironment.Q_TABLE_FILE_SUFFIX) else file_path + QLearningEnvironment.Q_TABLE_FILE_SUFFIX
+
+    def save(self, file_path: str):
+        """
+        Saves the learned Q-table, epsilon and transition history to an .npz file. Everything is keyed by node hash
+        rather than by graph index, so the file can be loaded onto a re-crawled tree whose nodes have moved.
+        :param file_path: The file to save to. See get_q_table_file.
+        """
+        file_path = QLearningEnvironment.get_q_table_file(file_path)
+        graph = self.__graph
+        node_hashes = np.array([graph.get_hash(index) for index in range(graph.get_node_count())])
+        states, actions, values = self.__Q.get_entries()
+        history = self._get_history_counts()
+        np.savez_compressed(
+            file_path,
+            node_hashes=node_hashes,
+            state_hashes=node_hashes[states],
+            action_hashes=node_hashes[actions],
+            values=values,
+            epsilon=self.__epsilon,
+            trained_episode_count=self.__trained_episode_count,
+            history_from_hashes=np.array([from_hash for from_hash, _, _, _ in history], dtype=node_hashes.dtype),
+            history_to_hashes=np.array([to_hash for _, to_hash, _, _ in history], dtype=node_hashes.dtype),
+            history_counts=np.array([count for _, _, count, _ in history], dtype=np.int64),
+            history_actions=np.array([action.value for _, _, _, action in history], dtype=np.int64),
+        )
+
+    def load(self, file_path: str) -> float:
+        """
+        Loads a saved Q-table, epsilon and transition history onto this tree. Values of (state, action) pairs whose
+        nodes no longer exist or are no longer adjacent are dropped. Nodes sharing a hash all receive the saved value.
+        :param file_path: The .npz file to load from. See get_q_table_file.
+        :return: The fraction of this tree's nodes that were present in the saved run.
+        """
+        file_path = QLearningEnvironment.get_q_table_file(file_path)
+        graph = self.__graph
+        node_count = graph.get_node_count()
+        with np.load(file_path) as saved:
+            saved_node_hashes = set(saved["node_hashes"].tolist())
+            saved_values = {}
+            for state_hash, action_hash, value in zip(saved["state_hashes"].tolist(), saved["action_hashes"].tolist(),
+                                                      saved["values"].tolist()):
+                saved_values[(state_hash, action_hash)] = value
+            epsilon = float(saved["epsilon"])
+            trained_episode_count = int(saved["trained_episode_count"])
+            history = list(zip(saved["history_from_hashes"].tolist(), saved["history_to_hashes"].tolist(),
+                               saved["history_counts"].tolist(), saved["history_actions"].tolist()))
+
+        # Match the saved values against the edges of this tree, in both directions
+        node_hashes = [graph.get_hash(index) for index in range(node_count)]
+        states, actions, values = [], [], []
+        for child in range(node_count):
+            parent = int(graph.parents[child])
+            if parent == UITreeGraph.NO_NODE:
+                continue
+            for state, action in ((parent, child), (child, parent)):
+                key = (node_hashes[state], node_hashes[action])
+                if key in saved_values:
+                    states.append(state)
+                    actions.append(action)
+                    values.append(saved_values[key])
+        if states:
+            self.__Q.set_many(np.array(states), np.array(actions), np.array(values))
+
+        for from_hash, to_hash, count, action in history:
+            self._restore_history_count(from_hash, to_hash, count, UIAction(action))
+        self.__epsilon = epsilon
+        self.__trained_episode_count = trained_episode_count
+        return sum(1 for node_hash in node_hashes if node_hash in saved_node_hashes) / node_count if node_count else 0.0
+
+    def get_trained_episode_count(self) -> int:
+        return self.__trained_episode_count
+
+    def get_q_table(self) -> QTable:
+        return self.__Q
+
+    def get_graph(self) -> UITreeGraph:
+        return self.__graph
+
     def get_training_rewards_history(self) -> List[int]:
         return self._stats.get(QLearningEnvironment.STAT_TRAINING_REWARDS)
 
@@ -124,51 +197,368 @@ class QLearningEnvironment(Environment):
     def get_epsilon_history(self) -> List[float]:
         return self._stats.get(QLearningEnvironment.STAT_EPSILON_HISTORY)
 
-    def __soft_reset(self):
-        self._current_node = self._tree.get_root()
-        self.__history = {}
-        for node_hash in self._tree.get_hash():
-            self.__history[node_hash] = {}
-        self._tree.for_each_pair(lambda _, node: node.set_visits(0))
-        return self._current_node
-
-    def __get_exploitative_transition_tuple(self) -> Tuple[Optional[UIAction], Optional[UITreeNode]]:
-        state = self.get_state()
-        state_embedding = self.get_state_embedding()
-
-        # Construct a list of nodes to transition to, along with their action
-        action_embedding = np.argmax(self.__Q[state_embedding, :])
-        embedded_node = self._tree.get_node_from_embedding(action_embedding)
-
-        for potential_action, potential_node in state.get_transition_tuples():
-            if potential_node.get_hash() == embedded_node.get_hash():
-                return potential_action, potential_node
+    def __run(self, episode_count: int, is_training: bool) -> Tuple[int, bool]:
+        """
+        :return: The number of episodes run, fewer than episode_count if training converged early, and whether training
+        converged.
+        """
+        if is_training and self.__convergence_tolerance is not None:
+            monitor = ConvergenceMonitor(self.__convergence_tolerance, self.__convergence_window)
+        else:
+            monitor = None
+        if self.__batch_episodes > 1 and self.__reward_rules is not None:
+            episodes_run, is_converged = self.__run_episode_batches(episode_count, is_training, monitor)
+        else:
+            episodes_run, is_converged = self.__run_episodes(episode_count, is_training, monitor)
+        if is_training:
+            self.__trained_episode_count += episodes_run
+            if is_converged:
+                self._stats.record(QLearningEnvironment.STAT_CONVERGED_EPISODE, episodes_run)
+        return episodes_run, is_converged
+
+    def __run_episodes(self, episode_count: int, is_training: bool,
+                       monitor: Optional[ConvergenceMonitor]) -> Tuple[int, bool]:
+        """
+        Runs episodes on the compiled tree, using plain integer lists in the hot loop and mapping back to UITreeNodes
+        only once the episodes are over.
+        :param episode_count: The number of episodes to run.
+        :param is_training: Update the Q-table and epsilon, or just record the testing rewards and penalties?
+        :param monitor: Stops the episodes once training has converged, or None to run all of them.
+        :return: The number of episodes run, and whether training converged.
+        """
+        graph = self.__graph
+        graph.refresh(self.__reward_rules)
+        child_offsets = graph.child_offsets.tolist()
+        child_indices = graph.child_indices.tolist()
+        parents = graph.parents.tolist()
+        terminals = graph.terminals.tolist()
+        leaves = graph.leaves.tolist()
+        rewards = graph.rewards.tolist()
+        parent_rewards = graph.parent_rewards.tolist()
+        visit_levels = graph.get_visit_levels()
+        reward_func = self._reward_func if self.__reward_rules is None else None
+        no_node = UITreeGraph.NO_NODE
+        q_table = self.__Q
+        alpha, gamma, step_limit = self.__alpha, self.__gamma, self._step_limit
+
+        step_count = self._stats.get(Environment.STAT_STEP_COUNT)
+        steps_taken = 0
+        reward_sum = 0
+        total_rewards = 0
+        total_penalties = 0
+        visits = [0] * graph.get_node_count()
+        visited: List[int] = []
+        transition_counts: Dict[Tuple[int, int, bool], int] = {}
+        state = 0
+        episodes_run = 0
+        is_converged = False
+        # Timed in bulk, as timing every step on its own would cost more than the step
+        profiler = get_profiler()
+        is_profiling = profiler.is_enabled()
+        selection_s, update_s, update_count = 0.0, 0.0, 0
 
-        return None, None
-
-    def __get_next_transition(self) -> Tuple[Optional[UIAction], Optional[UITreeNode]]:
-        # Determine whether to choose an exploitative of random action
-        exp_tradeoff = uniform(0, 1)
-
-        action, node_action = None, None
-        if exp_tradeoff >= self.__epsilon:
-            # Exploitative action
-            action, node_action = self.__get_exploitative_transition_tuple()
-            if action is None:
-                exp_tradeoff = self.__epsilon - 1  # workaround to get to next if-condition
-
-        if exp_tradeoff < self.__epsilon:
-            # Random action
-            action, node_action = self.get_next_explorative_transition_tuple()
-
-        if (not action or not node_action) and self._current_node and self._current_node.get_parent():
-            # Try going back up the tree
-            action = UIAction.NAVIGATE
-            node_action = self._current_node.get_parent()
+        for episode in range(episode_count):
+            if is_converged:
+                break
+            episodes_run += 1
+            state = 0
+            for index in visited:
+                visits[index] = 0
+            visited = []
+            epsilon = self.__epsilon
+            episode_start_rewards = total_rewards
+            max_delta_q = 0
+
+            for step in range(step_limit):
+                if is_profiling:
+                    selection_start = perf_counter()
+                next_state, is_navigating_up = no_node, False
+
+                # Determine whether to choose an exploitative or random action
+                exp_tradeoff = uniform(0, 1)
+                if exp_tradeoff >= epsilon:
+                    # Exploitative action, only if the best action leads to a child
+                    best_state = q_table.argmax(state)
+                    if best_state != state and parents[best_state] == state:
+                        next_state = best_state
+                    else:
+                        exp_tradeoff = epsilon - 1  # workaround to get to next if-condition
+                if exp_tradeoff < epsilon:
+                    # Random action
+                    child_start, child_end = child_offsets[state], child_offsets[state + 1]
+                    if child_end > child_start:
+                        next_state = child_indices[child_start + randrange(child_end - child_start)]
+                if next_state == no_node and parents[state] != no_node:
+                    # Try going back up the tree
+                    next_state, is_navigating_up = parents[state], True
+                if is_profiling:
+                    selection_s += perf_counter() - selection_start
+
+                steps_taken += 1
+                if next_state == no_node:
+                    reward = 0
+                    done = True
+                else:
+                    if visits[next_state] == 0:
+                        visited.append(next_state)
+                    visits[next_state] += 1
+                    if reward_func is None:
+                        level = min(visits[next_state], visit_levels) - 1
+                        reward = parent_rewards[level][next_state] if is_navigating_up else rewards[level][next_state]
+                    else:
+                        reward = self.__get_step_reward(next_state, is_navigating_up, visits[next_state])
+                    done = terminals[next_state] or (leaves[next_state] and parents[next_state] == no_node) \
+                        or step_count + steps_taken == step_limit
+                reward_sum += reward
+                total_rewards += reward
+
+                if next_state != no_node:
+                    if is_training:
+                        if is_profiling:
+                            update_start = perf_counter()
+                        q_value = q_table.get(state, next_state)
+                        delta_q = alpha * (reward + gamma * q_table.max(next_state) - q_value)
+                        q_table.set(state, next_state, q_value + delta_q)
+                        max_delta_q = max(max_delta_q, abs(delta_q))
+                        if is_profiling:
+                            update_s += perf_counter() - update_start
+                            update_count += 1
+                    transition = (state, next_state, is_navigating_up)
+                    transition_counts[transition] = transition_counts.get(transition, 0) + 1
+                    state = next_state
+
+                if not is_training and reward < 0:
+                    total_penalties += 1
+
+                if done or step == step_limit - 1:
+                    if is_training:
+                        self.__update_epsilon(self.__trained_episode_count + episode)
+                        self._stats.record(QLearningEnvironment.STAT_TRAINING_REWARDS, total_rewards)
+                        self._stats.record(QLearningEnvironment.STAT_EPSILON_HISTORY, self.__epsilon)
+                        if monitor is not None:
+                            is_converged = monitor.update(max_delta_q, total_rewards - episode_start_rewards)
+                    else:
+                        self._stats.record(QLearningEnvironment.STAT_TESTING_REWARDS, total_rewards)
+                        self._stats.record(QLearningEnvironment.STAT_TESTING_PENALTIES, total_penalties)
+                    break
 
-        return action, node_action
+        # Map the results back onto the tree
+        if is_profiling:
+            profiler.add("q_learning.action_selection", selection_s, steps_taken)
+            if update_count:
+                profiler.add("q_learning.q_update", update_s, update_count)
+        self._stats.increment(Environment.STAT_STEP_COUNT, steps_taken)
+        self._stats.increment(Environment.STAT_REWARD_SUM, reward_sum)
+        for (from_index, to_index, is_navigating_up), count in transition_counts.items():
+            action = UIAction.NAVIGATE if is_navigating_up else graph.get_action(to_index)
+            self._record_transition_in_history(graph.get_node(from_index), graph.get_node(to_index), action, count)
+        for node in self.__visited_nodes:
+            node.set_visits(0)
+        self.__visited_nodes = [graph.get_node(index) for index in visited]
+        for node, index in zip(self.__visited_nodes, visited):
+            node.set_visits(visits[index])
+        self._current_node = graph.get_node(state)
+        return episodes_run, is_converged
+
+    def __run_episode_batches(self, episode_count: int, is_training: bool,
+                              monitor: Optional[ConvergenceMonitor]) -> Tuple[int, bool]:
+        """
+        Runs batches of independent episodes in lockstep, advancing every episode of a batch by one step per NumPy
+        operation. Episodes of a batch all read the Q-table as it was at the start of the step, and conflicting updates
+        to the same (state, action) pair within a step are resolved by applying the mean of their targets once.
+        :param episode_count: The number of episodes to run.
+        :param is_training: Update the Q-table and epsilon, or just record the testing rewards and penalties?
+        :param monitor: Stops after the batch in which training converged, or None to run every batch. Every episode of
+        a batch is credited with the batch's largest Q-value update.
+        :return: The number of episodes run, and whether training converged.
+        """
+        graph = self.__graph
+        graph.refresh(self.__reward_rules)
+        child_offsets, child_indices = graph.child_offsets, graph.child_indices
+        parents, terminals, leaves = graph.parents.astype(np.int64), graph.terminals, graph.leaves
+        rewards, parent_rewards = graph.rewards, graph.parent_rewards
+        visit_levels = graph.get_visit_levels()
+        no_node = UITreeGraph.NO_NODE
+        node_count = graph.get_node_count()
+        q_table = self.__Q
+        alpha, gamma, step_limit = self.__alpha, self.__gamma, self._step_limit
+
+        steps_taken = 0
+        reward_sum = 0
+        total_rewards = 0
+        total_penalties = 0
+        transition_keys: List[np.ndarray] = []
+        visited = np.zeros(0, dtype=np.int64)
+        last_state = 0
+        episodes_run = 0
+        is_converged = False
+        profiler = get_profiler()
+        is_profiling = profiler.is_enabled()
+        selection_s, update_s, update_count = 0.0, 0.0, 0
+
+        for batch_start in range(0, episode_count, self.__batch_episodes):
+            episodes = np.arange(batch_start, min(batch_start + self.__batch_episodes, episode_count))
+            batch_size = len(episodes)
+            if is_training:
+                # Each episode explores with the epsilon left by the one before it
+                epsilons = self.__get_epsilon(self.__trained_episode_count + episodes - 1)
+                if batch_start == 0:
+                    epsilons[0] = self.__epsilon
+            else:
+                epsilons = np.full(batch_size, self.__epsilon)
+
+            states = np.zeros(batch_size, dtype=np.int64)
+            episodes_run += batch_size
+            is_active = np.ones(batch_size, dtype=bool)
+            episode_rewards = np.zeros(batch_size, dtype=rewards.dtype)
+            episode_penalties = np.zeros(batch_size, dtype=np.int64)
+            if visit_levels > 1:
+                # Visits of each node by each episode, counted only up to the last reward table row
+                lane_visits = np.zeros((batch_size, node_count), dtype=np.uint8 if visit_levels < 255 else np.int64)
+            last_episode_path: List[np.ndarray] = []
+            max_delta_q = 0
+
+            for _ in range(step_limit):
+                lanes = np.nonzero(is_active)[0]
+                if len(lanes) == 0:
+                    break
+                if is_profiling:
+                    selection_start = perf_counter()
+                lane_states = states[lanes]
+                next_states = np.full(len(lanes), no_node, dtype=np.int64)
+
+                # Exploitative action, only if the best action leads to a child
+                is_random = np.random.random_sample(len(lanes)) < epsilons[lanes]
+                exploiting = np.nonzero(~is_random)[0]
+                best_states = np.asarray(q_table.argmax_many(lane_states[exploiting]), dtype=np.int64)
+                is_child = (best_states != lane_states[exploiting]) & (parents[best_states] == lane_states[exploiting])
+                next_states[exploiting[is_child]] = best_states[is_child]
+                is_random[exploiting[~is_child]] = True
+
+                # Random action
+                child_starts = child_offsets[lane_states]
+                degrees = child_offsets[lane_states + 1] - child_starts
+                is_random &= degrees > 0
+                picks = (np.random.random_sample(len(lanes)) * degrees).astype(np.int64)
+                next_states[is_random] = child_indices[child_starts[is_random] + picks[is_random]]
+
+                # Try going back up the tree
+                is_navigating_up = (next_states == no_node) & (parents[lane_states] != no_node)
+                next_states[is_navigating_up] = parents[lane_states[is_navigating_up]]
+                if is_profiling:
+                    selection_s += perf_counter() - selection_start
+
+                steps_taken += len(lanes)
+                is_moving = next_states != no_node
+                moving_next_states = next_states[is_moving]
+                if visit_levels > 1:
+                    moving_lanes = lanes[is_moving]
+                    lane_visits[moving_lanes, moving_next_states] = \
+                        np.minimum(lane_visits[moving_lanes, moving_next_states] + 1, visit_levels)
+                    levels = lane_visits[moving_lanes, moving_next_states].astype(np.int64) - 1
+                else:
+                    levels = 0
+                step_rewards = np.zeros(len(lanes), dtype=rewards.dtype)
+                step_rewards[is_moving] = np.where(is_navigating_up[is_moving],
+                                                   parent_rewards[levels, moving_next_states],
+                                                   rewards[levels, moving_next_states])
+                is_done = ~is_moving
+                is_done[is_moving] = terminals[moving_next_states] | \
+                    (leaves[moving_next_states] & (parents[moving_next_states] == no_node))
+                episode_rewards[lanes] += step_rewards
+                episode_penalties[lanes] += step_rewards < 0
+
+                moving_states = lane_states[is_moving]
+                if is_training and len(moving_states):
+                    if is_profiling:
+                        update_start = perf_counter()
+                    targets = step_rewards[is_moving] + gamma * q_table.max_many(moving_next_states)
+                    keys, inverse = np.unique(moving_states * node_count + moving_next_states, return_inverse=True)
+                    mean_targets = np.bincount(inverse, weights=targets) / np.bincount(inverse)
+                    update_states, update_actions = keys // node_count, keys % node_count
+                    q_values = q_table.get_many(update_states, update_actions)
+                    delta_q = alpha * (mean_targets - q_values)
+                    q_table.set_many(update_states, update_actions, q_values + delta_q)
+                    max_delta_q = max(max_delta_q, np.abs(delta_q).max().item())
+                    if is_profiling:
+                        update_s += perf_counter() - update_start
+                        update_count += len(moving_states)
+                transition_keys.append((moving_states * node_count + moving_next_states) * 2 +
+                                       is_navigating_up[is_moving])
+                if lanes[-1] == batch_size - 1 and is_moving[-1]:
+                    last_episode_path.append(next_states[-1:])
+
+                states[lanes[is_moving]] = moving_next_states
+                is_active[lanes[is_done]] = False
+
+            # Record the episodes in order, as if they had run one after the other
+            reward_sum += episode_rewards.sum().item()
+            cumulative_rewards = total_rewards + np.cumsum(episode_rewards)
+            cumulative_penalties = total_penalties + np.cumsum(episode_penalties)
+            total_rewards, total_penalties = cumulative_rewards[-1].item(), cumulative_penalties[-1].item()
+            if is_training:
+                episode_epsilons = self.__get_epsilon(self.__trained_episode_count + episodes)
+                self.__epsilon = float(episode_epsilons[-1])
+                for total, epsilon in zip(cumulative_rewards.tolist(), episode_epsilons.tolist()):
+                    self._stats.record(QLearningEnvironment.STAT_TRAINING_REWARDS, total)
+                    self._stats.record(QLearningEnvironment.STAT_EPSILON_HISTORY, epsilon)
+            else:
+                for total, penalties in zip(cumulative_rewards.tolist(), cumulative_penalties.tolist()):
+                    self._stats.record(QLearningEnvironment.STAT_TESTING_REWARDS, total)
+                    self._stats.record(QLearningEnvironment.STAT_TESTING_PENALTIES, penalties)
+            last_state = int(states[-1])
+            visited = np.concatenate(last_episode_path) if last_episode_path else np.zeros(0, dtype=np.int64)
+            if monitor is not None and any([monitor.update(max_delta_q, reward)
+                                            for reward in episode_rewards.tolist()]):
+                is_converged = True
+                break
+
+        # Map the results back onto the tree
+        if is_profiling:
+            profiler.add("q_learning.action_selection", selection_s, steps_taken)
+            if update_count:
+                profiler.add("q_learning.q_update", update_s, update_count)
+        self._stats.increment(Environment.STAT_STEP_COUNT, steps_taken)
+        self._stats.increment(Environment.STAT_REWARD_SUM, reward_sum)
+        if transition_keys:
+            keys, counts = np.unique(np.concatenate(transition_keys), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                from_index, to_index, is_navigating_up = key // 2 // node_count, key // 2 % node_count, key % 2 == 1
+                action = UIAction.NAVIGATE if is_navigating_up else graph.get_action(to_index)
+                self._record_transition_in_history(graph.get_node(from_index), graph.get_node(to_index), action, count)
+        for node in self.__visited_nodes:
+            node.set_visits(0)
+        indices, visits = np.unique(visited, return_counts=True)
+        self.__visited_nodes = [graph.get_node(index) for index in indices.tolist()]
+        for node, count in zip(self.__visited_nodes, visits.tolist()):
+            node.set_visits(count)
+        self._current_node = graph.get_node(last_state)
+        return episodes_run, is_converged
+
+    def __get_step_reward(self, index: int, is_navigating_up: bool, visits: int):
+        """
+        Calls the reward function on a node, with the node's visits set to those of the current episode.
+        :param index: The index of the node entered.
+        :param is_navigating_up: Is the node entered by navigating back up from one of its children?
+        :param visits: The visits of the node during the current episode, counting the current one.
+        :return: The reward.
+        """
+        graph = self.__graph
+        node = graph.get_node(index)
+        node_visits = node.get_visits()
+        node.set_visits(visits)
+        reward = self._reward_func(UIAction.NAVIGATE if is_navigating_up else graph.get_action(index), node)
+        node.set_visits(node_visits)
+        return reward
 
     def __update_epsilon(self, episode_number: int):
-        self.__epsilon = QLearningEnvironment.EPSILON_RANGE[0] + (
+        self.__epsilon = self.__get_epsilon(episode_number)
+
+    def __get_epsilon(self, episode_number):
+        """
+        :param episode_number: An episode number, or an array of them.
+        :return: The epsilon to use after the given episode(s).
+        """
+        return QLearningEnvironment.EPSILON_RANGE[0] + (
                 QLearningEnvironment.EPSILON_RANGE[1] - QLearningEnvironment.EPSILON_RANGE[0]) * np.exp(
                 - self.__decay * episode_number)
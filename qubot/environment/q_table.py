@@ -0,0 +1,260 @@
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Tuple
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../..'))
+
+from qubot.ui.ui_tree_graph import UITreeGraph
+
+
+class QTable(ABC):
+    """
+    A table of Q-values indexed by state and action node indices.
+    """
+
+    @abstractmethod
+    def get(self, state: int, action: int) -> float:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, state: int, action: int, value: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    def max(self, state: int) -> float:
+        raise NotImplementedError
+
+    @abstractmethod
+    def argmax(self, state: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many(self, states: np.ndarray, actions: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_many(self, states: np.ndarray, actions: np.ndarray, values: np.ndarray):
+        raise NotImplementedError
+
+    @abstractmethod
+    def max_many(self, states: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def argmax_many(self, states: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_entries(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: The states, actions and values of every non-zero entry.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_size_bytes(self) -> int:
+        raise NotImplementedError
+
+
+class DenseQTable(QTable):
+    """
+    A Q-table storing a value for every (state, action) pair.
+    """
+
+    def __init__(self, state_count: int, action_count: int):
+        self.__Q = np.zeros((state_count, action_count))
+
+    def get(self, state: int, action: int) -> float:
+        return self.__Q[state, action]
+
+    def set(self, state: int, action: int, value: float):
+        self.__Q[state, action] = value
+
+    def max(self, state: int) -> float:
+        return np.max(self.__Q[state])
+
+    def argmax(self, state: int) -> int:
+        return int(np.argmax(self.__Q[state, :]))
+
+    def get_many(self, states: np.ndarray, actions: np.ndarray) -> np.ndarray:
+        return self.__Q[states, actions]
+
+    def set_many(self, states: np.ndarray, actions: np.ndarray, values: np.ndarray):
+        self.__Q[states, actions] = values
+
+    def max_many(self, states: np.ndarray) -> np.ndarray:
+        return np.max(self.__Q[states], axis=1) if len(states) else np.zeros(0)
+
+    def argmax_many(self, states: np.ndarray) -> np.ndarray:
+        return np.argmax(self.__Q[states], axis=1) if len(states) else np.zeros(0, dtype=np.int64)
+
+    def get_entries(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        states, actions = np.nonzero(self.__Q)
+        return states, actions, self.__Q[states, actions]
+
+    def get_size_bytes(self) -> int:
+        return self.__Q.nbytes
+
+
+class SparseQTable(QTable):
+    """
+    A Q-table storing values only for the edges of the compiled UITree (each node's children and its parent) in CSR
+    format. Missing entries read as zero, so max and argmax behave exactly like the dense table's.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, action_count: int):
+        """
+        Initializes the table with all values at zero.
+        :param indptr: Row offsets into indices, of length state_count + 1.
+        :param indices: The sorted action node indices stored for each row.
+        :param action_count: The number of columns the equivalent dense table would have.
+        """
+        self.__indptr = indptr
+        self.__indices = indices
+        self.__data = np.zeros(len(indices))
+        self.__action_count = action_count
+        # Globally sorted (state, action) keys, for vectorized lookups
+        row_lengths = np.diff(indptr)
+        self.__keys = np.repeat(np.arange(len(row_lengths), dtype=np.int64), row_lengths) * action_count + indices
+
+    @staticmethod
+    def from_graph(graph: UITreeGraph) -> 'SparseQTable':
+        """
+        Builds the table over the adjacency of a compiled tree.
+        :param graph: The UITreeGraph whose node indices index the table.
+        :return: An empty SparseQTable.
+        """
+        node_count = graph.get_node_count()
+        rows = [set(graph.get_children(index).tolist()) for index in range(node_count)]
+        for index in range(node_count):
+            if graph.parents[index] != UITreeGraph.NO_NODE:
+                rows[index].add(int(graph.parents[index]))
+
+        index_dtype = np.int32 if node_count < np.iinfo(np.int32).max else np.int64
+        indptr = np.zeros(node_count + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in rows])
+        indices = np.fromiter((action for row in rows for action in sorted(row)), dtype=index_dtype, count=int(indptr[-1]))
+        return SparseQTable(indptr, indices, node_count)
+
+    def get(self, state: int, action: int) -> float:
+        position = self.__find(state, action)
+        return 0.0 if position is None else self.__data[position]
+
+    def set(self, state: int, action: int, value: float):
+        position = self.__find(state, action)
+        if position is None:
+            raise Exception("(%d, %d) is not an edge of the sparse Q-table" % (state, action))
+        self.__data[position] = value
+
+    def max(self, state: int) -> float:
+        start, end = self.__indptr[state], self.__indptr[state + 1]
+        if start == end:
+            return 0.0
+        best = np.max(self.__data[start:end])
+        if end - start < self.__action_count:
+            # The implicit zeros of the missing actions take part in the max
+            return max(best, 0.0)
+        return best
+
+    def argmax(self, state: int) -> int:
+        start, end = self.__indptr[state], self.__indptr[state + 1]
+        if start == end:
+            return 0
+        actions = self.__indices[start:end]
+        values = self.__data[start:end]
+        best = int(np.argmax(values))
+        if end - start == self.__action_count or values[best] > 0:
+            return int(actions[best])
+
+        # The first missing action holds an implicit zero
+        gaps = np.nonzero(actions != np.arange(len(actions)))[0]
+        first_missing_action = int(gaps[0]) if len(gaps) else len(actions)
+        if values[best] < 0:
+            return first_missing_action
+        return min(int(actions[values == 0][0]), first_missing_action)
+
+    def get_many(self, states: np.ndarray, actions: np.ndarray) -> np.ndarray:
+        positions, is_found = self.__find_many(states, actions)
+        return np.where(is_found, self.__data[np.minimum(positions, len(self.__data) - 1)], 0.0) if len(self.__data) \
+            else np.zeros(len(states))
+
+    def set_many(self, states: np.ndarray, actions: np.ndarray, values: np.ndarray):
+        positions, is_found = self.__find_many(states, actions)
+        if not np.all(is_found):
+            raise Exception("cannot set values outside the edges of the sparse Q-table")
+        self.__data[positions] = values
+
+    def max_many(self, states: np.ndarray) -> np.ndarray:
+        positions, local, lengths, segment_starts = self.__gather_rows(states)
+        best = np.zeros(len(states))
+        is_filled = lengths > 0
+        if np.any(is_filled):
+            best[is_filled] = np.maximum.reduceat(self.__data[positions], segment_starts[is_filled])
+        # The implicit zeros of the missing actions take part in the max
+        return np.where(lengths < self.__action_count, np.maximum(best, 0.0), best)
+
+    def argmax_many(self, states: np.ndarray) -> np.ndarray:
+        positions, local, lengths, segment_starts = self.__gather_rows(states)
+        result = np.zeros(len(states), dtype=np.int64)
+        is_filled = lengths > 0
+        if not np.any(is_filled):
+            return result
+        starts = segment_starts[is_filled]
+        values = self.__data[positions]
+        actions = self.__indices[positions].astype(np.int64)
+        unreachable = np.iinfo(np.int64).max
+
+        best_values = np.maximum.reduceat(values, starts)
+        is_best = values == np.repeat(best_values, lengths[is_filled])
+        best_actions = actions[starts + np.minimum.reduceat(np.where(is_best, local, unreachable), starts)]
+        first_zero_actions = np.minimum.reduceat(np.where(values == 0, actions, unreachable), starts)
+        # The first missing action holds an implicit zero
+        first_missing_actions = np.minimum.reduceat(np.where(actions != local, local, unreachable), starts)
+        first_missing_actions = np.where(first_missing_actions == unreachable, lengths[is_filled], first_missing_actions)
+
+        is_full = lengths[is_filled] == self.__action_count
+        filled_result = np.where(
+            is_full | (best_values > 0),
+            best_actions,
+            np.where(best_values < 0, first_missing_actions, np.minimum(first_zero_actions, first_missing_actions))
+        )
+        result[is_filled] = filled_result
+        return result
+
+    def get_entries(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        positions = np.nonzero(self.__data)[0]
+        keys = self.__keys[positions]
+        return keys // self.__action_count, keys % self.__action_count, self.__data[positions]
+
+    def get_size_bytes(self) -> int:
+        return self.__indptr.nbytes + self.__indices.nbytes + self.__data.nbytes + self.__keys.nbytes
+
+    def __find_many(self, states: np.ndarray, actions: np.ndarray):
+        keys = np.asarray(states, dtype=np.int64) * self.__action_count + np.asarray(actions, dtype=np.int64)
+        positions = np.searchsorted(self.__keys, keys)
+        is_found = positions < len(self.__keys)
+        is_found[is_found] = self.__keys[positions[is_found]] == keys[is_found]
+        return positions, is_found
+
+    def __gather_rows(self, states: np.ndarray):
+        """
+        Gathers the stored positions of several rows.
+        :param states: The rows to gather.
+        :return: The positions, each position's index within its row, each row's length, and where each row starts in
+        the gathered positions.
+        """
+        starts = self.__indptr[states]
+        lengths = self.__indptr[np.asarray(states) + 1] - starts
+        segment_starts = np.zeros(len(states), dtype=np.int64)
+        segment_starts[1:] = np.cumsum(lengths)[:-1]
+        local = np.arange(int(lengths.sum()), dtype=np.int64) - np.repeat(segment_starts, lengths)
+        positions = np.repeat(starts, lengths) + local
+        return positions, local, lengths, segment_starts
+
+    def __find(self, state: int, action: int):
+        start, end = self.__indptr[state], self.__indptr[state + 1]
+        position = start + np.searchsorted(self.__indices[start:end], action)
+        if position < end and self.__indices[position] == action:
+            return position
+        return None
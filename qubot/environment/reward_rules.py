@@ -0,0 +1,128 @@
+import numpy as np
+from typing import Callable, List, Optional
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../..'))
+
+from qubot.ui.ui_action import UIAction
+
+
+class RewardRule:
+    """
+    A reward given on entering a node that matches conditions on its features. Conditions left as None match any node.
+    """
+
+    def __init__(self, reward: float, is_terminal: Optional[bool] = None, is_leaf: Optional[bool] = None,
+                 actions: Optional[List[UIAction]] = None, min_visits: Optional[int] = None):
+        """
+        Initializes the rule.
+        :param reward: The reward of the matching nodes.
+        :param is_terminal: Match terminal nodes (True) or non-terminal nodes (False)?
+        :param is_leaf: Match nodes without children (True) or with children (False)?
+        :param actions: Match nodes entered through one of these actions.
+        :param min_visits: Match nodes visited at least this many times during the episode, counting the current visit.
+        """
+        self.reward = reward
+        self.is_terminal = is_terminal
+        self.is_leaf = is_leaf
+        self.actions = actions
+        self.min_visits = min_visits
+
+    def matches(self, action: UIAction, is_terminal: bool, is_leaf: bool, visits: int) -> bool:
+        return (self.is_terminal is None or self.is_terminal == is_terminal) \
+            and (self.is_leaf is None or self.is_leaf == is_leaf) \
+            and (self.actions is None or action in self.actions) \
+            and (self.min_visits is None or visits >= self.min_visits)
+
+    def matches_many(self, actions: np.ndarray, terminals: np.ndarray, leaves: np.ndarray, visits: int) -> np.ndarray:
+        """
+        Same as matches, for every node at once.
+        :param actions: The UIAction value each node is entered through.
+        :param terminals: The terminal flag of each node.
+        :param leaves: The leaf flag of each node.
+        :param visits: The visit count of every node.
+        :return: The match flag of each node.
+        """
+        is_match = np.ones(len(actions), dtype=bool)
+        if self.is_terminal is not None:
+            is_match &= terminals == self.is_terminal
+        if self.is_leaf is not None:
+            is_match &= leaves == self.is_leaf
+        if self.actions is not None:
+            is_match &= np.isin(actions, [action.value for action in self.actions])
+        if self.min_visits is not None and visits < self.min_visits:
+            is_match[:] = False
+        return is_match
+
+
+class RewardRules:
+    """
+    A reward function declared as an ordered list of RewardRules over node features: the first matching rule gives the
+    reward. Unlike an arbitrary reward function, the rules can be evaluated for every node at once, so training
+    precomputes the reward of each node for each visit count instead of calling a function on every step.
+    """
+
+    def __init__(self, rules: List[RewardRule], default: float = 0):
+        """
+        :param rules: The rules, in order of precedence.
+        :param default: The reward of nodes matching no rule.
+        """
+        self.__rules = rules
+        self.__default = default
+
+    def __call__(self, action: UIAction, node) -> float:
+        """
+        Evaluates the rules on a single node, so the rules can be used wherever a reward function is.
+        :param action: The action the node is entered through.
+        :param node: The UITreeNode entered.
+        :return: The reward.
+        """
+        is_terminal, is_leaf, visits = node.is_terminal(), not node.get_children(), node.get_visits()
+        for rule in self.__rules:
+            if rule.matches(action, is_terminal, is_leaf, visits):
+                return rule.reward
+        return self.__default
+
+    def evaluate(self, actions: np.ndarray, terminals: np.ndarray, leaves: np.ndarray, visits: int) -> np.ndarray:
+        """
+        Evaluates the rules on every node at once.
+        :param actions: The UIAction value each node is entered through.
+        :param terminals: The terminal flag of each node.
+        :param leaves: The leaf flag of each node.
+        :param visits: The visit count of every node, counting the current visit.
+        :return: The reward of each node. Integer rewards stay integers.
+        """
+        conditions = [rule.matches_many(actions, terminals, leaves, visits) for rule in self.__rules]
+        return np.select(conditions, [rule.reward for rule in self.__rules], default=self.__default)
+
+    def get_visit_levels(self) -> int:
+        """
+        :return: The number of visit counts the rewards can differ between: rewards on the n-th visit of a node, for n
+        from 1 to this number, the last one also covering any later visit.
+        """
+        return max([1] + [rule.min_visits for rule in self.__rules if rule.min_visits is not None])
+
+    def is_visit_dependent(self) -> bool:
+        return self.get_visit_levels() > 1
+
+
+def reward_rules(rules: RewardRules) -> Callable:
+    """
+    Decorates a reward function computing the same rewards as rules, so training can evaluate the rules in bulk
+    instead of calling the function on every step.
+    :param rules: The equivalent rules.
+    """
+    def decorate(reward_func: Callable) -> Callable:
+        reward_func.reward_rules = rules
+        return reward_func
+    return decorate
+
+
+def get_reward_rules(reward_func: Callable) -> Optional[RewardRules]:
+    """
+    :param reward_func: A reward function.
+    :return: The rules the reward function is declared with, or None if it is an arbitrary function.
+    """
+    if isinstance(reward_func, RewardRules):
+        return reward_func
+    return getattr(reward_func, "reward_rules", None)
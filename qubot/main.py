@@ -1,26 +1,104 @@
 #!/usr/bin/env python3
 
 import argparse
-from sys import path
+from sys import path, exit
 from os import getcwd
 from os.path import join, dirname, abspath
 path.append(abspath(join(dirname(__file__), '..')))
 
-from qubot.config.qubot import Qubot
-from qubot.utils.io import write_json
+from qubot.utils.io import read_json, write_json
+from qubot.utils.profiler import get_profiler, profile_to_file, PROFILE_FORMAT_COLLAPSED, PROFILE_FORMAT_CPROFILE
 
 
 def main():
     parser = argparse.ArgumentParser(description='Run Qubot via command-line.',
-                                     usage='qubot [-h] config_file [--output_file OUTPUT_FILE]')
-    parser.add_argument('config_file', type=str, help='path to the Qubot configuration file')
+                                     usage='qubot [-h] config_file [config_file ...] [--output_file OUTPUT_FILE] [--sweep] '
+                                           '[--batch] [--output_dir OUTPUT_DIR] [--crawl_workers CRAWL_WORKERS] '
+                                           '[--processes PROCESSES] [--profile] [--profile_file PROFILE_FILE] '
+                                           '[--profile_format {collapsed,cprofile}]')
+    parser.add_argument('config_files', type=str, nargs='+', metavar='config_file',
+                        help='path to the Qubot configuration file, or with --batch, to any number of configuration '
+                             'files and manifests')
     parser.add_argument('--output_file', '-o', type=str, dest='output_file', default="qu_stats.qu.json",
                         help='the destination file to output the run stats into', required=False)
+    parser.add_argument('--sweep', action='store_true', dest='sweep', default=False,
+                        help='run every configuration of the \'sweep\' grid in the configuration file on one crawl',
+                        required=False)
+    parser.add_argument('--batch', action='store_true', dest='batch', default=False,
+                        help='crawl, train and test every app of the configuration files and manifests, writing each '
+                             'app\'s stats to the output directory as soon as it finishes', required=False)
+    parser.add_argument('--output_dir', type=str, dest='output_dir', default="qu_batch",
+                        help='the directory to write the trees and stats of a batch to', required=False)
+    parser.add_argument('--crawl_workers', type=int, dest='crawl_workers', default=2,
+                        help='the number of apps of a batch crawled at the same time', required=False)
+    parser.add_argument('--processes', '-p', type=int, dest='processes', default=None,
+                        help='the number of processes to sweep with, or to train and test the apps of a batch with '
+                             '(default: the number of CPUs)', required=False)
+    parser.add_argument('--profile', action='store_true', dest='profile', default=False,
+                        help='time WebDriver commands, node construction, hashing and Q-learning steps, print the '
+                             'timings and add them to the run stats under \'profile\'', required=False)
+    parser.add_argument('--profile_file', type=str, dest='profile_file', default=None,
+                        help='also profile the whole run into this file', required=False)
+    parser.add_argument('--profile_format', type=str, dest='profile_format', default=PROFILE_FORMAT_COLLAPSED,
+                        choices=[PROFILE_FORMAT_COLLAPSED, PROFILE_FORMAT_CPROFILE],
+                        help='the format of the profile file: flamegraph-compatible collapsed stacks of every thread, '
+                             'or cProfile stats of the main thread (default: collapsed)', required=False)
     args = parser.parse_args()
+    if len(args.config_files) > 1 and not args.batch:
+        parser.error('only --batch takes more than one config_file')
+    if args.batch and args.sweep:
+        parser.error('--batch and --sweep can\'t be combined')
 
-    qb = Qubot.from_file(args.config_file)
-    qb.run()
-    write_json(join(getcwd(), args.output_file), qb.get_stats().to_dict())
+    # Imported once the arguments are parsed, so --help and argument errors don't wait for NumPy and gym to load
+    from qubot.config.qubot import Qubot
+    from qubot.config.sweep import sweep_grid_from_dict
+    from qubot.config.batch import run_batch, apps_from_files
+
+    if args.profile:
+        get_profiler().enable()
+
+    failed_count = 0
+    with profile_to_file(args.profile_file, args.profile_format):
+        if args.batch:
+            results = run_batch(apps_from_files(args.config_files), args.output_dir, args.crawl_workers, args.processes,
+                                print_batch_progress)
+            failed_count = sum(1 for result in results if not result.is_successful())
+            print("%d of %d apps finished, %d failed. Stats are in %s" % (len(results) - failed_count, len(results),
+                                                                          failed_count, args.output_dir))
+        elif args.sweep:
+            config = read_json(args.config_files[0])
+            model_params_grid, reward_funcs = sweep_grid_from_dict(config)
+            qb = Qubot.from_dict(config)
+            results = qb.sweep(model_params_grid, reward_funcs, args.processes)
+            write_json(join(getcwd(), args.output_file), [result.to_dict() for result in results])
+        else:
+            qb = Qubot.from_file(args.config_files[0])
+            qb.run()
+            stats = qb.get_stats().to_dict()
+            if args.profile:
+                stats["profile"] = get_profiler().to_dict()
+            write_json(join(getcwd(), args.output_file), stats)
+
+    if args.profile:
+        print_profile(get_profiler().to_dict())
+    if failed_count > 0:
+        exit(1)
+
+
+def print_batch_progress(stage: str, result, finished_count: int, app_count: int):
+    seconds = (result.crawl_seconds or 0) + (result.train_seconds or 0)
+    if result.error is not None:
+        print("[%d/%d] %s %s: %s" % (finished_count, app_count, result.app.name, stage, result.error))
+    else:
+        print("[%d/%d] %s %s (%.1fs)" % (finished_count, app_count, result.app.name, stage, seconds))
+
+def print_profile(profile: dict):
+    print("=============================")
+    print("Profile")
+    print("=============================")
+    print("%-36s %10s %12s %10s" % ("Operation", "Count", "Total (ms)", "Avg (ms)"))
+    for name, entry in profile.items():
+        print("%-36s %10d %12.1f %10.4f" % (name, entry["count"], entry["total_millis"], entry["avg_millis"]))
 
 if __name__ == "__main__":
     main()
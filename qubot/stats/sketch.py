@@ -0,0 +1,98 @@
+from typing import Dict, Optional
+from math import ceil, log
+
+class QuantileSketch:
+    """
+    A mergeable quantile sketch with bounded relative error (DDSketch). Values are counted in logarithmically sized
+    buckets, so memory grows with the logarithm of the range of the values rather than with their count.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Initializes an empty sketch.
+        :param relative_accuracy: The maximum relative error of the quantiles returned.
+        """
+        self.__relative_accuracy = relative_accuracy
+        self.__gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.__log_gamma = log(self.__gamma)
+        self.__positive_buckets: Dict[int, int] = {}
+        self.__negative_buckets: Dict[int, int] = {}
+        self.__zero_count = 0
+        self.__count = 0
+
+    def add(self, value: float):
+        if value > 0:
+            key = self.__get_key(value)
+            self.__positive_buckets[key] = self.__positive_buckets.get(key, 0) + 1
+        elif value < 0:
+            key = self.__get_key(-value)
+            self.__negative_buckets[key] = self.__negative_buckets.get(key, 0) + 1
+        else:
+            self.__zero_count += 1
+        self.__count += 1
+
+    def get_count(self) -> int:
+        return self.__count
+
+    def get_quantile(self, quantile: float) -> Optional[float]:
+        """
+        Estimates a quantile of the values added.
+        :param quantile: The quantile, between 0 and 1.
+        :return: The estimated value, or None if the sketch is empty.
+        """
+        if self.__count == 0:
+            return None
+        rank = quantile * (self.__count - 1)
+        seen = 0
+        for key in sorted(self.__negative_buckets, reverse=True):
+            seen += self.__negative_buckets[key]
+            if seen > rank:
+                return -self.__get_value(key)
+        seen += self.__zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.__positive_buckets):
+            seen += self.__positive_buckets[key]
+            if seen > rank:
+                return self.__get_value(key)
+        return self.__get_value(max(self.__positive_buckets))
+
+    def merge(self, other: 'QuantileSketch'):
+        if other.__gamma != self.__gamma:
+            raise Exception("cannot merge sketches with different accuracies")
+        for key, count in other.__positive_buckets.items():
+            self.__positive_buckets[key] = self.__positive_buckets.get(key, 0) + count
+        for key, count in other.__negative_buckets.items():
+            self.__negative_buckets[key] = self.__negative_buckets.get(key, 0) + count
+        self.__zero_count += other.__zero_count
+        self.__count += other.__count
+
+    def to_dict(self) -> Dict:
+        # Buckets are listed as [key, count] pairs, as JSON object keys can't be integers
+        return {
+            "relative_accuracy": self.__relative_accuracy,
+            "positive_buckets": [[key, count] for key, count in self.__positive_buckets.items()],
+            "negative_buckets": [[key, count] for key, count in self.__negative_buckets.items()],
+            "zero_count": self.__zero_count,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict) -> 'QuantileSketch':
+        sketch = QuantileSketch(data["relative_accuracy"])
+        sketch.__positive_buckets = {int(key): count for key, count in data["positive_buckets"]}
+        sketch.__negative_buckets = {int(key): count for key, count in data["negative_buckets"]}
+        sketch.__zero_count = data["zero_count"]
+        sketch.__count = sketch.__zero_count + sum(sketch.__positive_buckets.values()) + sum(sketch.__negative_buckets.values())
+        return sketch
+
+    def copy(self) -> 'QuantileSketch':
+        sketch = QuantileSketch(self.__relative_accuracy)
+        sketch.merge(self)
+        return sketch
+
+    def __get_key(self, value: float) -> int:
+        return int(ceil(log(value) / self.__log_gamma))
+
+    def __get_value(self, key: int) -> float:
+        # The midpoint of the bucket (gamma^(key-1), gamma^key], within the relative accuracy of all its values
+        return 2 * self.__gamma ** key / (self.__gamma + 1)
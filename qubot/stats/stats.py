@@ -1,15 +1,127 @@
 from typing import Dict, Optional, Union
+from collections import deque
 from datetime import date
-from copy import deepcopy
+from numbers import Number
 from time import time
+from threading import Lock
+import json
+from sys import path
+from os.path import join, dirname, abspath
+path.append(join(dirname(__file__), '../..'))
+
+from qubot.stats.sketch import QuantileSketch
+
+class StatAggregate:
+    """
+    Running count, sum, min, max and quantile sketch of a stream of numbers. Updates are O(1) and memory doesn't grow
+    with the number of values.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch()
+
+    def add(self, value: Number):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+        self.sketch.add(value)
+
+    def get_mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def get_percentile(self, percentile: float) -> Optional[float]:
+        return self.sketch.get_quantile(percentile / 100)
+
+    def copy(self) -> 'StatAggregate':
+        aggregate = StatAggregate()
+        aggregate.count, aggregate.sum, aggregate.min, aggregate.max = self.count, self.sum, self.min, self.max
+        aggregate.sketch = self.sketch.copy()
+        return aggregate
+
+    def to_dict(self) -> Dict:
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max, "sketch": self.sketch.to_dict()}
+
+    @staticmethod
+    def from_dict(data: Dict) -> 'StatAggregate':
+        aggregate = StatAggregate()
+        aggregate.count, aggregate.sum, aggregate.min, aggregate.max = data["count"], data["sum"], data["min"], data["max"]
+        aggregate.sketch = QuantileSketch.from_dict(data["sketch"])
+        return aggregate
+
+
+class SpillWriter:
+    """
+    Appends the events of every Stats object spilling to the same file. Each event is written and flushed as a whole
+    line under a lock, so the events of drivers, environments and threads never interleave within a line.
+    """
+
+    def __init__(self, spill_path: str):
+        self.__spill_path = spill_path
+        self.__lock = Lock()
+        self.__file = None
+
+    def write_line(self, line: str):
+        with self.__lock:
+            if self.__file is None:
+                self.__file = open(self.__spill_path, "a")
+            self.__file.write(line + "\n")
+            self.__file.flush()
+
+    def close(self):
+        """
+        Closes the file. It's reopened if more lines are written.
+        """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+
+_spill_writers: Dict[str, SpillWriter] = {}
+_spill_writers_lock = Lock()
+
+def get_spill_writer(spill_path: str) -> SpillWriter:
+    """
+    :param spill_path: A JSONL file.
+    :return: The writer shared by every Stats object of the process spilling to the file.
+    """
+    key = abspath(spill_path)
+    with _spill_writers_lock:
+        if key not in _spill_writers:
+            _spill_writers[key] = SpillWriter(key)
+        return _spill_writers[key]
+
 
 class Stats:
 
-    def __init__(self, stat_class: str):
+    def __init__(self, stat_class: str, max_events: Optional[int] = None, spill_path: Optional[str] = None):
+        """
+        Initializes an empty set of stats.
+        :param stat_class: The name of the class the stats are about.
+        :param max_events: The number of most recent events and times to keep per stat, or None to keep all of them.
+        Counts and aggregates always cover every event.
+        :param spill_path: A JSONL file to append every recorded event to, or None.
+        """
         self.stat_class = stat_class
+        self.__max_events = max_events
+        self.__spill_path = spill_path
         self.__stats = {}
+        self.__aggregates: Dict[str, StatAggregate] = {}
         self.__pending_timers = {}
 
+    def get_max_events(self) -> Optional[int]:
+        return self.__max_events
+
+    def get_spill_path(self) -> Optional[str]:
+        return self.__spill_path
+
     def record(self, stat_name: str, event: any):
         if stat_name not in self.__stats:
             self.empty_events(stat_name)
@@ -19,6 +131,9 @@ class Stats:
             event["recorded_at"] = str(date.today())
         self.__stats[stat_name]["count"] += 1
         self.__stats[stat_name]["events"].append(event)
+        if isinstance(event, Number) and not isinstance(event, bool):
+            self.__aggregates[stat_name].add(event)
+        self.__spill(stat_name, event)
 
     def increment(self, stat_name: str, count=1):
         if stat_name not in self.__stats:
@@ -36,12 +151,15 @@ class Stats:
 
     def empty_counter(self, stat_name: str):
         self.__stats[stat_name] = 0
+        self.__aggregates.pop(stat_name, None)
 
     def empty_events(self, stat_name: str):
-        self.__stats[stat_name] = {"count": 0, "events": []}
+        self.__stats[stat_name] = {"count": 0, "events": self.__new_event_buffer()}
+        self.__aggregates[stat_name] = StatAggregate()
 
     def empty_timers(self, stat_name: str):
-        self.__stats[stat_name] = {"avg_millis": 0, "max_millis": 0, "min_millis": 0, "times": []}
+        self.__stats[stat_name] = {"avg_millis": 0, "max_millis": 0, "min_millis": 0, "times": self.__new_event_buffer()}
+        self.__aggregates[stat_name] = StatAggregate()
 
     def set(self, stat_name: str, value: any):
         if stat_name in self.__stats:
@@ -53,28 +171,113 @@ class Stats:
             return None
         elif isinstance(self.__stats[stat_name], int):
             return self.__stats[stat_name]
-        return self.__stats[stat_name]["events"]
+        elif "times" in self.__stats[stat_name]:
+            return list(self.__stats[stat_name]["times"])
+        return list(self.__stats[stat_name]["events"])
 
     def get_count(self, stat_name: str) -> int:
         if stat_name not in self.__stats:
             return 0
         elif isinstance(self.__stats[stat_name], int):
             return self.__stats[stat_name]
+        elif stat_name in self.__aggregates and "times" in self.__stats[stat_name]:
+            return self.__aggregates[stat_name].count
         return self.__stats[stat_name]["count"]
 
+    def get_sum(self, stat_name: str) -> Number:
+        """
+        :return: The sum of every numeric event or time of the stat, including those no longer retained.
+        """
+        if stat_name not in self.__aggregates:
+            return self.get(stat_name) if isinstance(self.get(stat_name), int) else 0
+        return self.__aggregates[stat_name].sum
+
+    def get_mean(self, stat_name: str) -> Optional[float]:
+        return self.__aggregates[stat_name].get_mean() if stat_name in self.__aggregates else None
+
+    def get_percentile(self, stat_name: str, percentile: float) -> Optional[float]:
+        """
+        Estimates a percentile of the numeric events or times of a stat, within 1% relative error.
+        :param stat_name: The stat.
+        :param percentile: The percentile, between 0 and 100.
+        :return: The estimated value, or None if there are no numeric events.
+        """
+        return self.__aggregates[stat_name].get_percentile(percentile) if stat_name in self.__aggregates else None
+
     def reset(self):
         self.__stats = {}
+        self.__aggregates = {}
+
+    def close(self):
+        """
+        Closes the spill file, shared with every other Stats object spilling to it. It's reopened if more events are
+        recorded.
+        """
+        if self.__spill_path is not None:
+            get_spill_writer(self.__spill_path).close()
 
     def to_dict(self) -> Dict:
-        return self.__stats
+        stats = {}
+        for stat_name, value in self.__stats.items():
+            if not isinstance(value, dict) or stat_name not in self.__aggregates:
+                stats[stat_name] = value
+                continue
+            aggregate = self.__aggregates[stat_name]
+            stat = {name: (list(stat_value) if isinstance(stat_value, deque) else stat_value) for name, stat_value in value.items()}
+            if "times" in value:
+                stat["count"] = aggregate.count
+                for percentile in StatAggregate.PERCENTILES:
+                    stat["p%d_millis" % percentile] = aggregate.get_percentile(percentile)
+            elif aggregate.count:
+                stat["sum"] = aggregate.sum
+                stat["min"] = aggregate.min
+                stat["max"] = aggregate.max
+                stat["avg"] = aggregate.get_mean()
+                for percentile in StatAggregate.PERCENTILES:
+                    stat["p%d" % percentile] = aggregate.get_percentile(percentile)
+            # The aggregate covers the events and times no longer retained, so it is written whole for from_dict
+            stat["aggregate"] = aggregate.to_dict()
+            stats[stat_name] = stat
+        return stats
+
+    @staticmethod
+    def from_dict(stat_class: str, stats: Dict, max_events: Optional[int] = None, spill_path: Optional[str] = None) -> 'Stats':
+        """
+        Rebuilds stats written by to_dict. The events and times restored aren't spilled again.
+        :param stat_class: The name of the class the stats are about.
+        :param stats: The written stats.
+        :param max_events: The number of most recent events and times to keep per stat, or None to keep all of them.
+        :param spill_path: A JSONL file to append every event recorded from now on to, or None.
+        :return: The stats.
+        """
+        new_stats = Stats(stat_class, max_events, spill_path)
+        for stat_name, value in stats.items():
+            if isinstance(value, dict) and "times" in value:
+                new_stats.empty_timers(stat_name)
+                new_stats.__stats[stat_name]["times"].extend(value["times"])
+                aggregate = new_stats.__restore_aggregate(stat_name, value, value["times"])
+                new_stats.__stats[stat_name]["max_millis"] = aggregate.max
+                new_stats.__stats[stat_name]["min_millis"] = aggregate.min
+                new_stats.__stats[stat_name]["avg_millis"] = aggregate.get_mean()
+            elif isinstance(value, dict) and "events" in value and "count" in value:
+                new_stats.empty_events(stat_name)
+                new_stats.__stats[stat_name]["events"].extend(value["events"])
+                new_stats.__restore_aggregate(stat_name, value, value["events"])
+                # Older events may not have been retained, but they still count
+                new_stats.__stats[stat_name]["count"] = value["count"]
+            else:
+                new_stats.__stats[stat_name] = value
+        return new_stats
 
     def merge(self, other):
-        new_stats = deepcopy(self.__stats)
-        other_stats = deepcopy(other.to_dict())
-        for stat_name in other_stats:
-            if stat_name not in new_stats:
-                new_stats[stat_name] = other_stats[stat_name]
-        self.__stats = new_stats
+        for stat_name, value in other.__stats.items():
+            if stat_name in self.__stats:
+                continue
+            if isinstance(value, dict):
+                value = {name: (self.__new_event_buffer(stat_value) if isinstance(stat_value, (list, deque)) else stat_value) for name, stat_value in value.items()}
+            self.__stats[stat_name] = value
+            if stat_name in other.__aggregates:
+                self.__aggregates[stat_name] = other.__aggregates[stat_name].copy()
         return self
 
     def start_timer(self, stat_name: str):
@@ -86,21 +289,38 @@ class Stats:
             raise Exception("'%s' timer not started" % stat_name)
         if stat_name not in self.__stats:
             self.empty_timers(stat_name)
-        time_millis = stop_millis - self.__pending_timers[stat_name]
+        self.__add_time(stat_name, stop_millis - self.__pending_timers[stat_name])
+
+    def __add_time(self, stat_name: str, time_millis: float):
+        aggregate = self.__aggregates[stat_name]
+        aggregate.add(time_millis)
         self.__stats[stat_name]["times"].append(time_millis)
-        max_millis = self.__stats[stat_name]["times"][0]
-        min_millis = self.__stats[stat_name]["times"][0]
-        sum_millis = 0
-        for time_millis in self.__stats[stat_name]["times"]:
-            if time_millis > max_millis:
-                max_millis = time_millis
-            if time_millis < min_millis:
-                min_millis = time_millis
-            sum_millis += time_millis
-        avg_millis = sum_millis / len(self.__stats[stat_name]["times"])
-        self.__stats[stat_name]["max_millis"] = max_millis
-        self.__stats[stat_name]["min_millis"] = min_millis
-        self.__stats[stat_name]["avg_millis"] = avg_millis
+        self.__stats[stat_name]["max_millis"] = aggregate.max
+        self.__stats[stat_name]["min_millis"] = aggregate.min
+        self.__stats[stat_name]["avg_millis"] = aggregate.get_mean()
+        self.__spill(stat_name, time_millis)
+
+    def __restore_aggregate(self, stat_name: str, value: Dict, events: list) -> StatAggregate:
+        """
+        Restores the aggregate of a written stat. Stats written without one are aggregated from their events.
+        """
+        if "aggregate" in value:
+            self.__aggregates[stat_name] = StatAggregate.from_dict(value["aggregate"])
+        else:
+            for event in events:
+                if isinstance(event, Number) and not isinstance(event, bool):
+                    self.__aggregates[stat_name].add(event)
+        return self.__aggregates[stat_name]
+
+    def __new_event_buffer(self, events=()) -> Union[list, deque]:
+        if self.__max_events is None:
+            return list(events)
+        return deque(events, maxlen=self.__max_events)
+
+    def __spill(self, stat_name: str, event: any):
+        if self.__spill_path is None:
+            return
+        get_spill_writer(self.__spill_path).write_line(json.dumps({"stat_class": self.stat_class, "stat": stat_name, "event": event}, default=str))
 
     def __str__(self):
-        return str(self.__stats)
+        return str(self.to_dict())
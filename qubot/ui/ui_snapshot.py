@@ -0,0 +1,364 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from hashlib import sha256
+from html.parser import HTMLParser
+from uuid import uuid4
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../..'))
+
+from qubot.utils.columns import StringTable, get_index_dtype
+
+# Serializes the DOM under arguments[0] (or the document element) into nested [tag, [name, value, ...], [children]]
+# arrays, where each child is either a text string or another element array. Comments are skipped.
+SNAPSHOT_SCRIPT = """
+function snap(el) {
+    var attrs = [];
+    for (var i = 0; i < el.attributes.length; i++) {
+        attrs.push(el.attributes[i].name, el.attributes[i].value);
+    }
+    var children = [];
+    for (var c = el.firstChild; c; c = c.nextSibling) {
+        if (c.nodeType === 1) {
+            children.push(snap(c));
+        } else if (c.nodeType === 3) {
+            children.push(c.nodeValue);
+        }
+    }
+    return [el.localName, attrs, children];
+}
+return snap(arguments[0] || document.documentElement);
+"""
+
+# Walks the element children of the document element along the given index path and returns the live element
+RESOLVE_SCRIPT = """
+var el = document.documentElement;
+var path = arguments[0];
+for (var i = 0; i < path.length && el; i++) {
+    el = el.children[path[i]];
+}
+return el || null;
+"""
+
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+RAW_TEXT_ELEMENTS = {"script", "style", "xmp", "iframe", "noembed", "noframes", "plaintext", "noscript"}
+
+
+class UIElementSnapshot:
+    """
+    A detached, driver-free copy of a DOM element. Mimics the parts of the Selenium WebElement API used by the UITree,
+    so a whole page can be scraped in a single WebDriver call and the live element resolved only when it is needed.
+    """
+
+    __slots__ = ("tag_name", "attributes", "children", "parent", "path", "__id", "__hash")
+
+    def __init__(self, tag_name: str, attributes: dict = None, parent: 'UIElementSnapshot' = None, child_path: tuple = ()):
+        self.tag_name = tag_name
+        self.attributes = attributes if attributes is not None else {}
+        self.children: List[Union['UIElementSnapshot', str]] = []
+        self.parent = parent
+        self.path = child_path
+        self.__id = None
+        self.__hash = None
+
+    @property
+    def id(self) -> str:
+        if self.__id is None:
+            self.__id = str(uuid4())
+        return self.__id
+
+    @property
+    def text(self) -> str:
+        return self.get_attribute("textContent").strip()
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        if name == "outerHTML":
+            return self.__serialize(True)
+        elif name == "innerHTML":
+            return self.__serialize(False)
+        elif name == "textContent":
+            return ''.join(self.__iter_text())
+        elif name == "type" and self.tag_name == "input" and "type" not in self.attributes:
+            # Selenium reports the property value, which defaults to "text" for inputs
+            return "text"
+        elif name in ["id", "class"]:
+            return self.attributes.get(name, "")
+        return self.attributes.get(name)
+
+    def get_hash(self) -> str:
+        """
+        Hashes the element structurally, from its tag, attributes, text and its element children's hashes. Hashes are
+        memoized, so hashing every element of a page is linear in the size of the page.
+        :return: The hex digest of the element.
+        """
+        if self.__hash is None:
+            digest = sha256(self.tag_name.encode('utf-8'))
+            for name, value in self.attributes.items():
+                digest.update(("\x00%s\x00%s" % (name, value)).encode('utf-8'))
+            text_run = []
+            for child in self.children:
+                if isinstance(child, UIElementSnapshot):
+                    if text_run:
+                        # Adjacent text nodes hash the same however the DOM happened to split them
+                        digest.update(("\x01%s" % ''.join(text_run)).encode('utf-8'))
+                        text_run = []
+                    digest.update(("\x02%s" % child.get_hash()).encode('utf-8'))
+                else:
+                    text_run.append(child)
+            if text_run:
+                digest.update(("\x01%s" % ''.join(text_run)).encode('utf-8'))
+            self.__hash = digest.hexdigest()
+        return self.__hash
+
+    def get_root(self) -> 'UIElementSnapshot':
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        return root
+
+    def find_element_by_path(self, child_path: tuple) -> Optional['UIElementSnapshot']:
+        """
+        Walks down the element children of this snapshot along an index path.
+        :param child_path: Indices among the element children at each level.
+        :return: The element at the end of the path, or None if the path doesn't exist.
+        """
+        element = self
+        for index in child_path:
+            children = element.get_element_children()
+            if index >= len(children):
+                return None
+            element = children[index]
+        return element
+
+    def get_element_children(self) -> List['UIElementSnapshot']:
+        return [child for child in self.children if isinstance(child, UIElementSnapshot)]
+
+    def find_elements_by_xpath(self, xpath: str) -> List['UIElementSnapshot']:
+        if xpath != "./*":
+            raise Exception("snapshots only support the './*' xpath")
+        return self.get_element_children()
+
+    def resolve(self, web_driver):
+        """
+        Finds the live element this snapshot was taken from.
+        :param web_driver: The Selenium WebDriver currently displaying the page.
+        :return: The live WebElement or None if it no longer exists.
+        """
+        return web_driver.execute_script(RESOLVE_SCRIPT, list(self.path))
+
+    def __iter_text(self):
+        for child in self.children:
+            if isinstance(child, UIElementSnapshot):
+                yield from child.__iter_text()
+            else:
+                yield child
+
+    def __serialize(self, include_self: bool) -> str:
+        parts = []
+
+        def write(element: UIElementSnapshot, outer: bool):
+            if outer:
+                parts.append("<%s" % element.tag_name)
+                for name, value in element.attributes.items():
+                    parts.append(" %s=\"%s\"" % (name, escape_attribute(value)))
+                parts.append(">")
+                if element.tag_name in VOID_ELEMENTS:
+                    return
+            for child in element.children:
+                if isinstance(child, UIElementSnapshot):
+                    write(child, True)
+                elif element.tag_name in RAW_TEXT_ELEMENTS:
+                    parts.append(child)
+                else:
+                    parts.append(escape_text(child))
+            if outer:
+                parts.append("</%s>" % element.tag_name)
+
+        write(self, include_self)
+        return ''.join(parts)
+
+    def to_list(self) -> list:
+        """
+        Serializes the snapshot back into the nested arrays read by from_list.
+        :return: A [tag, [name, value, ...], [children]] array.
+        """
+        flat_attributes = []
+        for name, value in self.attributes.items():
+            flat_attributes += [name, value]
+        children = []
+        for child in self.children:
+            children.append(child.to_list() if isinstance(child, UIElementSnapshot) else child)
+        return [self.tag_name, flat_attributes, children]
+
+    @staticmethod
+    def from_list(compact: list, parent: 'UIElementSnapshot' = None, child_path: tuple = ()) -> 'UIElementSnapshot':
+        """
+        Builds a snapshot tree from the nested arrays returned by SNAPSHOT_SCRIPT.
+        :param compact: A [tag, [name, value, ...], [children]] array.
+        :param parent: The parent snapshot, if any.
+        :param child_path: Indices of this element among its ancestors' element children.
+        :return: The root UIElementSnapshot.
+        """
+        tag_name, flat_attributes, children = compact
+        attributes = {flat_attributes[i]: flat_attributes[i + 1] for i in range(0, len(flat_attributes), 2)}
+        element = UIElementSnapshot(tag_name, attributes, parent, child_path)
+        element_index = 0
+        for child in children:
+            if isinstance(child, str):
+                element.children.append(child)
+            else:
+                element.children.append(UIElementSnapshot.from_list(child, element, child_path + (element_index,)))
+                element_index += 1
+        return element
+
+    def __repr__(self):
+        return "<UIElementSnapshot %s %s>" % (self.tag_name, list(self.path))
+
+
+def escape_text(text: str) -> str:
+    return text.replace("&", "&amp;").replace("\u00a0", "&nbsp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def escape_attribute(value: str) -> str:
+    return value.replace("&", "&amp;").replace("\u00a0", "&nbsp;").replace("\"", "&quot;")
+
+class UISnapshotParser(HTMLParser):
+    """
+    Builds UIElementSnapshots from markup, such as the outerHTML of a live element.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root: Optional[UIElementSnapshot] = None
+        self.__open_elements: List[UIElementSnapshot] = []
+        self.__element_counts: List[int] = []
+
+    def handle_starttag(self, tag: str, attrs: list):
+        if self.__open_elements:
+            parent = self.__open_elements[-1]
+            element = UIElementSnapshot(tag, {name: value if value is not None else "" for name, value in attrs},
+                                        parent, parent.path + (self.__element_counts[-1],))
+            parent.children.append(element)
+            self.__element_counts[-1] += 1
+        elif self.root is None:
+            element = UIElementSnapshot(tag, {name: value if value is not None else "" for name, value in attrs})
+            self.root = element
+        else:
+            return
+        if tag not in VOID_ELEMENTS:
+            self.__open_elements.append(element)
+            self.__element_counts.append(0)
+
+    def handle_startendtag(self, tag: str, attrs: list):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag: str):
+        for i in range(len(self.__open_elements) - 1, -1, -1):
+            if self.__open_elements[i].tag_name == tag:
+                del self.__open_elements[i:]
+                del self.__element_counts[i:]
+                return
+
+    def handle_data(self, data: str):
+        if self.__open_elements:
+            self.__open_elements[-1].children.append(data)
+
+
+def parse_html(html: str) -> UIElementSnapshot:
+    """
+    Parses markup into a snapshot of its first top-level element.
+    :param html: The markup to parse.
+    :return: The snapshot of the first element.
+    """
+    parser = UISnapshotParser()
+    parser.feed(html)
+    parser.close()
+    if parser.root is None:
+        raise Exception("no element found in the markup")
+    return parser.root
+
+def snapshot_dom(web_driver) -> UIElementSnapshot:
+    """
+    Scrapes the entire DOM of the current page in one WebDriver round-trip.
+    :param web_driver: The Selenium WebDriver displaying the page.
+    :return: The snapshot of the <html> element.
+    """
+    return UIElementSnapshot.from_list(web_driver.execute_script(SNAPSHOT_SCRIPT))
+
+def snapshots_to_columns(roots: List[UIElementSnapshot], strings: StringTable) -> Tuple[Dict[str, np.ndarray], Dict[int, int]]:
+    """
+    Flattens whole pages into columns of DOM items, the elements and text nodes of every page in document order.
+    :param roots: The root snapshots of the pages.
+    :param strings: The table to add tag names, attributes and texts to.
+    :return: The columns, and the index of each element's item keyed by the id() of its snapshot.
+    """
+    item_parents, item_is_text, item_values, attribute_offsets, attribute_names, attribute_values = [], [], [], [0], [], []
+    document_offsets = [0]
+    item_indices: Dict[int, int] = {}
+    for root in roots:
+        stack = [(root, -1)]
+        while stack:
+            item, parent_index = stack.pop()
+            item_parents.append(parent_index)
+            if isinstance(item, UIElementSnapshot):
+                item_indices[id(item)] = len(item_parents) - 1
+                item_is_text.append(False)
+                item_values.append(strings.add(item.tag_name))
+                for name, value in item.attributes.items():
+                    attribute_names.append(strings.add(name))
+                    attribute_values.append(strings.add(value))
+                stack.extend((child, len(item_parents) - 1) for child in reversed(item.children))
+            else:
+                item_is_text.append(True)
+                item_values.append(strings.add(item))
+            attribute_offsets.append(len(attribute_names))
+        document_offsets.append(len(item_parents))
+    item_dtype, string_dtype = get_index_dtype(len(item_parents)), strings.get_index_dtype()
+    return {
+        "document_offsets": np.array(document_offsets, dtype=item_dtype),
+        "item_parents": np.array(item_parents, dtype=item_dtype),
+        "item_is_text": np.array(item_is_text, dtype=bool),
+        "item_values": np.array(item_values, dtype=string_dtype),
+        "attribute_offsets": np.array(attribute_offsets, dtype=get_index_dtype(len(attribute_names))),
+        "attribute_names": np.array(attribute_names, dtype=string_dtype),
+        "attribute_values": np.array(attribute_values, dtype=string_dtype),
+    }, item_indices
+
+def snapshots_from_columns(columns: Dict[str, np.ndarray], strings: Sequence[str], start=0, end: int = None) -> List[Optional[UIElementSnapshot]]:
+    """
+    Rebuilds the pages flattened with snapshots_to_columns.
+    :param columns: The columns.
+    :param strings: The strings the columns index into.
+    :param start: The first item to rebuild, which must start a page (see the document_offsets column).
+    :param end: The item after the last one to rebuild, which must end a page, or None to rebuild every page after start.
+    :return: The snapshot of each item from start to end, or None for text items.
+    """
+    end = len(columns["item_parents"]) if end is None else end
+    item_parents = (columns["item_parents"][start:end] - start).tolist()
+    item_is_text = columns["item_is_text"][start:end].tolist()
+    item_values = columns["item_values"][start:end].tolist()
+    attribute_offsets = columns["attribute_offsets"][start:end + 1].tolist()
+    attribute_start = attribute_offsets[0]
+    attribute_names = columns["attribute_names"][attribute_start:attribute_offsets[-1]].tolist()
+    attribute_values = columns["attribute_values"][attribute_start:attribute_offsets[-1]].tolist()
+    elements: List[Optional[UIElementSnapshot]] = [None] * len(item_parents)
+    # Number of element children each element has so far, to build their paths
+    element_counts = [0] * len(item_parents)
+    for index, parent_index in enumerate(item_parents):
+        # Page roots have no parent, which start shifted below 0
+        parent = elements[parent_index] if parent_index >= 0 else None
+        if item_is_text[index]:
+            parent.children.append(strings[item_values[index]])
+            continue
+        attributes = {strings[attribute_names[i]]: strings[attribute_values[i]]
+                      for i in range(attribute_offsets[index] - attribute_start, attribute_offsets[index + 1] - attribute_start)}
+        if parent is None:
+            element = UIElementSnapshot(strings[item_values[index]], attributes)
+        else:
+            element = UIElementSnapshot(strings[item_values[index]], attributes, parent,
+                                        parent.path + (element_counts[parent_index],))
+            element_counts[parent_index] += 1
+            parent.children.append(element)
+        elements[index] = element
+    return elements
@@ -1,50 +1,163 @@
-from typing import Tuple, List, Set, Optional, Dict, Callable
-from hashlib import sha256
-from selenium.webdriver.firefox.webelement import FirefoxWebElement
+import numpy as np
+from typing import Tuple, List, Optional, Dict, Callable, Union, TYPE_CHECKING
+from time import perf_counter
+from uuid import uuid4
 from sys import path
 from os.path import join, dirname
 path.append(join(dirname(__file__), '../..'))
 
 from qubot.ui.ui_action import UIAction
+from qubot.ui.ui_snapshot import UIElementSnapshot, parse_html, snapshots_to_columns, snapshots_from_columns
+from qubot.ui.ui_tree_index import UITreeMetadataIndex
 from qubot.utils.input_generation import is_generatable_input
+from qubot.utils.columns import read_columns, write_columns, StringTable, LazyStringTable, get_index_dtype
+from qubot.utils.io import read_pickle, write_pickle
+from qubot.utils.profiler import get_profiler
+
+if TYPE_CHECKING:
+    from selenium.webdriver.firefox.webelement import FirefoxWebElement
+
+# Tree files ending with this suffix are directories of columns rather than pickles
+TREE_COLUMNS_SUFFIX = ".qu.tree"
+TREE_COLUMNS_KIND = "ui_tree"
+
+class UITreeVersion:
+    """
+    A mutable counter shared by the nodes of a UITree, used to detect when the tree's index is stale.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
 
 class UITreeNode:
     """
-    A node within a UITree. Contains information on how to get to other nodes.
+    A node within a UITree. Contains information on how to get to other nodes. Nodes don't copy any markup: their
+    content is read on demand from the snapshot of the element they were built from.
     """
 
-    def __init__(self, element: FirefoxWebElement, is_terminal=False, parent=None):
+    __slots__ = ("__element", "__snapshot", "__id", "__tag_name", "__html_id", "__html_class", "__hash",
+                 "__transitions", "__children_loader", "__visit_count", "__is_terminal", "__parent", "__version")
+
+    def __init__(self, element: Union['FirefoxWebElement', UIElementSnapshot], is_terminal=False, parent=None,
+                 snapshot: UIElementSnapshot = None):
+        """
+        :param element: The element of the node, either a snapshot or a live element.
+        :param is_terminal: Is the node terminal?
+        :param parent: The parent of the node, if any.
+        :param snapshot: The snapshot of a live element, found in the snapshot of its page. Without it, the live
+        element's markup is fetched and parsed, which should only be needed for the root of a page.
+        """
+        profiler = get_profiler()
+        start = perf_counter() if profiler.is_enabled() else None
         self.__element = element
+        # Live elements are read through a snapshot, so their content outlives the page they're on
+        if isinstance(element, UIElementSnapshot):
+            self.__snapshot = element
+        else:
+            self.__snapshot = snapshot if snapshot is not None else parse_html(element.get_attribute('outerHTML'))
         self.__id = self.__element.id
-        self.__tag_name = self.__element.tag_name
-        self.__content = self.__element.get_attribute('outerHTML')
-        self.__inner_content = self.__element.get_attribute('innerHTML')
-        self.__html_id = self.__element.get_attribute("id")
-        self.__html_class = self.__element.get_attribute("class")
-        self.__hash = sha256(self.__content.encode('utf-8')).hexdigest()
+        self.__tag_name = self.__snapshot.tag_name
+        self.__html_id = self.__snapshot.get_attribute("id")
+        self.__html_class = self.__snapshot.get_attribute("class")
+        if start is not None:
+            hash_start = perf_counter()
+            self.__hash = self.__snapshot.get_hash()
+            profiler.add("ui_tree_node.hash", perf_counter() - hash_start)
+        else:
+            self.__hash = self.__snapshot.get_hash()
         self.__transitions = {}
+        self.__children_loader = None
         self.__visit_count = 0
         self.__is_terminal = is_terminal  # is this a terminal state?
         self.__parent = parent
+        # Shared by every node of the same tree and bumped whenever the tree's structure changes
+        self.__version = parent.__version if parent is not None else UITreeVersion()
+        if start is not None:
+            profiler.add("ui_tree_node.construct", perf_counter() - start)
+
+    @staticmethod
+    def get_element_hash(element: Union['FirefoxWebElement', UIElementSnapshot]) -> str:
+        """
+        Gets the hash a node built from the element would have, without building the node.
+        :param element: The element to hash.
+        :return: The hash of the element.
+        """
+        with get_profiler().time("ui_tree_node.hash"):
+            if isinstance(element, UIElementSnapshot):
+                return element.get_hash()
+            return parse_html(element.get_attribute('outerHTML')).get_hash()
 
-    def add_transition(self, element: FirefoxWebElement):
-        if element.tag_name in ["a", "button"]:
+    def add_transition(self, element: Union['FirefoxWebElement', UIElementSnapshot], snapshot: UIElementSnapshot = None):
+        """
+        Adds a child node for an element.
+        :param element: The element, either a snapshot or a live element.
+        :param snapshot: The snapshot of a live element (see UITreeNode).
+        """
+        self.__load_children()
+        node = UITreeNode(element, parent=self, snapshot=snapshot)
+        # Classify the element by its snapshot, so live elements don't cost WebDriver round-trips
+        if node.__snapshot.tag_name in ["a", "button"]:
             if UIAction.LEFT_CLICK not in self.__transitions:
                 self.__transitions[UIAction.LEFT_CLICK] = []
-            self.__transitions[UIAction.LEFT_CLICK].append(UITreeNode(element, parent=self))
-        elif is_generatable_input(element):
+            self.__transitions[UIAction.LEFT_CLICK].append(node)
+        elif is_generatable_input(node.__snapshot):
             if UIAction.INPUT not in self.__transitions:
                 self.__transitions[UIAction.INPUT] = []
-            self.__transitions[UIAction.INPUT].append(UITreeNode(element, parent=self))
+            self.__transitions[UIAction.INPUT].append(node)
         else:
             if UIAction.NAVIGATE not in self.__transitions:
                 self.__transitions[UIAction.NAVIGATE] = []
-            self.__transitions[UIAction.NAVIGATE].append(UITreeNode(element, parent=self))
+            self.__transitions[UIAction.NAVIGATE].append(node)
+        self.__version.value += 1
+
+    def add_element_children(self, elements: List[Union['FirefoxWebElement', UIElementSnapshot]], page_element: UIElementSnapshot):
+        """
+        Adds a child node for each element child of a page element.
+        :param elements: The element children, either snapshots or live elements.
+        :param page_element: The snapshot of the element they're the children of. Live elements are paired with its
+        element children by position, so a page's markup is only fetched and parsed once, at its root. If the page
+        changed since, and they no longer line up, each live element is parsed on its own instead.
+        """
+        snapshots = page_element.get_element_children()
+        if len(snapshots) != len(elements):
+            snapshots = [None] * len(elements)
+        for element, snapshot in zip(elements, snapshots):
+            self.add_transition(element, snapshot)
 
-    def get_element(self) -> FirefoxWebElement:
+    def graft(self, node: 'UITreeNode', stop_actions: Tuple[UIAction, ...] = ()) -> List[Tuple[UIAction, 'UITreeNode']]:
+        """
+        Copies the subtree under a node of another tree, e.g. from an earlier crawl, under this node. The copies share
+        the other tree's snapshots, and start unvisited with ids of their own, so a subtree can be grafted more than once.
+        :param node: The node whose descendants to copy.
+        :param stop_actions: The descendants entered through these actions are copied without their own descendants.
+        :return: The copies entered through one of stop_actions, with their actions.
+        """
+        stops = []
+        stack = [(node, self)]
+        while stack:
+            source, target = stack.pop()
+            copies = []
+            for action, child in source.get_transition_tuples():
+                copy = UITreeNode.from_snapshot(child.__snapshot, str(uuid4()), child.__hash, child.__is_terminal, target, action)
+                if action in stop_actions:
+                    stops.append((action, copy))
+                else:
+                    copies.append((child, copy))
+            stack.extend(reversed(copies))
+        self.__version.value += 1
+        return stops
+
+    def get_element(self) -> Union['FirefoxWebElement', UIElementSnapshot]:
         return self.__element
 
+    def get_snapshot(self) -> UIElementSnapshot:
+        return self.__snapshot
+
     def get_children(self) -> List:
+        self.__load_children()
         children = []
         for action in self.__transitions:
             for child in self.__transitions[action]:
@@ -52,21 +165,33 @@ class UITreeNode:
         return children
 
     def get_transitions(self) -> dict:
+        self.__load_children()
         return self.__transitions
 
     def get_transition_tuples(self) -> List[Tuple[UIAction, any]]:
+        self.__load_children()
         tups = []
         for action, transitions in list(self.__transitions.items()):
             for t in transitions:
                 tups.append((action, t))
         return tups
 
+    def get_version(self) -> int:
+        """
+        Gets the structure version of the tree this node belongs to.
+        :return: A number that changes every time a transition is added anywhere in the tree.
+        """
+        return self.__version.value
+
     def get_parent(self) -> Optional['UITreeNode']:
         return self.__parent
 
     def get_id(self) -> str:
         return self.__id
 
+    def get_tag_name(self) -> str:
+        return self.__tag_name
+
     def get_hash(self) -> str:
         return self.__hash
 
@@ -77,7 +202,13 @@ class UITreeNode:
         return self.__html_class
 
     def get_content(self) -> str:
-        return self.__content
+        return self.__snapshot.get_attribute('outerHTML')
+
+    def get_inner_content(self) -> str:
+        return self.__snapshot.get_attribute('innerHTML')
+
+    def get_text(self) -> str:
+        return self.__snapshot.get_attribute('textContent')
 
     def get_visits(self) -> int:
         return self.__visit_count
@@ -97,8 +228,204 @@ class UITreeNode:
     def set_visits(self, visit_count: int):
         self.__visit_count = visit_count
 
+    def to_dict(self, documents: List[list], document_indices: Dict[int, int]) -> Dict:
+        """
+        Serializes this node, but not its transitions, without any references to the live driver. The pages the nodes
+        were built from are serialized once each into documents, and nodes only point into them.
+        :param documents: The serialized pages, appended to as new ones are met.
+        :param document_indices: Indices into documents, keyed by the id() of each page's root snapshot.
+        :return: A dict of plain Python values.
+        """
+        document = self.__snapshot.get_root()
+        if id(document) not in document_indices:
+            document_indices[id(document)] = len(documents)
+            documents.append(document.to_list())
+        return {
+            "id": self.__id,
+            "document": document_indices[id(document)],
+            "path": list(self.__snapshot.path),
+            "hash": self.__hash,
+            "is_terminal": self.__is_terminal,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict, documents: List[UIElementSnapshot], parent: 'UITreeNode' = None, action: UIAction = None) -> 'UITreeNode':
+        """
+        Rebuilds a node serialized with to_dict. The node's element is its snapshot, as the page it came from is gone.
+        :param data: The serialized node.
+        :param documents: The deserialized pages the nodes point into.
+        :param parent: The parent of the node, if any.
+        :param action: The action leading to the node from its parent, if any.
+        :return: The deserialized node, added to its parent's transitions.
+        """
+        document, child_path = documents[data["document"]], tuple(data["path"])
+        if parent is not None and child_path[:len(parent.__snapshot.path)] == parent.__snapshot.path \
+                and parent.__snapshot.get_root() is document:
+            # Most nodes are DOM descendants of their parent, so only walk the rest of the path
+            snapshot = parent.__snapshot.find_element_by_path(child_path[len(parent.__snapshot.path):])
+        else:
+            snapshot = document.find_element_by_path(child_path)
+        if snapshot is None:
+            raise Exception("node '%s' isn't in its serialized document" % data["id"])
+        return UITreeNode.from_snapshot(snapshot, data["id"], data["hash"], data["is_terminal"], parent, action)
+
+    @staticmethod
+    def from_snapshot(snapshot: UIElementSnapshot, node_id: str, node_hash: str, is_terminal: bool,
+                      parent: 'UITreeNode' = None, action: UIAction = None,
+                      children_loader: Callable[['UITreeNode'], None] = None) -> 'UITreeNode':
+        """
+        Rebuilds a serialized node from its snapshot, without rehashing it.
+        :param snapshot: The snapshot of the node's element, which becomes the node's element.
+        :param node_id: The serialized id of the node.
+        :param node_hash: The serialized hash of the node.
+        :param is_terminal: Is the node terminal?
+        :param parent: The parent of the node, if any.
+        :param action: The action leading to the node from its parent, if any.
+        :param children_loader: Builds the node's children the first time they are needed, or None if they are added
+        to it right away.
+        :return: The deserialized node, added to its parent's transitions.
+        """
+        node = UITreeNode.__new__(UITreeNode)
+        node.__element = snapshot
+        node.__snapshot = snapshot
+        node.__id = node_id
+        node.__tag_name = snapshot.tag_name
+        node.__html_id = snapshot.attributes.get("id", "")
+        node.__html_class = snapshot.attributes.get("class", "")
+        node.__hash = node_hash
+        node.__transitions = {}
+        node.__children_loader = children_loader
+        node.__visit_count = 0
+        node.__is_terminal = is_terminal
+        node.__parent = parent
+        node.__version = parent.__version if parent is not None else UITreeVersion()
+        if parent is not None:
+            if action not in parent.__transitions:
+                parent.__transitions[action] = []
+            parent.__transitions[action].append(node)
+        return node
+
+    def __load_children(self):
+        """
+        Builds the children of a node deserialized with a children loader, the first time they are needed.
+        """
+        if self.__children_loader is not None:
+            children_loader, self.__children_loader = self.__children_loader, None
+            children_loader(self)
+
+    def get_description(self) -> str:
+        """
+        Describes the node without its content, for logging.
+        :return: The node's opening tag and ID.
+        """
+        return "<%s id=\"%s\" class=\"%s\"> (%s)" % (self.__tag_name, self.__html_id, self.__html_class, self.__id)
+
     def __str__(self):
-        return "<%s id=\"%s\" class=\"%s\">%s (%s)" % (self.__tag_name, self.__html_id, self.__html_class, ("%s</%s>" % (self.__inner_content, self.__tag_name)) if self.__inner_content else "", self.__id)
+        inner_content = self.get_inner_content()
+        return "<%s id=\"%s\" class=\"%s\">%s (%s)" % (self.__tag_name, self.__html_id, self.__html_class, ("%s</%s>" % (inner_content, self.__tag_name)) if inner_content else "", self.__id)
+
+
+class UITreeColumns:
+    """
+    The columns of a tree read with UITree.from_columns. Nodes are built from them only once they are reached, along
+    with the pages they point into, so a tree can be trained on without building the nodes training never visits.
+    """
+
+    def __init__(self, meta: Dict, columns: Dict[str, np.ndarray]):
+        self.__columns = columns
+        self.__node_count = meta["node_count"]
+        self.__strings = LazyStringTable(columns["string_offsets"], columns["string_data"])
+        self.__documents: Dict[int, List[Optional[UIElementSnapshot]]] = {}
+        self.__nodes: Dict[int, UITreeNode] = {}
+        self.__node_indices: Dict[int, int] = {}
+        self.__hash_indices: Optional[Dict[str, int]] = None
+        # Children of each node, in the order of their parent's transitions
+        parents = np.asarray(columns["node_parents"], dtype=np.int64)[1:]
+        self.child_indices = (np.argsort(parents, kind="stable") + 1).astype(columns["node_parents"].dtype)
+        self.child_offsets = np.zeros(self.__node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(parents, minlength=self.__node_count), out=self.child_offsets[1:])
+
+    def get_node_count(self) -> int:
+        return self.__node_count
+
+    def get_parents(self) -> np.ndarray:
+        return self.__columns["node_parents"]
+
+    def get_actions(self) -> np.ndarray:
+        return self.__columns["node_actions"]
+
+    def get_terminals(self) -> np.ndarray:
+        """
+        :return: The terminal flag of each node, as saved, or as set since on the nodes that were built.
+        """
+        terminals = np.array(self.__columns["node_terminals"], dtype=bool)
+        for index, node in self.__nodes.items():
+            terminals[index] = node.is_terminal()
+        return terminals
+
+    def get_hash(self, index: int) -> str:
+        return self.__columns["node_hashes"][index].decode("utf-8")
+
+    def find_index_by_hash(self, node_hash: str) -> Optional[int]:
+        """
+        :return: The index of the last node with the hash, like UITree.find_node_by_hash, or None if there is none.
+        """
+        if self.__hash_indices is None:
+            self.__hash_indices = {node_hash.decode("utf-8"): index
+                                   for index, node_hash in enumerate(self.__columns["node_hashes"].tolist())}
+        return self.__hash_indices.get(node_hash)
+
+    def get_index(self, node: UITreeNode) -> int:
+        return self.__node_indices[id(node)]
+
+    def get_built_nodes(self) -> List[UITreeNode]:
+        return list(self.__nodes.values())
+
+    def get_node(self, index: int) -> UITreeNode:
+        """
+        Gets a node, building it and its ancestors if they weren't yet.
+        :param index: The depth-first index of the node.
+        :return: The node.
+        """
+        node = self.__nodes.get(index)
+        if node is not None:
+            return node
+        parents = self.__columns["node_parents"]
+        ancestors = [index]
+        while ancestors[-1] not in self.__nodes and parents[ancestors[-1]] >= 0:
+            ancestors.append(int(parents[ancestors[-1]]))
+        if ancestors[-1] not in self.__nodes:
+            self.__build_node(ancestors[-1], None, UIAction.NAVIGATE)
+        for ancestor in reversed(ancestors[1:]):
+            # Building a node's children builds the next ancestor down
+            self.__nodes[ancestor].get_transitions()
+        return self.__nodes[index]
+
+    def __build_node(self, index: int, parent: Optional[UITreeNode], action: UIAction) -> UITreeNode:
+        has_children = self.child_offsets[index + 1] > self.child_offsets[index]
+        node = UITreeNode.from_snapshot(self.__get_item(int(self.__columns["node_items"][index])),
+                                        self.__columns["node_ids"][index].decode("utf-8"), self.get_hash(index),
+                                        bool(self.__columns["node_terminals"][index]), parent, action,
+                                        (lambda built: self.__build_children(built, index)) if has_children else None)
+        self.__nodes[index] = node
+        self.__node_indices[id(node)] = index
+        return node
+
+    def __build_children(self, node: UITreeNode, index: int):
+        actions = self.__columns["node_actions"]
+        for child in self.child_indices[self.child_offsets[index]:self.child_offsets[index + 1]].tolist():
+            self.__build_node(child, node, UIAction(int(actions[child])))
+
+    def __get_item(self, item: int) -> UIElementSnapshot:
+        """
+        :return: The snapshot of an element item, rebuilding the page it is on if it wasn't yet.
+        """
+        document_offsets = self.__columns["document_offsets"]
+        document = int(np.searchsorted(document_offsets, item, side="right")) - 1
+        if document not in self.__documents:
+            start, end = int(document_offsets[document]), int(document_offsets[document + 1])
+            self.__documents[document] = snapshots_from_columns(self.__columns, self.__strings, start, end)
+        return self.__documents[document][item - int(document_offsets[document])]
 
 
 class UITree:
@@ -112,76 +439,158 @@ class UITree:
         self.__tree_embedding = []
         self.__tree_node_to_embedding = {}
         self.__tree_embedding_counter = 0
+        self.__hashed_version = None
+        self.__metadata_index: Optional[UITreeMetadataIndex] = None
+        self.__metadata_index_version = None
+        # Hash of each crawled page's <html> element, keyed by URL
+        self.__page_hashes: Dict[str, str] = {}
+        # URL each deep action led to, keyed by the URL it was performed on and the hash of the acted-on node
+        self.__action_urls: Dict[str, Dict[str, str]] = {}
+        # Columns the tree was read from, and the structure version it had then
+        self.__columns: Optional[UITreeColumns] = None
+        self.__columns_version = None
 
     def get_root(self) -> UITreeNode:
         return self.__root
 
+    def get_page_hash(self, url: str) -> Optional[str]:
+        return self.__page_hashes.get(url)
+
+    def set_page_hash(self, url: str, page_hash: str):
+        self.__page_hashes[url] = page_hash
+
+    def get_page_hashes(self) -> Dict[str, str]:
+        """
+        :return: The hash of each crawled page's <html> element, keyed by URL.
+        """
+        return dict(self.__page_hashes)
+
+    def get_action_url(self, page_url: str, node_hash: str) -> Optional[str]:
+        """
+        Gets where performing the action of a node led during the crawl.
+        :param page_url: The URL of the page the action was performed on.
+        :param node_hash: The hash of the node acted on.
+        :return: The URL of the resulting page, or None if the action wasn't performed.
+        """
+        return self.__action_urls.get(page_url, {}).get(node_hash)
+
+    def set_action_url(self, page_url: str, node_hash: str, url: str):
+        if page_url not in self.__action_urls:
+            self.__action_urls[page_url] = {}
+        self.__action_urls[page_url][node_hash] = url
+
     def get_hash(self) -> Dict[str, UITreeNode]:
+        self.__ensure_hashed()
         return self.__tree_map
 
     def get_node_count(self) -> int:
+        columns = self.get_columns()
+        if columns is not None:
+            return columns.get_node_count()
+        self.__ensure_hashed()
         return self.__tree_embedding_counter
 
-    def get_node_embedding(self, node: UITreeNode, rehash_tree=True) -> int:
-        if rehash_tree:
-            self.hash_tree()
+    def get_columns(self) -> Optional[UITreeColumns]:
+        """
+        :return: The columns the tree was read from, if no transition was added since, indexing the nodes in the same
+        depth-first order as the tree's embeddings. Otherwise None.
+        """
+        if self.__columns is None or self.__columns_version != self.__root.get_version():
+            return None
+        return self.__columns
+
+    def reset_visits(self):
+        """
+        Sets the visits of every node to 0. Only the nodes built from the columns the tree was read from are reset, as
+        the others haven't been visited.
+        """
+        if self.__columns is not None:
+            for node in self.__columns.get_built_nodes():
+                node.set_visits(0)
+        else:
+            self.for_each_pair(lambda _, node: node.set_visits(0))
+
+    def get_node_embedding(self, node: UITreeNode, rehash_tree=False) -> int:
+        self.__ensure_hashed(rehash_tree)
         return self.__tree_node_to_embedding[node.get_hash()]
 
-    def get_nodes_embedding(self, nodes: List[UITreeNode], rehash_tree=True) -> List[int]:
-        if rehash_tree:
-            self.hash_tree()
-        embedding = [0] * self.get_node_count()
+    def get_nodes_embedding(self, nodes: List[UITreeNode], rehash_tree=False) -> List[int]:
+        self.__ensure_hashed(rehash_tree)
+        embedding = [0] * self.__tree_embedding_counter
         for node in nodes:
             node_embedding = self.__tree_node_to_embedding[node.get_hash()]
             embedding[node_embedding] = 1
         return embedding
 
-    def get_nodes_from_embedding(self, embedding: List[int], rehash_tree=True):
-        if rehash_tree:
-            self.hash_tree()
+    def get_nodes_from_embedding(self, embedding: List[int], rehash_tree=False):
+        self.__ensure_hashed(rehash_tree)
         nodes = []
         for i, value in enumerate(embedding):
             if value > 0:
                 nodes.append(self.__tree_embedding[i])
         return nodes
 
-    def get_node_from_embedding(self, embedding: int, rehash_tree=True):
-        if rehash_tree:
-            self.hash_tree()
+    def get_node_from_embedding(self, embedding: int, rehash_tree=False):
+        self.__ensure_hashed(rehash_tree)
         return self.__tree_embedding[embedding]
 
-    def contains_similar_node(self, node: UITreeNode, rehash_tree=True) -> bool:
-        if rehash_tree:
-            self.hash_tree()
+    def contains_similar_node(self, node: UITreeNode, rehash_tree=False) -> bool:
+        self.__ensure_hashed(rehash_tree)
         return node.get_hash() in self.__tree_map
 
     def find_node_by_hash(self, node_hash: str) -> Tuple[Optional[UIAction], Optional[UITreeNode]]:
-        if node_hash not in self.__tree_map:
-            self.hash_tree()
+        columns = self.get_columns()
+        if columns is not None:
+            index = columns.find_index_by_hash(node_hash)
+            if index is None:
+                return None, None
+            return UIAction(int(columns.get_actions()[index])), columns.get_node(index)
+        self.__ensure_hashed()
         if node_hash not in self.__tree_map:
             return None, None
         return self.__tree_map[node_hash]
 
     def set_terminal_node(self, node: UITreeNode = None, html_id: str = None, html_class: str = None, contains_text: str = None):
-        if not node:
-            node = self.__find_node_by_metadata(html_id, html_class, contains_text)
-        if node:
-            node.set_terminal(True)
+        nodes = [node] if node else self.find_nodes_by_metadata(html_id, html_class, contains_text)
+        for matching_node in nodes:
+            matching_node.set_terminal(True)
 
     def unset_terminal_node(self, node: UITreeNode = None, html_id: str = None, html_class: str = None, contains_text: str = None):
-        if not node:
-            node = self.__find_node_by_metadata(html_id, html_class, contains_text)
-        if node:
-            node.set_terminal(False)
+        nodes = [node] if node else self.find_nodes_by_metadata(html_id, html_class, contains_text)
+        for matching_node in nodes:
+            matching_node.set_terminal(False)
+
+    def find_nodes_by_metadata(self, html_id: str = None, html_class: str = None, contains_text: str = None) -> List[UITreeNode]:
+        """
+        Finds every node matching the first of the given criteria (see UITreeMetadataIndex).
+        :return: The matching nodes, in tree order.
+        """
+        return self.get_metadata_index().find_nodes(html_id, html_class, contains_text)
+
+    def get_metadata_index(self, texts: List[str] = ()) -> UITreeMetadataIndex:
+        """
+        Gets the metadata index of the tree, rebuilding it if transitions were added since it was built.
+        :param texts: Texts to index along with the rest, so they are matched in the same traversal.
+        :return: The index.
+        """
+        if self.__metadata_index is None or self.__metadata_index_version != self.__root.get_version():
+            self.__metadata_index = UITreeMetadataIndex(self.__root, texts)
+            self.__metadata_index_version = self.__root.get_version()
+        else:
+            self.__metadata_index.add_texts(texts)
+        return self.__metadata_index
 
     def hash_tree(self):
         """
         Constructs a hash of the nodes in the UITree for easy access.
         """
+        profiler = get_profiler()
+        start = perf_counter() if profiler.is_enabled() else None
         self.__tree_map = {}
         self.__tree_embedding = []
         self.__tree_node_to_embedding = {}
         self.__tree_embedding_counter = 0
+        self.__hashed_version = self.__root.get_version()
 
         def add_to_tree_map(action: UIAction, node: UITreeNode):
             self.__tree_map[node.get_hash()] = (action, node)
@@ -192,30 +601,15 @@ class UITree:
                 add_to_tree_map(action, child)
 
         add_to_tree_map(UIAction.NAVIGATE, self.__root)
+        if start is not None:
+            profiler.add("ui_tree.hash_tree", perf_counter() - start)
 
-    def __find_node_by_metadata(self, html_id: str = None, html_class: str = None, contains_text: str = None) -> Optional[UITreeNode]:
-        visit_queue: List[UITreeNode] = []
-        visited_set: Set[UITreeNode] = set()
-
-        visit_queue.append(self.__root)
-        visited_set.add(self.__root)
-
-        while visit_queue:
-            node = visit_queue.pop(0)
-
-            if html_id and node.get_html_id() and html_id.lower() in node.get_html_id().lower():
-                return node
-            elif html_class and node.get_html_class() and html_class.lower() in node.get_html_class().lower():
-                return node
-            elif contains_text and node.get_content() and contains_text.lower() in node.get_content().lower():
-                return node
-
-            for _, child in node.get_transition_tuples():
-                if child not in visited_set:
-                    visited_set.add(child)
-                    visit_queue.append(child)
-
-        return None
+    def __ensure_hashed(self, rehash_tree=False):
+        """
+        Rebuilds the hash of the tree if it is forced to or if transitions were added since the last time it was built.
+        """
+        if rehash_tree or self.__hashed_version != self.__root.get_version():
+            self.hash_tree()
 
     def for_each_pair(self, func: Callable[[UIAction, UITreeNode], None]):
         visited_nodes = set()
@@ -229,6 +623,112 @@ class UITree:
 
         visit_dfs(UIAction.NAVIGATE, self.__root)
 
+    def to_dict(self) -> Dict:
+        """
+        Serializes the tree as a flat, depth-first list of nodes pointing to their parents, followed by the pages the
+        nodes were built from.
+        :return: A dict of plain Python values.
+        """
+        documents, document_indices, nodes = [], {}, []
+        stack = [(None, UIAction.NAVIGATE, self.__root)]
+        while stack:
+            parent_index, action, node = stack.pop()
+            node_dict = node.to_dict(documents, document_indices)
+            node_dict["parent"] = parent_index
+            node_dict["action"] = action.value
+            nodes.append(node_dict)
+            for child_action, child in reversed(node.get_transition_tuples()):
+                stack.append((len(nodes) - 1, child_action, child))
+        return {"documents": documents, "nodes": nodes, "page_hashes": self.__page_hashes, "action_urls": self.__action_urls}
+
+    @staticmethod
+    def from_dict(data: Dict) -> 'UITree':
+        documents = [UIElementSnapshot.from_list(document) for document in data["documents"]]
+        nodes: List[UITreeNode] = []
+        for node_dict in data["nodes"]:
+            parent = nodes[node_dict["parent"]] if node_dict["parent"] is not None else None
+            nodes.append(UITreeNode.from_dict(node_dict, documents, parent, UIAction(node_dict["action"])))
+        tree = UITree(nodes[0])
+        tree.__page_hashes = dict(data["page_hashes"]) if "page_hashes" in data else {}
+        tree.__action_urls = {page_url: dict(urls) for page_url, urls in data["action_urls"].items()} if "action_urls" in data else {}
+        return tree
+
+    def to_columns(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        """
+        Serializes the tree as columns: one array per node property, in the same depth-first order as to_dict, with
+        each node pointing at its element among the flattened items of the pages, and every string deduplicated into
+        a single table.
+        :return: The plain Python values of the tree, and the columns keyed by name.
+        """
+        strings = StringTable()
+        roots, root_ids, nodes = [], set(), []
+        stack = [(-1, UIAction.NAVIGATE, self.__root)]
+        while stack:
+            parent_index, action, node = stack.pop()
+            nodes.append((parent_index, action, node))
+            root = node.get_snapshot().get_root()
+            if id(root) not in root_ids:
+                root_ids.add(id(root))
+                roots.append(root)
+            for child_action, child in reversed(node.get_transition_tuples()):
+                stack.append((len(nodes) - 1, child_action, child))
+
+        columns, item_indices = snapshots_to_columns(roots, strings)
+        columns["node_parents"] = np.array([parent_index for parent_index, _, _ in nodes], dtype=get_index_dtype(len(nodes)))
+        columns["node_actions"] = np.array([action.value for _, action, _ in nodes], dtype=np.int8)
+        columns["node_terminals"] = np.array([node.is_terminal() for _, _, node in nodes], dtype=bool)
+        columns["node_items"] = np.array([item_indices[id(node.get_snapshot())] for _, _, node in nodes],
+                                         dtype=columns["item_parents"].dtype)
+        # Ids and hashes are unique to each node and of similar lengths, so they're stored as fixed-width UTF-8
+        columns["node_ids"] = np.array([node.get_id().encode("utf-8") for _, _, node in nodes], dtype=bytes)
+        columns["node_hashes"] = np.array([node.get_hash().encode("utf-8") for _, _, node in nodes], dtype=bytes)
+        columns["string_offsets"], columns["string_data"] = strings.to_columns()
+        meta = {"node_count": len(nodes), "page_hashes": self.__page_hashes, "action_urls": self.__action_urls}
+        return meta, columns
+
+    @staticmethod
+    def from_columns(meta: Dict, columns: Dict[str, np.ndarray]) -> 'UITree':
+        """
+        Reads a tree serialized with to_columns. Only the root is built right away: other nodes are built from the
+        columns once they are reached (see UITreeColumns).
+        :param meta: The plain Python values of the tree.
+        :param columns: The columns, possibly memory-mapped.
+        :return: The tree.
+        """
+        tree_columns = UITreeColumns(meta, columns)
+        tree = UITree(tree_columns.get_node(0))
+        tree.__columns = tree_columns
+        tree.__columns_version = tree.__root.get_version()
+        tree.__page_hashes = dict(meta["page_hashes"])
+        tree.__action_urls = {page_url: dict(urls) for page_url, urls in meta["action_urls"].items()}
+        return tree
+
+    def to_file(self, file_path: str):
+        """
+        Writes the tree to a file.
+        :param file_path: The path to write to. Paths ending with .qu.tree are written as a directory of columns, which
+        loads faster and more compactly than the default pickle.
+        """
+        if file_path.endswith(TREE_COLUMNS_SUFFIX):
+            meta, columns = self.to_columns()
+            write_columns(file_path, TREE_COLUMNS_KIND, meta, columns)
+        else:
+            write_pickle(file_path, self.to_dict())
+
+    @staticmethod
+    def from_file(file_path: str, mmap=True) -> Optional['UITree']:
+        """
+        Reads a tree written with to_file.
+        :param file_path: The path the tree was written to.
+        :param mmap: Memory-map the columns of a .qu.tree directory rather than reading them whole.
+        :return: The tree, or None if there is no such file.
+        """
+        if file_path.endswith(TREE_COLUMNS_SUFFIX):
+            data = read_columns(file_path, TREE_COLUMNS_KIND, mmap)
+            return UITree.from_columns(*data) if data is not None else None
+        data = read_pickle(file_path)
+        return UITree.from_dict(data) if data is not None else None
+
     def print(self):
         def print_node(action: UIAction, node: UITreeNode, depth: int):
             print("%s%s%s: %s" % (''.join(['\t' for _ in range(depth)]), action.name, "" if not node.is_terminal() else " (TERMINAL)", node))
@@ -0,0 +1,116 @@
+import numpy as np
+from typing import Dict, List, Optional
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../..'))
+
+from qubot.ui.ui_action import UIAction
+from qubot.ui.ui_tree import UITree, UITreeNode, UITreeColumns
+from qubot.environment.reward_rules import RewardRules
+
+class UITreeGraph:
+    """
+    A UITree compiled into flat integer arrays, so training can run without touching UITreeNode objects. Nodes are
+    indexed in the same depth-first order as the tree's embeddings, with the root at index 0. Trees read from columns
+    are compiled from them directly, and their nodes are only built when asked for.
+    """
+
+    NO_NODE = -1
+
+    def __init__(self, tree: UITree):
+        self.__columns: Optional[UITreeColumns] = tree.get_columns()
+        self.__nodes: List[UITreeNode] = []
+        self.__node_to_index: Dict[int, int] = {}
+        if self.__columns is not None:
+            self.parents = np.asarray(self.__columns.get_parents())
+            self.actions = np.asarray(self.__columns.get_actions())
+            self.child_offsets = self.__columns.child_offsets
+            self.child_indices = self.__columns.child_indices
+            self.terminals = self.__columns.get_terminals()
+        else:
+            self.__compile(tree)
+        self.child_actions = self.actions[self.child_indices]
+        self.leaves = np.diff(self.child_offsets) == 0
+        # Reward for entering each node through the action leading to it from its parent, on its 1st, 2nd, ... visit of
+        # an episode, the last row also covering later visits
+        self.rewards = np.zeros((1, self.get_node_count()))
+        # Reward for entering each node by navigating back up from one of its children, by visit in the same way
+        self.parent_rewards = np.zeros((1, self.get_node_count()))
+
+    def __compile(self, tree: UITree):
+        """
+        Compiles the arrays by traversing the nodes of a tree.
+        """
+        def add_node(node: UITreeNode):
+            self.__node_to_index[id(node)] = len(self.__nodes)
+            self.__nodes.append(node)
+            for _, child in node.get_transition_tuples():
+                add_node(child)
+
+        add_node(tree.get_root())
+
+        node_count = len(self.__nodes)
+        index_dtype = np.int32 if node_count < np.iinfo(np.int32).max else np.int64
+        self.child_offsets = np.zeros(node_count + 1, dtype=np.int64)
+        self.parents = np.full(node_count, UITreeGraph.NO_NODE, dtype=index_dtype)
+        self.actions = np.full(node_count, UIAction.NAVIGATE.value, dtype=np.int8)
+        child_indices = []
+        for index, node in enumerate(self.__nodes):
+            for action, child in node.get_transition_tuples():
+                child_index = self.__node_to_index[id(child)]
+                child_indices.append(child_index)
+                self.parents[child_index] = index
+                self.actions[child_index] = action.value
+            self.child_offsets[index + 1] = len(child_indices)
+        self.child_indices = np.array(child_indices, dtype=index_dtype)
+        self.terminals = np.zeros(node_count, dtype=bool)
+
+    def refresh(self, reward_rules: Optional[RewardRules] = None):
+        """
+        Re-reads the terminal flags of the nodes and recomputes the reward tables.
+        :param reward_rules: The rules to evaluate on every node, or None to leave the rewards at zero for a reward
+        function to be called on every step instead.
+        """
+        if self.__columns is not None:
+            self.terminals = self.__columns.get_terminals()
+        else:
+            for index, node in enumerate(self.__nodes):
+                self.terminals[index] = node.is_terminal()
+        node_count = self.get_node_count()
+        if reward_rules is None:
+            self.rewards = np.zeros((1, node_count))
+            self.parent_rewards = np.zeros((1, node_count))
+            return
+        navigate_actions = np.full(node_count, UIAction.NAVIGATE.value, dtype=np.int8)
+        # Let NumPy infer the dtype, so integer rewards stay integers
+        self.rewards = np.array([reward_rules.evaluate(self.actions, self.terminals, self.leaves, visits)
+                                 for visits in range(1, reward_rules.get_visit_levels() + 1)])
+        self.parent_rewards = np.array([reward_rules.evaluate(navigate_actions, self.terminals, self.leaves, visits)
+                                        for visits in range(1, reward_rules.get_visit_levels() + 1)])
+
+    def get_visit_levels(self) -> int:
+        """
+        :return: The number of rows of the reward tables.
+        """
+        return self.rewards.shape[0]
+
+    def get_node_count(self) -> int:
+        return self.__columns.get_node_count() if self.__columns is not None else len(self.__nodes)
+
+    def get_node(self, index: int) -> UITreeNode:
+        return self.__columns.get_node(index) if self.__columns is not None else self.__nodes[index]
+
+    def get_index(self, node: UITreeNode) -> int:
+        return self.__columns.get_index(node) if self.__columns is not None else self.__node_to_index[id(node)]
+
+    def get_hash(self, index: int) -> str:
+        """
+        :return: The hash of a node, without building it.
+        """
+        return self.__columns.get_hash(index) if self.__columns is not None else self.__nodes[index].get_hash()
+
+    def get_children(self, index: int) -> np.ndarray:
+        return self.child_indices[self.child_offsets[index]:self.child_offsets[index + 1]]
+
+    def get_action(self, index: int) -> UIAction:
+        return UIAction(int(self.actions[index]))
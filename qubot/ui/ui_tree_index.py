@@ -0,0 +1,118 @@
+from typing import Dict, Iterable, List
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '../..'))
+
+from qubot.ui.ui_snapshot import UIElementSnapshot, RAW_TEXT_ELEMENTS, escape_attribute, escape_text
+from qubot.utils.aho_corasick import AhoCorasick
+
+class UITreeMetadataIndex:
+    """
+    Finds the nodes of a UITree by html id, class or text without scanning the tree for every query. A single traversal
+    maps nodes by id and by class token, and runs an Aho-Corasick automaton of all the texts searched for over every
+    node's own markup. All matches are returned, in tree order, and matching is case-insensitive:
+    - an id or class matches the nodes having it exactly, or if there are none, those whose id or class contains it;
+    - a text matches the nodes whose own markup contains it, i.e. their start tag and their text outside of child
+      elements, so the elements containing the text match rather than all of their ancestors.
+    """
+
+    def __init__(self, root, texts: Iterable[str] = ()):
+        """
+        Indexes a tree.
+        :param root: The root UITreeNode of the tree.
+        :param texts: The texts to index, in the same traversal. Other texts are indexed when first searched for.
+        """
+        self.__root = root
+        self.__nodes_by_id: Dict[str, List] = {}
+        self.__nodes_by_class: Dict[str, List] = {}
+        self.__nodes_by_class_token: Dict[str, List] = {}
+        self.__nodes_by_text: Dict[str, List] = {}
+        # Position of each node in tree order, keyed by id(node)
+        self.__node_order: Dict[int, int] = {}
+
+        def index_metadata(node):
+            self.__node_order[id(node)] = len(self.__node_order)
+            html_id = (node.get_html_id() or "").lower()
+            if html_id:
+                self.__nodes_by_id.setdefault(html_id, []).append(node)
+            html_class = (node.get_html_class() or "").lower()
+            if html_class:
+                self.__nodes_by_class.setdefault(html_class, []).append(node)
+                for token in set(html_class.split()):
+                    self.__nodes_by_class_token.setdefault(token, []).append(node)
+
+        self.__traverse(list(texts), index_metadata)
+
+    def find_nodes(self, html_id: str = None, html_class: str = None, contains_text: str = None) -> List:
+        """
+        Finds the nodes matching the first of the given criteria.
+        :return: The matching UITreeNodes, in tree order.
+        """
+        if html_id:
+            return self.__find_key(self.__nodes_by_id, self.__nodes_by_id, html_id.lower())
+        elif html_class:
+            return self.__find_key(self.__nodes_by_class_token, self.__nodes_by_class, html_class.lower())
+        elif contains_text:
+            self.add_texts([contains_text])
+            return list(self.__nodes_by_text[contains_text.lower()])
+        return []
+
+    def add_texts(self, texts: Iterable[str]):
+        """
+        Indexes texts that weren't indexed yet, all in one traversal.
+        :param texts: The texts to index.
+        """
+        new_texts = [text for text in set(text.lower() for text in texts) if text not in self.__nodes_by_text]
+        if new_texts:
+            self.__traverse(new_texts)
+
+    def __traverse(self, texts: List[str], visit=None):
+        """
+        Visits every node once, in tree order, matching the texts against its own markup.
+        :param texts: The texts to index.
+        :param visit: Function also called with every node.
+        """
+        texts = list(set(text.lower() for text in texts if text))
+        automaton = AhoCorasick(texts) if texts else None
+        matches = [[] for _ in texts]
+        stack = [self.__root]
+        while stack:
+            node = stack.pop()
+            if visit is not None:
+                visit(node)
+            if automaton is not None:
+                for text_index in automaton.find(get_own_markup(node.get_snapshot()).lower()):
+                    matches[text_index].append(node)
+            stack.extend(reversed([child for _, child in node.get_transition_tuples()]))
+        for text, nodes in zip(texts, matches):
+            self.__nodes_by_text[text] = nodes
+
+    def __find_key(self, exact_map: Dict[str, List], substring_map: Dict[str, List], key: str) -> List:
+        if key in exact_map:
+            return list(exact_map[key])
+        nodes = {}
+        for value, value_nodes in substring_map.items():
+            if key in value:
+                for node in value_nodes:
+                    nodes[id(node)] = node
+        return sorted(nodes.values(), key=lambda node: self.__node_order[id(node)])
+
+
+def get_own_markup(element: UIElementSnapshot) -> str:
+    """
+    :param element: An element.
+    :return: The element's start tag and its text outside of child elements, with a NUL where each child was so no
+    match spans a child.
+    """
+    parts = ["<%s" % element.tag_name]
+    for name, value in element.attributes.items():
+        parts.append(" %s=\"%s\"" % (name, escape_attribute(value)))
+    parts.append(">")
+    for child in element.children:
+        if isinstance(child, UIElementSnapshot):
+            parts.append("\x00")
+        elif element.tag_name in RAW_TEXT_ELEMENTS:
+            parts.append(child)
+        else:
+            parts.append(escape_text(child))
+    return ''.join(parts)
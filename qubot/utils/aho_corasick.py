@@ -0,0 +1,64 @@
+from typing import Dict, List, Set
+
+
+class AhoCorasick:
+    """
+    An Aho-Corasick automaton, finding which of a set of patterns occur in a text in a single pass over the text,
+    however many patterns there are.
+    """
+
+    def __init__(self, patterns: List[str]):
+        """
+        Builds the automaton.
+        :param patterns: The patterns to search for. Empty patterns never match.
+        """
+        self.__patterns = list(patterns)
+        # Trie of the patterns: goto edges, failure links and the patterns ending at (or suffixing) each state
+        self.__goto: List[Dict[str, int]] = [{}]
+        self.__fail: List[int] = [0]
+        self.__outputs: List[Set[int]] = [set()]
+
+        for pattern_index, pattern in enumerate(self.__patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.__goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.__goto)
+                    self.__goto[state][char] = next_state
+                    self.__goto.append({})
+                    self.__fail.append(0)
+                    self.__outputs.append(set())
+                state = next_state
+            self.__outputs[state].add(pattern_index)
+
+        # Link every state to its longest proper suffix in the trie, breadth first
+        queue = list(self.__goto[0].values())
+        for state in queue:
+            for char, next_state in self.__goto[state].items():
+                queue.append(next_state)
+                fail = self.__fail[state]
+                while fail and char not in self.__goto[fail]:
+                    fail = self.__fail[fail]
+                self.__fail[next_state] = self.__goto[fail].get(char, 0)
+                self.__outputs[next_state] |= self.__outputs[self.__fail[next_state]]
+
+    def get_patterns(self) -> List[str]:
+        return self.__patterns
+
+    def find(self, text: str) -> Set[int]:
+        """
+        :param text: The text to search.
+        :return: The indices of the patterns occurring in the text.
+        """
+        found = set()
+        goto, fail, outputs = self.__goto, self.__fail, self.__outputs
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
@@ -0,0 +1,155 @@
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import shutil
+from os.path import isabs, abspath, basename, exists, isdir, join
+from pathlib import Path
+from tempfile import mkdtemp, mkstemp
+import numpy as np
+
+# Version of the columnar format written by write_columns, bumped whenever existing columns change meaning
+COLUMNS_FORMAT = "qubot-columns"
+COLUMNS_VERSION = 1
+COLUMNS_META_FILE = "meta.json"
+# Prefix of the subdirectories holding each written version of the columns
+COLUMNS_VERSION_PREFIX = "v-"
+
+def get_index_dtype(count: int):
+    """
+    :param count: The number of values to index.
+    :return: The smallest of int32 and int64 that can index them.
+    """
+    return np.int32 if count < np.iinfo(np.int32).max else np.int64
+
+
+class StringTable:
+    """
+    Deduplicated strings referenced by index from integer columns, stored as a UTF-8 blob and the offsets of each
+    string in it.
+    """
+
+    def __init__(self):
+        self.__indices: Dict[str, int] = {}
+        self.__strings: List[str] = []
+
+    def add(self, string: str) -> int:
+        """
+        :param string: A string.
+        :return: The index of the string in the table, added if it wasn't in it yet.
+        """
+        index = self.__indices.get(string)
+        if index is None:
+            index = self.__indices[string] = len(self.__strings)
+            self.__strings.append(string)
+        return index
+
+    def get_index_dtype(self):
+        """
+        :return: The dtype of columns indexing into the table.
+        """
+        return get_index_dtype(len(self.__strings))
+
+    def to_columns(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: The offsets of each string, followed by the end of the last one, and the UTF-8 blob of all strings.
+        """
+        encoded = [string.encode("utf-8") for string in self.__strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=get_index_dtype(sum(len(string) for string in encoded)))
+        np.cumsum([len(string) for string in encoded], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    @staticmethod
+    def from_columns(offsets: np.ndarray, data: np.ndarray) -> List[str]:
+        blob = data.tobytes()
+        offsets = offsets.tolist()
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+class LazyStringTable:
+    """
+    The strings of a StringTable's columns, decoded one at a time as they are looked up, so memory-mapped columns are
+    only read where they are used.
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.__offsets = offsets
+        self.__offset_list: Optional[List[int]] = None
+        # Slicing a memoryview doesn't copy, unlike slicing the array
+        self.__data = memoryview(np.ascontiguousarray(data))
+        self.__strings: Dict[int, str] = {}
+
+    def __getitem__(self, index: int) -> str:
+        string = self.__strings.get(index)
+        if string is None:
+            if self.__offset_list is None:
+                self.__offset_list = self.__offsets.tolist()
+            string = self.__strings[index] = str(self.__data[self.__offset_list[index]:self.__offset_list[index + 1]], "utf-8")
+        return string
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1
+
+
+def write_columns(path: str, kind: str, meta: Dict, columns: Dict[str, np.ndarray]):
+    """
+    Writes columns of a single kind of data as a directory of .npy files, with a versioned meta.json. Each write goes
+    to a new subdirectory, which a single rename of meta.json then swaps in, so readers see either the previous
+    version or the new one as a whole, and processes that memory-mapped the previous version keep reading it intact.
+    Versions older than the previous one are removed.
+    :param path: The directory to write to, created if needed.
+    :param kind: The kind of data, checked by read_columns.
+    :param meta: Plain JSON values stored alongside the columns.
+    :param columns: The arrays to write, keyed by name.
+    """
+    absolute_path = path if isabs(path) else abspath(path)
+    Path(absolute_path).mkdir(parents=True, exist_ok=True)
+    previous_header = read_header(absolute_path)
+    version_path = mkdtemp(prefix=COLUMNS_VERSION_PREFIX, dir=absolute_path)
+    for name, column in columns.items():
+        with open(join(version_path, "%s.npy" % name), "wb") as column_file:
+            np.save(column_file, np.ascontiguousarray(column), allow_pickle=False)
+    meta_file_descriptor, meta_tmp_path = mkstemp(suffix=".tmp", dir=absolute_path)
+    with os.fdopen(meta_file_descriptor, "w") as meta_file:
+        json.dump({"format": COLUMNS_FORMAT, "version": COLUMNS_VERSION, "kind": kind,
+                   "directory": basename(version_path), "columns": list(columns.keys()), "meta": meta}, meta_file)
+    os.replace(meta_tmp_path, join(absolute_path, COLUMNS_META_FILE))
+
+    kept = {basename(version_path), previous_header["directory"] if previous_header else None}
+    for entry in os.listdir(absolute_path):
+        if entry.startswith(COLUMNS_VERSION_PREFIX) and entry not in kept and isdir(join(absolute_path, entry)):
+            shutil.rmtree(join(absolute_path, entry), ignore_errors=True)
+
+
+def read_header(path: str) -> Optional[Dict]:
+    """
+    :param path: A directory written with write_columns.
+    :return: The contents of its meta.json, or None if there is none.
+    """
+    meta_path = join(path, COLUMNS_META_FILE)
+    if not exists(meta_path):
+        return None
+    with open(meta_path, "r") as meta_file:
+        return json.load(meta_file)
+
+
+def read_columns(path: str, kind: str, mmap=True) -> Optional[Tuple[Dict, Dict[str, np.ndarray]]]:
+    """
+    Reads columns written with write_columns.
+    :param path: The directory the columns were written to.
+    :param kind: The kind of data expected.
+    :param mmap: Memory-map the columns read-only instead of reading them, so they load instantly and processes
+    loading the same directory share their pages.
+    :return: The meta values and the columns keyed by name, or None if there is no such directory.
+    """
+    absolute_path = path if isabs(path) else abspath(path)
+    header = read_header(absolute_path)
+    if header is None:
+        return None
+    if header.get("format") != COLUMNS_FORMAT or header.get("kind") != kind:
+        raise Exception("'%s' doesn't hold %s columns" % (path, kind))
+    if header["version"] > COLUMNS_VERSION:
+        raise Exception("'%s' was written by a newer version of Qubot (format version %d)" % (path, header["version"]))
+    columns_path = join(absolute_path, header["directory"])
+    columns = {name: np.load(join(columns_path, "%s.npy" % name), mmap_mode="r" if mmap else None, allow_pickle=False)
+               for name in header["columns"]}
+    return header["meta"], columns
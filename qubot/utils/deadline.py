@@ -0,0 +1,213 @@
+from typing import Callable, Optional
+from threading import Thread, Event, Lock
+from random import uniform
+from time import monotonic, sleep
+import multiprocessing
+import asyncio
+
+
+class ActionTimeoutError(Exception):
+    """
+    Raised when an action runs out of its time budget.
+    """
+    pass
+
+
+class CrawlStoppedError(Exception):
+    """
+    Raised when an action is not attempted because the crawl deadline passed or the crawl was cancelled.
+    """
+    pass
+
+
+class CancelToken:
+    """
+    Cancels a crawl from any thread or process. Backed by a multiprocessing Event, so a token created before forking
+    is shared with the child processes.
+    """
+
+    def __init__(self):
+        self.__event = multiprocessing.Event()
+
+    def cancel(self):
+        self.__event.set()
+
+    def is_cancelled(self) -> bool:
+        return self.__event.is_set()
+
+    def wait(self, seconds: Optional[float]) -> bool:
+        """
+        Sleeps until the token is cancelled or the time is up.
+        :param seconds: The maximum number of seconds to sleep, or None to wait for cancellation.
+        :return: True if the token was cancelled.
+        """
+        return self.__event.wait(seconds)
+
+
+class Deadline:
+    """
+    A point in time after which no more work should start.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        """
+        :param seconds: The number of seconds from now until the deadline, or None for no deadline.
+        """
+        self.__end = None if seconds is None else monotonic() + seconds
+
+    def get_remaining(self) -> Optional[float]:
+        """
+        :return: The number of seconds left, or None if there is no deadline.
+        """
+        return None if self.__end is None else max(0.0, self.__end - monotonic())
+
+    def is_expired(self) -> bool:
+        return self.__end is not None and monotonic() >= self.__end
+
+    def get_budget(self, seconds: Optional[float]) -> Optional[float]:
+        """
+        :param seconds: A time budget, or None for no limit.
+        :return: The budget, cut short by the deadline.
+        """
+        remaining = self.get_remaining()
+        if remaining is None:
+            return seconds
+        return remaining if seconds is None else min(seconds, remaining)
+
+
+class DeadlineExecutor:
+    """
+    Runs driver actions with a time budget per attempt, retries failed attempts with exponential backoff and full
+    jitter, and stops trying once the crawl deadline passes or the crawl is cancelled. Budgets are enforced without
+    signals, so actions can run on any thread.
+    """
+
+    def __init__(self, action_timeout_s: Optional[float] = 10, max_retries: int = 2, backoff_s: float = 0.5,
+                 max_backoff_s: float = 5, deadline: Deadline = None, cancel_token: CancelToken = None):
+        """
+        Initializes the executor.
+        :param action_timeout_s: The time budget of each attempt, or None for no budget.
+        :param max_retries: The number of times a failed action is retried.
+        :param backoff_s: The maximum sleep before the first retry. Doubles with every retry.
+        :param max_backoff_s: The cap on the maximum sleep between retries.
+        :param deadline: The crawl deadline, or None for no deadline.
+        :param cancel_token: Token cancelling the crawl, or None.
+        """
+        self.__action_timeout_s = action_timeout_s
+        self.__max_retries = max(0, max_retries)
+        self.__backoff_s = backoff_s
+        self.__max_backoff_s = max_backoff_s
+        self.__deadline = deadline if deadline is not None else Deadline()
+        self.__cancel_token = cancel_token
+
+    def is_stopped(self) -> bool:
+        """
+        :return: True if the crawl deadline passed or the crawl was cancelled.
+        """
+        return self.__deadline.is_expired() or (self.__cancel_token is not None and self.__cancel_token.is_cancelled())
+
+    def get_deadline(self) -> Deadline:
+        return self.__deadline
+
+    def get_cancel_token(self) -> Optional[CancelToken]:
+        return self.__cancel_token
+
+    def get_backoff_s(self, attempt: int) -> float:
+        """
+        :param attempt: The number of attempts that already failed, starting at 1.
+        :return: A random sleep before the next attempt, between 0 and the exponentially growing cap.
+        """
+        return uniform(0, min(self.__max_backoff_s, self.__backoff_s * 2 ** (attempt - 1)))
+
+    def run(self, func: Callable, on_fail: Callable[[Exception], None] = None, on_late_result: Callable = None,
+            use_timeout=True):
+        """
+        Calls a function until it succeeds, it runs out of retries, or the crawl stops.
+        :param func: The action to perform.
+        :param on_fail: Function called with the error of each failed attempt.
+        :param on_late_result: Function called with the result of an attempt that finished after its budget ran out,
+        e.g. to release the session it acquired.
+        :param use_timeout: Enforce the time budget? Attempts without a budget run on the calling thread.
+        :return: The result of the first successful attempt.
+        :raises: The error of the last attempt, or CrawlStoppedError if the crawl stopped before an attempt.
+        """
+        attempt = 0
+        while True:
+            if self.is_stopped():
+                raise CrawlStoppedError("crawl deadline passed or crawl cancelled")
+            try:
+                budget = self.__deadline.get_budget(self.__action_timeout_s) if use_timeout else None
+                if budget is None:
+                    return func()
+                return DeadlineExecutor.__call_with_budget(func, budget, on_late_result)
+            except Exception as e:
+                attempt += 1
+                if on_fail:
+                    on_fail(e)
+                if attempt > self.__max_retries:
+                    raise e
+                self.__sleep(self.get_backoff_s(attempt))
+
+    async def run_async(self, make_coroutine: Callable, on_fail: Callable[[Exception], None] = None):
+        """
+        Same as run, for coroutines. Attempts running over their budget are cancelled.
+        :param make_coroutine: Function creating a new coroutine for each attempt.
+        :param on_fail: Function called with the error of each failed attempt.
+        :return: The result of the first successful attempt.
+        :raises: The error of the last attempt, or CrawlStoppedError if the crawl stopped before an attempt.
+        """
+        attempt = 0
+        while True:
+            if self.is_stopped():
+                raise CrawlStoppedError("crawl deadline passed or crawl cancelled")
+            budget = self.__deadline.get_budget(self.__action_timeout_s)
+            try:
+                return await asyncio.wait_for(make_coroutine(), budget)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = ActionTimeoutError("action ran out of its %.1fs budget" % budget)
+                attempt += 1
+                if on_fail:
+                    on_fail(e)
+                if attempt > self.__max_retries:
+                    raise e
+                await asyncio.sleep(self.__deadline.get_budget(self.get_backoff_s(attempt)))
+
+    def __sleep(self, seconds: float):
+        seconds = self.__deadline.get_budget(seconds)
+        if self.__cancel_token is not None:
+            self.__cancel_token.wait(seconds)
+        else:
+            sleep(seconds)
+
+    @staticmethod
+    def __call_with_budget(func: Callable, budget: float, on_late_result: Callable = None):
+        """
+        Calls a function on a daemon thread and waits for it at most the budget. A call that runs over can't be killed,
+        so it is abandoned, and its result is handed to on_late_result once it finishes.
+        """
+        outcome = {}
+        is_done = Event()
+        lock = Lock()
+
+        def call():
+            try:
+                outcome["result"] = func()
+            except Exception as e:
+                outcome["error"] = e
+            with lock:
+                is_done.set()
+                is_abandoned = outcome.get("is_abandoned", False)
+            if is_abandoned and "result" in outcome and on_late_result:
+                on_late_result(outcome["result"])
+
+        Thread(target=call, daemon=True).start()
+        if not is_done.wait(budget):
+            with lock:
+                # The call may have finished between the wait and being abandoned
+                if not is_done.is_set():
+                    outcome["is_abandoned"] = True
+                    raise ActionTimeoutError("action ran out of its %.1fs budget" % budget)
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
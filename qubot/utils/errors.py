@@ -1,6 +1,6 @@
 from typing import Callable, Optional
 
-from time import sleep
+from qubot.utils.deadline import DeadlineExecutor
 
 def inline_try(func: Callable) -> Optional[Exception]:
     """
@@ -14,23 +14,14 @@ def inline_try(func: Callable) -> Optional[Exception]:
     except Exception as e:
         return e
 
-def try_again_on_fail(func: Callable, sleep_s: int = 0, max_retries: int = 0, on_fail: Callable = None) -> Optional[Exception]:
+def try_again_on_fail(func: Callable, sleep_s: float = 0, max_retries: int = 0, on_fail: Callable = None) -> Optional[Exception]:
     """
-    Recursively tries to execute the inline function until it succeeds.
+    Tries to execute the inline function until it succeeds, backing off exponentially with jitter between attempts.
     :param func: A function to call.
-    :param sleep_s: Number of seconds to sleep before trying again.
+    :param sleep_s: Maximum number of seconds to sleep before the first retry. Doubles with every retry.
     :param max_retries: The max number of retries before we finally propagate the error.
     :param on_fail: Function called as soon as func fails.
+    :return: None if an attempt succeeded or the Exception object thrown by the last attempt.
     """
-    try:
-        func()
-    except Exception as e:
-        if on_fail:
-            on_fail(e)
-        if sleep_s > 0:
-            sleep(sleep_s)
-        if max_retries > 0:
-            try_again_on_fail(func, sleep_s, max_retries - 1)
-        else:
-            return e
-    return None
+    executor = DeadlineExecutor(None, max_retries, backoff_s=sleep_s, max_backoff_s=sleep_s * 2 ** max_retries)
+    return inline_try(lambda: executor.run(func, on_fail))
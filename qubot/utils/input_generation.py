@@ -1,7 +1,9 @@
-from typing import Dict, Optional
-from selenium.webdriver.firefox.webelement import FirefoxWebElement
+from typing import Dict, Optional, TYPE_CHECKING
 
-def is_generatable_input(element: FirefoxWebElement):
+if TYPE_CHECKING:
+    from selenium.webdriver.firefox.webelement import FirefoxWebElement
+
+def is_generatable_input(element: 'FirefoxWebElement'):
     return element.tag_name == "textarea" or \
            (element.tag_name == "input" and element.get_attribute("type") in [
                "color",
@@ -33,7 +35,7 @@ DEFAULT_TIME = "00:00:00.00"
 DEFAULT_URL = "https://www.google.com/"
 DEFAULT_WEEK = "2021-W01"
 
-def generate_input(element: FirefoxWebElement, overrides: Dict[str, str] = None) -> Optional[str]:
+def generate_input(element: 'FirefoxWebElement', overrides: Dict[str, str] = None) -> Optional[str]:
     values = {
         "color": DEFAULT_COLOR,
         "date": DEFAULT_DATE,
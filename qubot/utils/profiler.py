@@ -0,0 +1,209 @@
+from typing import Dict, List, Optional
+from collections import Counter
+from contextlib import contextmanager
+from threading import Event, Lock, Thread, enumerate as enumerate_threads, get_ident
+from time import perf_counter
+from os.path import basename
+import cProfile
+import sys
+
+PROFILE_FORMAT_CPROFILE = "cprofile"
+PROFILE_FORMAT_COLLAPSED = "collapsed"
+
+
+class Profiler:
+    """
+    Counts and times the hot paths of a run: WebDriver round-trips per command, UITreeNode construction, hashing,
+    hash_tree rebuilds, Q-value updates and action selection. Disabled by default, in which case instrumented code
+    only pays for an is_enabled check.
+    """
+
+    def __init__(self):
+        self.__is_enabled = False
+        self.__lock = Lock()
+        # Name -> [count, total seconds, maximum seconds of a single add]
+        self.__entries: Dict[str, List] = {}
+
+    def enable(self):
+        self.__is_enabled = True
+
+    def disable(self):
+        self.__is_enabled = False
+
+    def is_enabled(self) -> bool:
+        return self.__is_enabled
+
+    def reset(self):
+        with self.__lock:
+            self.__entries = {}
+
+    def add(self, name: str, seconds: float, count: int = 1):
+        """
+        Records time spent in an instrumented operation.
+        :param name: The name of the operation, e.g. "webdriver.executeScript".
+        :param seconds: The time spent.
+        :param count: The number of operations the time was spent on, for hot loops that time themselves in bulk.
+        """
+        with self.__lock:
+            entry = self.__entries.get(name)
+            if entry is None:
+                self.__entries[name] = [count, seconds, seconds]
+            else:
+                entry[0] += count
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+
+    def merge(self, profile: Dict):
+        """
+        Adds the timings of another profiler, e.g. of a worker process.
+        :param profile: The other profiler's to_dict.
+        """
+        with self.__lock:
+            for name, timing in profile.items():
+                count, total_s, max_s = timing["count"], timing["total_millis"] / 1000, timing["max_millis"] / 1000
+                entry = self.__entries.get(name)
+                if entry is None:
+                    self.__entries[name] = [count, total_s, max_s]
+                else:
+                    entry[0] += count
+                    entry[1] += total_s
+                    entry[2] = max(entry[2], max_s)
+
+    @contextmanager
+    def time(self, name: str):
+        """
+        Times a block, if profiling is enabled.
+        :param name: The name of the operation.
+        """
+        if not self.__is_enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def to_dict(self) -> Dict:
+        """
+        :return: The count, total, average and maximum milliseconds of every operation, the most time-consuming first.
+        """
+        with self.__lock:
+            entries = sorted(self.__entries.items(), key=lambda item: -item[1][1])
+        return {name: {
+            "count": count,
+            "total_millis": total_s * 1000,
+            "avg_millis": total_s * 1000 / count if count else 0,
+            "max_millis": max_s * 1000,
+        } for name, (count, total_s, max_s) in entries}
+
+
+_profiler = Profiler()
+
+
+def get_profiler() -> Profiler:
+    """
+    :return: The profiler of this process.
+    """
+    return _profiler
+
+
+def profile_web_driver(web_driver):
+    """
+    Times every command sent through a Selenium WebDriver, including those sent through its elements, by command name.
+    Does nothing unless profiling is enabled.
+    :param web_driver: The WebDriver.
+    :return: The same WebDriver.
+    """
+    profiler = get_profiler()
+    if not profiler.is_enabled():
+        return web_driver
+    execute = web_driver.execute
+
+    def profiled_execute(driver_command: str, params: Dict = None):
+        start = perf_counter()
+        try:
+            return execute(driver_command, params)
+        finally:
+            profiler.add("webdriver.%s" % driver_command, perf_counter() - start)
+
+    web_driver.execute = profiled_execute
+    return web_driver
+
+
+class StackSampler:
+    """
+    Samples the call stacks of every thread at a fixed interval, and writes them in the collapsed-stack format read by
+    flamegraph.pl and speedscope: one "thread;outermost frame;...;innermost frame count" line per distinct stack.
+    """
+
+    def __init__(self, interval_s: float = 0.005):
+        """
+        :param interval_s: Seconds between samples.
+        """
+        self.__interval_s = interval_s
+        self.__samples = Counter()
+        self.__is_stopped = Event()
+        self.__thread: Optional[Thread] = None
+
+    def start(self):
+        self.__is_stopped.clear()
+        self.__thread = Thread(target=self.__sample, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__is_stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def write(self, file_path: str):
+        with open(file_path, "w") as stacks_file:
+            for stack, count in self.__samples.most_common():
+                stacks_file.write("%s %d\n" % (stack, count))
+
+    def __sample(self):
+        own_id = get_ident()
+        while not self.__is_stopped.wait(self.__interval_s):
+            thread_names = {thread.ident: thread.name for thread in enumerate_threads()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append("%s:%s" % (basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                frames.append(thread_names.get(thread_id, "thread-%d" % thread_id))
+                self.__samples[";".join(reversed(frames)).replace(" ", "_")] += 1
+
+
+@contextmanager
+def profile_to_file(file_path: Optional[str], file_format: str = PROFILE_FORMAT_COLLAPSED):
+    """
+    Profiles a block into a file.
+    :param file_path: The file to write the profile to, or None to not profile.
+    :param file_format: PROFILE_FORMAT_CPROFILE writes cProfile stats of the calling thread (read with pstats or
+    snakeviz). PROFILE_FORMAT_COLLAPSED samples the stacks of all threads into a flamegraph-compatible file.
+    """
+    if file_path is None:
+        yield
+        return
+    if file_format == PROFILE_FORMAT_CPROFILE:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(file_path)
+    elif file_format == PROFILE_FORMAT_COLLAPSED:
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.write(file_path)
+    else:
+        raise Exception("'%s' is not a profile format" % file_format)
@@ -0,0 +1,117 @@
+import pytest
+from pathlib import Path
+from typing import Dict
+from urllib.parse import urljoin, urlparse
+from selenium.webdriver.remote.command import Command
+from sys import path
+from os.path import join, dirname
+path.append(join(dirname(__file__), '..'))
+
+from qubot.ui.ui_snapshot import SNAPSHOT_SCRIPT, RESOLVE_SCRIPT, parse_html
+from qubot.driver.page_readiness import READINESS_SCRIPT
+from qubot.ui.ui_tree import UITree, UITreeNode
+
+@pytest.fixture
+def build_tree():
+    """
+    :return: A function building the UITree of every element of an HTML page, as a crawl without deep actions would.
+    """
+    def build(html: str) -> UITree:
+        root = UITreeNode(parse_html(html))
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.add_element_children(node.get_element().find_elements_by_xpath("./*"), node.get_snapshot())
+            stack.extend(node.get_children())
+        return UITree(root)
+    return build
+
+@pytest.fixture
+def write_site(tmp_path):
+    """
+    :return: A function writing HTML pages, keyed by file name, into a temporary directory. Returns the directory, so
+    the pages can be rewritten between crawls.
+    """
+    def write(pages: Dict[str, str]) -> Path:
+        for name, html in pages.items():
+            (tmp_path / name).write_text(html)
+        return tmp_path
+    return write
+
+
+class FakeElement:
+    def __init__(self, element_id: str):
+        self.id = element_id
+
+
+class FakeFirefox:
+    """
+    Stands in for Selenium's Firefox, displaying local files without running their scripts. Clicking a link navigates
+    to its href, like the static backend. Set ready_state to keep pages from ever loading completely, or to None to make
+    probing it fail, as while a document unloads.
+    """
+
+    w3c = False
+    ready_state = "complete"
+    launch_count = 0
+
+    def __init__(self, *args, **kwargs):
+        FakeFirefox.launch_count += 1
+        self.current_url = "about:blank"
+        self.__html = "<html></html>"
+        self.__elements = {}
+        self.__hovered = None
+
+    def get(self, url: str):
+        self.current_url = url
+        self.__html = Path(urlparse(url).path).read_text() if url.startswith("file:") else "<html></html>"
+        self.__elements = {}
+
+    def execute_script(self, script: str, *args):
+        if script == SNAPSHOT_SCRIPT:
+            return parse_html(self.__html).to_list()
+        if script == READINESS_SCRIPT:
+            if FakeFirefox.ready_state is None:
+                raise Exception("Document is unloading")
+            return [FakeFirefox.ready_state, 0, 60000, 60000]
+        if script == RESOLVE_SCRIPT:
+            element = parse_html(self.__html).find_element_by_path(tuple(args[0]))
+            if element is None:
+                return None
+            self.__elements[str(len(self.__elements))] = element
+            return FakeElement(str(len(self.__elements) - 1))
+        if "outerHTML" in script:
+            return self.__html
+        return None
+
+    def execute(self, driver_command: str, params: Dict = None):
+        if driver_command == Command.MOVE_TO:
+            self.__hovered = self.__elements.get(params["element"])
+        elif driver_command == Command.CLICK and self.__hovered is not None:
+            href = self.__hovered.get_attribute("href") if self.__hovered.tag_name == "a" else None
+            if href:
+                self.get(urljoin(self.current_url, href))
+        return {"value": None}
+
+    def delete_all_cookies(self):
+        pass
+
+    def set_page_load_timeout(self, seconds: float):
+        pass
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def fake_firefox(monkeypatch, tmp_path):
+    """
+    Makes Drivers browse with FakeFirefox, and keeps their caches in a temporary working directory.
+    :return: The FakeFirefox class.
+    """
+    monkeypatch.setattr("selenium.webdriver.Firefox", FakeFirefox)
+    monkeypatch.setattr("qubot.driver.driver.install_geckodriver", lambda: None)
+    monkeypatch.setattr(FakeFirefox, "ready_state", "complete")
+    monkeypatch.setattr(FakeFirefox, "launch_count", 0)
+    monkeypatch.chdir(tmp_path)
+    return FakeFirefox
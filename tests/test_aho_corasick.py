@@ -0,0 +1,31 @@
+from qubot.utils.aho_corasick import AhoCorasick
+
+def test_finds_every_pattern_occurring():
+    automaton = AhoCorasick(["he", "she", "his", "hers"])
+    assert automaton.find("ushers") == {0, 1, 3}
+    assert automaton.find("this") == {2}
+    assert automaton.find("nothing") == set()
+
+def test_finds_patterns_through_failure_links():
+    # "abd" fails out of the "abc" branch, and "bd" is only reachable through the failure link of "ab"
+    automaton = AhoCorasick(["abc", "bd", "d"])
+    assert automaton.find("abd") == {1, 2}
+
+def test_finds_overlapping_and_nested_patterns():
+    automaton = AhoCorasick(["aa", "aaa", "a"])
+    assert automaton.find("aa") == {0, 2}
+    assert automaton.find("aaaa") == {0, 1, 2}
+
+def test_empty_patterns_never_match():
+    automaton = AhoCorasick(["", "x"])
+    assert automaton.find("") == set()
+    assert automaton.find("xyz") == {1}
+
+def test_duplicate_patterns_all_match():
+    assert AhoCorasick(["sign in", "sign in"]).find("please sign in") == {0, 1}
+
+def test_matches_brute_force():
+    patterns = ["ab", "bab", "b", "abba", "ba", "aab"]
+    automaton = AhoCorasick(patterns)
+    for text in ["", "a", "abba", "babab", "aabbaab", "bbbb", "abaabba"]:
+        assert automaton.find(text) == {index for index, pattern in enumerate(patterns) if pattern in text}
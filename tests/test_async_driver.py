@@ -0,0 +1,93 @@
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+
+from qubot.driver.async_driver import AsyncDriver
+from qubot.driver.async_webdriver import AsyncWebDriverSession, ELEMENT_KEY
+from qubot.driver.page_readiness import READINESS_SCRIPT
+from qubot.ui.ui_snapshot import SNAPSHOT_SCRIPT, RESOLVE_SCRIPT, parse_html
+from qubot.ui.ui_tree import UITree
+
+NAV = "<div id='nav'><a href='index.html'>Home</a><a href='a.html'>A</a></div>"
+SITE = {
+    "index.html": "<html><body>" + NAV + "<ul><li>Item</li><li>Item</li></ul></body></html>",
+    "a.html": "<html><body>" + NAV + "<p id='content'>A page</p></body></html>",
+}
+
+
+class FakeAsyncSession(AsyncWebDriverSession):
+    """
+    Stands in for a WebDriver session, displaying local files without running their scripts. Clicking a link navigates
+    to its href.
+    """
+
+    def __init__(self):
+        self.__url = "about:blank"
+        self.__html = "<html></html>"
+        self.__elements = {}
+
+    async def get(self, url: str):
+        self.__url = url
+        self.__html = Path(urlparse(url).path).read_text() if url.startswith("file:") else "<html></html>"
+        self.__elements = {}
+
+    async def get_current_url(self) -> str:
+        return self.__url
+
+    async def execute_script(self, script: str, *args):
+        if script == SNAPSHOT_SCRIPT:
+            return parse_html(self.__html).to_list()
+        if script == READINESS_SCRIPT:
+            return ["complete", 0, 60000, 60000]
+        if script == RESOLVE_SCRIPT:
+            element = parse_html(self.__html).find_element_by_path(tuple(args[0]))
+            if element is None:
+                return None
+            self.__elements[str(len(self.__elements))] = element
+            return {ELEMENT_KEY: str(len(self.__elements) - 1)}
+        return None
+
+    async def click(self, element):
+        clicked = self.__elements.get(element[ELEMENT_KEY])
+        href = clicked.get_attribute("href") if clicked is not None and clicked.tag_name == "a" else None
+        if href:
+            await self.get(urljoin(self.__url, href))
+
+    async def send_keys(self, element, text: str):
+        pass
+
+    async def set_page_load_timeout(self, seconds: float):
+        pass
+
+    async def delete_all_cookies(self):
+        pass
+
+    async def quit(self):
+        pass
+
+
+def crawl(monkeypatch, site_dir) -> UITree:
+    async def create(server_url: str, headless: bool = True):
+        return FakeAsyncSession()
+    monkeypatch.setattr(AsyncWebDriverSession, "create", staticmethod(create))
+    driver = AsyncDriver(sessions=2, webdriver_url="http://127.0.0.1:4444")
+    return driver.construct_tree((site_dir / "index.html").as_uri(), max_urls_to_visit=10)
+
+def get_nodes(tree: UITree):
+    nodes, stack = [], [tree.get_root()]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.get_children())
+    return nodes
+
+def test_identical_siblings_are_all_kept(monkeypatch, write_site):
+    tree = crawl(monkeypatch, write_site(SITE))
+    items = [node for node in get_nodes(tree) if node.get_tag_name() == "li"]
+    assert len(items) == 2
+
+def test_elements_repeated_across_pages_are_kept_on_each_page(monkeypatch, write_site):
+    tree = crawl(monkeypatch, write_site(SITE))
+    navs = [node for node in get_nodes(tree) if node.get_html_id() == "nav"]
+    # The start page's nav, and the nav of the page its link to A leads to
+    assert len(navs) == 2
+    assert any(node.get_html_id() == "content" for node in get_nodes(tree))
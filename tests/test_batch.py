@@ -0,0 +1,56 @@
+import json
+
+from qubot.config.batch import BatchApp, run_batch, apps_from_files, BATCH_SUMMARY_FILE, BATCH_STAGE_FINISHED, \
+    BATCH_STAGE_FAILED
+from qubot.driver.base_driver import BaseDriver
+
+SITE = {
+    "index.html": "<html><body><a href='login.html'>Log in</a><p>Welcome</p></body></html>",
+    "login.html": "<html><body><form><input type='email'><button id='submit'>Submit</button></form></body></html>",
+}
+
+def make_config(url: str, max_events=None) -> dict:
+    return {
+        "url": url,
+        "terminal_info": {"ids": ["submit"]},
+        "driver_parameters": {"backend": "static", "max_urls": 5},
+        "model_parameters": {"alpha": 0.5, "gamma": 0.6, "epsilon": 1, "decay": 0.01, "train_episodes": 20,
+                             "test_episodes": 5, "step_limit": 10},
+        "stats_parameters": {"max_events": max_events},
+    }
+
+def test_batch_runs_every_app_and_isolates_failures(write_site, tmp_path):
+    site_dir = write_site(SITE)
+    url = str(site_dir / "index.html")
+    apps = [BatchApp("full", make_config(url)), BatchApp("bounded", make_config(url, max_events=2)),
+            BatchApp("broken", {"url": url})]
+    progress = []
+    results = run_batch(apps, str(tmp_path / "out"), crawl_workers=2, processes=2,
+                        on_progress=lambda stage, result, finished, total: progress.append((stage, result.app.name)))
+
+    assert [result.app.name for result in results] == ["full", "bounded", "broken"]
+    assert [result.is_successful() for result in results] == [True, True, False]
+    assert "terminal_info" in results[2].error
+    assert (BATCH_STAGE_FINISHED, "full") in progress and (BATCH_STAGE_FAILED, "broken") in progress
+    for result in results[:2]:
+        with open(result.stats_file) as file:
+            stats = json.load(file)
+        # The crawl stats are handed over to the training worker in full
+        assert stats[BaseDriver.STAT_URLS_VISITED]["count"] == 1
+        assert stats[BaseDriver.STAT_ELEMENTS_ENCOUNTERED]["count"] > 2
+    with open(results[1].stats_file) as file:
+        assert len(json.load(file)[BaseDriver.STAT_ELEMENTS_ENCOUNTERED]["events"]) == 2
+    with open(tmp_path / "out" / BATCH_SUMMARY_FILE) as file:
+        assert [app["name"] for app in json.load(file)] == ["full", "bounded", "broken"]
+
+def test_apps_are_read_from_files_and_manifests(tmp_path):
+    (tmp_path / "shop.qu").write_text(json.dumps(make_config("shop.html")))
+    (tmp_path / "manifest.json").write_text(json.dumps({"configs": [
+        "shop.qu",
+        dict(make_config("blog.html"), name="blog"),
+        make_config("docs.html"),
+    ]}))
+    apps = apps_from_files([str(tmp_path / "shop.qu"), str(tmp_path / "manifest.json")])
+    assert [app.name for app in apps] == ["shop", "shop_2", "blog", "manifest_2"]
+    assert [app.config["url"] for app in apps] == ["shop.html", "shop.html", "blog.html", "docs.html"]
+    assert "name" not in apps[2].config
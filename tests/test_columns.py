@@ -0,0 +1,102 @@
+import json
+import os
+import numpy as np
+import pytest
+
+from qubot.utils.columns import StringTable, LazyStringTable, read_columns, read_header, write_columns, \
+    COLUMNS_META_FILE, COLUMNS_VERSION, COLUMNS_VERSION_PREFIX
+from qubot.ui.ui_tree import UITree, UITreeColumns, TREE_COLUMNS_KIND, TREE_COLUMNS_SUFFIX
+
+PAGE = "<html><body><div id='menu'><a href='a.html'>A</a><a href='b.html'>B</a></div>" \
+       "<form><input type='text' name='q'><button>Go</button></form><p class='note'>Ünïcödé</p></body></html>"
+
+def get_version_dirs(path):
+    return sorted(entry for entry in os.listdir(path) if entry.startswith(COLUMNS_VERSION_PREFIX))
+
+def test_string_tables_round_trip():
+    strings = StringTable()
+    indices = [strings.add(string) for string in ["a", "", "b", "a", "ünï"]]
+    assert indices == [0, 1, 2, 0, 3]
+    offsets, data = strings.to_columns()
+    assert StringTable.from_columns(offsets, data) == ["a", "", "b", "ünï"]
+    lazy = LazyStringTable(offsets, data)
+    assert len(lazy) == 4
+    assert [lazy[i] for i in range(len(lazy))] == ["a", "", "b", "ünï"]
+
+def test_columns_round_trip(tmp_path):
+    path = str(tmp_path / "columns")
+    columns = {"ints": np.arange(10, dtype=np.int32), "flags": np.array([True, False]), "bytes": np.array([b"ab", b"c"])}
+    write_columns(path, "test", {"count": 10}, columns)
+    assert read_header(path)["version"] == COLUMNS_VERSION
+    meta, read = read_columns(path, "test")
+    assert meta == {"count": 10}
+    for name, column in columns.items():
+        assert np.array_equal(read[name], column)
+        assert read[name].dtype == column.dtype
+    # Columns are memory-mapped read-only by default
+    assert isinstance(read["ints"], np.memmap)
+    assert not read["ints"].flags.writeable
+    _, loaded = read_columns(path, "test", mmap=False)
+    assert not isinstance(loaded["ints"], np.memmap)
+
+def test_missing_columns_read_as_none(tmp_path):
+    assert read_columns(str(tmp_path / "missing"), "test") is None
+
+def test_columns_of_another_kind_or_newer_version_are_rejected(tmp_path):
+    path = str(tmp_path / "columns")
+    write_columns(path, "test", {}, {"ints": np.arange(3)})
+    with pytest.raises(Exception):
+        read_columns(path, "other")
+    meta_path = os.path.join(path, COLUMNS_META_FILE)
+    with open(meta_path) as meta_file:
+        header = json.load(meta_file)
+    header["version"] = COLUMNS_VERSION + 1
+    with open(meta_path, "w") as meta_file:
+        json.dump(header, meta_file)
+    with pytest.raises(Exception):
+        read_columns(path, "test")
+
+def test_rewrites_keep_the_previous_version_readable(tmp_path):
+    path = str(tmp_path / "columns")
+    write_columns(path, "test", {"run": 1}, {"ints": np.arange(3)})
+    _, first = read_columns(path, "test")
+    write_columns(path, "test", {"run": 2}, {"ints": np.arange(5)})
+    meta, second = read_columns(path, "test")
+    assert meta == {"run": 2}
+    assert np.array_equal(second["ints"], np.arange(5))
+    # A reader that memory-mapped the previous version still reads it whole
+    assert np.array_equal(first["ints"], np.arange(3))
+    assert len(get_version_dirs(path)) == 2
+    write_columns(path, "test", {"run": 3}, {"ints": np.arange(7)})
+    # Versions older than the previous one are removed
+    assert len(get_version_dirs(path)) == 2
+    assert read_header(path)["directory"] in get_version_dirs(path)
+    assert [entry for entry in os.listdir(path) if entry.endswith(".tmp")] == []
+
+def test_trees_round_trip_through_column_files(tmp_path, build_tree):
+    tree = build_tree(PAGE)
+    tree.set_page_hash("http://localhost/", tree.get_root().get_hash())
+    tree.set_action_url("http://localhost/", next(iter(tree.get_hash().keys())), "http://localhost/a.html")
+    button = next(node for _, node in tree.get_hash().values() if node.get_tag_name() == "button")
+    button.set_terminal(True)
+    file_path = str(tmp_path / ("site" + TREE_COLUMNS_SUFFIX))
+    tree.to_file(file_path)
+    for mmap in [True, False]:
+        loaded = UITree.from_file(file_path, mmap)
+        assert loaded.to_dict() == tree.to_dict()
+        assert loaded.get_page_hashes() == tree.get_page_hashes()
+        assert loaded.find_node_by_hash(button.get_hash())[1].is_terminal()
+
+def test_tree_columns_only_build_the_nodes_reached(tmp_path, build_tree):
+    tree = build_tree(PAGE)
+    file_path = str(tmp_path / ("site" + TREE_COLUMNS_SUFFIX))
+    tree.to_file(file_path)
+    tree_columns = UITreeColumns(*read_columns(file_path, TREE_COLUMNS_KIND))
+    assert tree_columns.get_node_count() == len(tree.get_hash())
+    index = tree_columns.find_index_by_hash(
+        next(node for _, node in tree.get_hash().values() if node.get_tag_name() == "input").get_hash())
+    node = tree_columns.get_node(index)
+    assert node.get_tag_name() == "input"
+    assert node.get_element().get_attribute("name") == "q"
+    # Only the input's ancestors and their children were built
+    assert len(tree_columns.get_built_nodes()) < tree_columns.get_node_count()
@@ -0,0 +1,29 @@
+from qubot.environment.convergence_monitor import ConvergenceMonitor
+
+def run(monitor: ConvergenceMonitor, episodes):
+    """
+    :return: The 1-based episode the monitor reported convergence on, or None.
+    """
+    for episode, (max_delta_q, reward) in enumerate(episodes):
+        if monitor.update(max_delta_q, reward):
+            return episode + 1
+    return None
+
+def test_converges_after_a_window_of_stable_episodes():
+    # The first window fills the moving average, and the next one has to stay stable
+    assert run(ConvergenceMonitor(0.1, 3), [(0, 5)] * 10) == 6
+
+def test_window_of_one():
+    assert run(ConvergenceMonitor(0.1, 1), [(0, 5)] * 10) == 2
+
+def test_large_q_updates_reset_the_count():
+    episodes = [(0, 5)] * 5 + [(1, 5)] + [(0, 5)] * 10
+    assert run(ConvergenceMonitor(0.1, 3), episodes) == 9
+
+def test_changing_rewards_reset_the_count():
+    episodes = [(0, 5)] * 5 + [(0, 50)] + [(0, 5)] * 10
+    # The moving average jumps when the outlier enters the window, and again when it leaves it
+    assert run(ConvergenceMonitor(0.1, 3), episodes) == 12
+
+def test_never_converges_while_rewards_drift():
+    assert run(ConvergenceMonitor(0.1, 3), [(0, reward) for reward in range(20)]) is None
@@ -0,0 +1,113 @@
+import asyncio
+from threading import Event
+from time import sleep
+import pytest
+
+from qubot.utils.deadline import Deadline, DeadlineExecutor, CancelToken, ActionTimeoutError, CrawlStoppedError
+
+def make_flaky(failures: int, result="done"):
+    calls = []
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ValueError("attempt %d failed" % len(calls))
+        return result
+    return func, calls
+
+def test_no_deadline():
+    deadline = Deadline()
+    assert deadline.get_remaining() is None
+    assert not deadline.is_expired()
+    assert deadline.get_budget(None) is None
+    assert deadline.get_budget(5) == 5
+
+def test_deadline_cuts_budgets_short():
+    deadline = Deadline(10)
+    assert not deadline.is_expired()
+    assert deadline.get_budget(1) == 1
+    assert 9 < deadline.get_budget(60) <= 10
+    assert 9 < deadline.get_budget(None) <= 10
+    expired = Deadline(0)
+    assert expired.is_expired()
+    assert expired.get_budget(5) == 0
+
+@pytest.mark.parametrize("use_timeout", [True, False])
+def test_retries_until_success(use_timeout):
+    func, calls = make_flaky(2)
+    errors = []
+    executor = DeadlineExecutor(5, max_retries=2, backoff_s=0)
+    assert executor.run(func, on_fail=errors.append, use_timeout=use_timeout) == "done"
+    assert len(calls) == 3
+    assert [str(error) for error in errors] == ["attempt 1 failed", "attempt 2 failed"]
+
+def test_raises_the_last_error_after_the_retries():
+    func, calls = make_flaky(10)
+    errors = []
+    with pytest.raises(ValueError, match="attempt 3 failed"):
+        DeadlineExecutor(5, max_retries=2, backoff_s=0).run(func, on_fail=errors.append)
+    assert len(calls) == 3
+    assert len(errors) == 3
+
+def test_attempts_over_budget_time_out():
+    release = Event()
+    late_results = []
+    finished = Event()
+    def slow():
+        release.wait(5)
+        return "late"
+    def on_late_result(result):
+        late_results.append(result)
+        finished.set()
+    with pytest.raises(ActionTimeoutError):
+        DeadlineExecutor(0.05, max_retries=0).run(slow, on_late_result=on_late_result)
+    release.set()
+    assert finished.wait(5)
+    assert late_results == ["late"]
+
+def test_without_timeout_runs_on_the_calling_thread():
+    def slow():
+        sleep(0.1)
+        return "done"
+    assert DeadlineExecutor(0.01, max_retries=0).run(slow, use_timeout=False) == "done"
+
+def test_stops_when_cancelled_or_past_the_deadline():
+    func, calls = make_flaky(0)
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(CrawlStoppedError):
+        DeadlineExecutor(5, cancel_token=token).run(func)
+    with pytest.raises(CrawlStoppedError):
+        DeadlineExecutor(5, deadline=Deadline(0)).run(func)
+    assert not calls
+
+def test_cancelling_interrupts_the_backoff():
+    token = CancelToken()
+    func, calls = make_flaky(10)
+    executor = DeadlineExecutor(5, max_retries=5, backoff_s=60, max_backoff_s=60, cancel_token=token)
+    with pytest.raises(CrawlStoppedError):
+        executor.run(func, on_fail=lambda _: token.cancel())
+    assert len(calls) == 1
+
+def test_backoff_is_capped():
+    executor = DeadlineExecutor(backoff_s=1, max_backoff_s=3)
+    for attempt in range(1, 6):
+        assert 0 <= executor.get_backoff_s(attempt) <= min(3, 2 ** (attempt - 1))
+
+def test_run_async():
+    attempts = []
+    async def make_coroutine():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise ValueError("failed")
+        return "done"
+    executor = DeadlineExecutor(5, max_retries=1, backoff_s=0)
+    assert asyncio.run(executor.run_async(make_coroutine)) == "done"
+    assert len(attempts) == 2
+
+def test_run_async_times_out():
+    async def slow():
+        await asyncio.sleep(5)
+    errors = []
+    with pytest.raises(ActionTimeoutError):
+        asyncio.run(DeadlineExecutor(0.05, max_retries=0).run_async(slow, on_fail=errors.append))
+    assert len(errors) == 1
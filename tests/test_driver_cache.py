@@ -0,0 +1,55 @@
+from qubot.driver.base_driver import BaseDriver
+from qubot.driver.driver import Driver
+from qubot.driver.page_readiness import PageReadiness
+
+SITE = {
+    "index.html": "<html><body><a href='a.html'>A</a><a href='b.html'>B</a><input type='text'></body></html>",
+    "a.html": "<html><body><p>A page</p><a href='b.html'>B</a></body></html>",
+    "b.html": "<html><body><h1>B page</h1></body></html>",
+}
+
+def crawl(site_dir, **kwargs):
+    driver = Driver(use_cache=True, **kwargs)
+    tree = driver.construct_tree((site_dir / "index.html").as_uri(), max_urls_to_visit=5)
+    return tree, driver.get_stats()
+
+def get_node_hashes(tree):
+    return sorted(tree.get_hash().keys())
+
+def test_unchanged_sites_are_served_from_the_cache(write_site, fake_firefox):
+    site_dir = write_site(SITE)
+    first, first_stats = crawl(site_dir)
+    assert first_stats.get_count(BaseDriver.STAT_URLS_VISITED) == 2
+    second, second_stats = crawl(site_dir)
+    assert second_stats.get_count(BaseDriver.STAT_CACHE_HITS) == 1
+    assert get_node_hashes(second) == get_node_hashes(first)
+    # The stats of the cached crawl are restored
+    assert second_stats.get_count(BaseDriver.STAT_URLS_VISITED) == 2
+
+def test_changes_to_deeper_pages_invalidate_the_cache(write_site, fake_firefox):
+    site_dir = write_site(SITE)
+    crawl(site_dir)
+    write_site({"b.html": SITE["b.html"].replace("</body>", "<button id='newbutton'>New</button></body>")})
+    tree, stats = crawl(site_dir)
+    assert stats.get_count(BaseDriver.STAT_CACHE_HITS) == 0
+    assert any(node.get_html_id() == "newbutton" for _, node in tree.get_hash().values())
+
+def test_cache_is_keyed_by_the_crawl_settings(write_site, fake_firefox):
+    site_dir = write_site(SITE)
+    crawl(site_dir)
+    _, stats = crawl(site_dir, input_values={"text": "hello"})
+    assert stats.get_count(BaseDriver.STAT_CACHE_HITS) == 0
+    _, stats = crawl(site_dir, input_values={"text": "hello"})
+    assert stats.get_count(BaseDriver.STAT_CACHE_HITS) == 1
+    _, stats = crawl(site_dir)
+    assert stats.get_count(BaseDriver.STAT_CACHE_HITS) == 0
+
+def test_cache_hits_keep_the_pages_not_ready_while_checking(write_site, fake_firefox):
+    site_dir = write_site(SITE)
+    crawl(site_dir)
+    fake_firefox.ready_state = "loading"
+    readiness = PageReadiness(ready_state_timeout_s=0.01, network_idle_timeout_s=None, dom_quiet_timeout_s=None, poll_interval_s=0.01)
+    _, stats = crawl(site_dir, readiness=readiness)
+    assert stats.get_count(BaseDriver.STAT_CACHE_HITS) == 1
+    # The start page, and each page checked in a session
+    assert stats.get_count(BaseDriver.STAT_PAGES_NOT_READY) == 3
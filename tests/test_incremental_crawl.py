@@ -0,0 +1,76 @@
+from qubot.driver.base_driver import BaseDriver
+from qubot.driver.static_html_driver import StaticHTMLDriver
+from qubot.ui.ui_tree import UITree
+
+SITE = {
+    "index.html": "<html><body><div id='nav'><a href='a.html'>A</a><a href='b.html'>B</a></div>"
+                  "<p id='version'>v1</p></body></html>",
+    "a.html": "<html><body><div id='content'><p>A page</p><a href='c.html'>C</a></div></body></html>",
+    "b.html": "<html><body><ul><li>One</li><li>Two</li></ul><input type='text' id='search'></body></html>",
+    "c.html": "<html><body><h1>C page</h1></body></html>",
+}
+
+def crawl(site_dir, previous_tree: UITree = None):
+    driver = StaticHTMLDriver()
+    tree = driver.construct_tree(str(site_dir / "index.html"), max_urls_to_visit=10, previous_tree=previous_tree)
+    # Crawls are re-run from serialized trees, as from a tree_file
+    return UITree.from_dict(tree.to_dict()), driver.get_stats()
+
+def get_node_hashes(tree: UITree):
+    return sorted(node.get_hash() for _, node in tree.get_hash().values())
+
+def get_nodes(tree: UITree):
+    nodes, stack = [], [tree.get_root()]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.get_children())
+    return nodes
+
+def find_by_html_id(tree: UITree, html_id: str):
+    return [node for _, node in tree.get_hash().values() if node.get_html_id() == html_id]
+
+def test_unchanged_site_is_grafted_but_still_loaded(write_site):
+    site_dir = write_site(SITE)
+    first, first_stats = crawl(site_dir)
+    second, second_stats = crawl(site_dir, first)
+    assert get_node_hashes(second) == get_node_hashes(first)
+    assert second_stats.get_count(BaseDriver.STAT_SUBTREES_GRAFTED) > 0
+    # Every page is loaded again, so changes to it would have been seen
+    assert second_stats.get_count(BaseDriver.STAT_URLS_VISITED) == first_stats.get_count(BaseDriver.STAT_URLS_VISITED) == 3
+    for page in ["a.html", "b.html", "c.html"]:
+        url = (site_dir / page).as_uri()
+        assert second.get_page_hash(url) == first.get_page_hash(url)
+
+def test_changes_to_deeper_pages_are_crawled(write_site):
+    site_dir = write_site(SITE)
+    first, _ = crawl(site_dir)
+    write_site({"a.html": SITE["a.html"].replace("</body>", "<button id='newbutton'>New</button></body>")})
+    second, stats = crawl(site_dir, first)
+    assert len(find_by_html_id(second, "newbutton")) == 1
+    assert second.get_page_hash((site_dir / "a.html").as_uri()) != first.get_page_hash((site_dir / "a.html").as_uri())
+    # The unchanged part of the page, and the pages past it, are still in the tree
+    assert len(find_by_html_id(second, "content")) == 1
+    assert any(node.get_tag_name() == "h1" for _, node in second.get_hash().values())
+    assert stats.get_count(BaseDriver.STAT_URLS_VISITED) == 3
+
+def test_changes_to_the_start_page_keep_unchanged_pages(write_site):
+    site_dir = write_site(SITE)
+    first, _ = crawl(site_dir)
+    write_site({"index.html": SITE["index.html"].replace("v1", "v2")})
+    second, stats = crawl(site_dir, first)
+    assert [node.get_text() for node in find_by_html_id(second, "version")] == ["v2"]
+    # Only the start page and the version changed
+    assert len(set(get_node_hashes(first)) - set(get_node_hashes(second))) == 3
+    assert len(set(get_node_hashes(second)) - set(get_node_hashes(first))) == 3
+    assert stats.get_count(BaseDriver.STAT_SUBTREES_GRAFTED) > 0
+    assert stats.get_count(BaseDriver.STAT_ACTIONS_REUSED) > 0
+
+def test_grafted_subtrees_can_repeat(write_site):
+    repeated = "<div class='card'><p>Same</p><a href='c.html'>C</a></div>"
+    site_dir = write_site(dict(SITE, **{"index.html": "<html><body>%s%s</body></html>" % (repeated, repeated)}))
+    first, _ = crawl(site_dir)
+    second, _ = crawl(site_dir, first)
+    assert len(get_nodes(second)) == len(get_nodes(first))
+    node_ids = [node.get_id() for node in get_nodes(second)]
+    assert len(node_ids) == len(set(node_ids))
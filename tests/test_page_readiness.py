@@ -0,0 +1,69 @@
+import asyncio
+
+from qubot.driver.base_driver import BaseDriver
+from qubot.driver.driver import Driver
+from qubot.driver.page_readiness import PageReadiness
+
+READY = ["complete", 0, 60000, 60000]
+
+
+class FlakyWebDriver:
+    """
+    Fails to run the readiness probe a number of times, as while a document unloads, then reports a ready page.
+    """
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.probes = 0
+
+    def execute_script(self, script: str, *args):
+        self.probes += 1
+        if self.probes <= self.failures:
+            raise Exception("Document is unloading")
+        return READY
+
+
+class FlakySession(FlakyWebDriver):
+    async def execute_script(self, script: str, *args):
+        return FlakyWebDriver.execute_script(self, script, *args)
+
+
+def get_readiness(timeout_s: float = 1) -> PageReadiness:
+    return PageReadiness(ready_state_timeout_s=timeout_s, network_idle_timeout_s=timeout_s,
+                         dom_quiet_timeout_s=timeout_s, poll_interval_s=0.01)
+
+def test_ready_pages_are_not_waited_on():
+    web_driver = FlakyWebDriver(0)
+    assert get_readiness().wait(web_driver) == []
+    assert web_driver.probes == 2
+
+def test_failed_probes_are_retried_until_the_page_is_ready():
+    web_driver = FlakyWebDriver(3)
+    assert get_readiness().wait(web_driver) == []
+    assert web_driver.probes == 4
+
+def test_failing_probes_time_out_every_signal():
+    web_driver = FlakyWebDriver(10 ** 6)
+    assert get_readiness(0.05).wait(web_driver) == [
+        PageReadiness.SIGNAL_READY_STATE, PageReadiness.SIGNAL_NETWORK_IDLE, PageReadiness.SIGNAL_DOM_QUIET
+    ]
+
+def test_failed_async_probes_are_retried_until_the_page_is_ready():
+    session = FlakySession(3)
+    assert asyncio.run(get_readiness().wait_async(session)) == []
+    assert session.probes == 4
+
+def test_failing_async_probes_time_out_every_signal():
+    session = FlakySession(10 ** 6)
+    assert len(asyncio.run(get_readiness(0.05).wait_async(session))) == 3
+
+def test_crawls_go_on_when_the_start_page_cant_be_probed(write_site, fake_firefox):
+    site_dir = write_site({
+        "index.html": "<html><body><a href='a.html'>A</a></body></html>",
+        "a.html": "<html><body><p>A page</p></body></html>",
+    })
+    fake_firefox.ready_state = None
+    driver = Driver(use_cache=False, readiness=get_readiness(0.02))
+    tree = driver.construct_tree((site_dir / "index.html").as_uri(), max_urls_to_visit=5)
+    assert any(node.get_tag_name() == "p" for _, node in tree.get_hash().values())
+    assert driver.get_stats().get_count(BaseDriver.STAT_PAGES_NOT_READY) >= 2
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from qubot.ui.ui_action import UIAction
+from qubot.config.preset_rewards import encourage_exploration
+from qubot.environment.reward_rules import RewardRule, RewardRules
+from qubot.environment.q_learning_environment import QLearningEnvironment
+
+PAGE = "<html><body><div><a>1</a><a>2</a></div><p>3</p><form><input><button>4</button></form></body></html>"
+# Every element has a single child, so every policy takes the same path
+CHAIN_PAGE = "<html><body><div><form><p>1</p></form></div></body></html>"
+CHAIN_RULES = RewardRules([
+    RewardRule(-5, is_leaf=True),
+    RewardRule(-2, min_visits=3),
+    RewardRule(3, actions=[UIAction.NAVIGATE]),
+], default=1)
+
+def make_env(build_tree, page: str, **kwargs) -> QLearningEnvironment:
+    reward_func = kwargs.pop("reward_func", encourage_exploration)
+    return QLearningEnvironment(build_tree(page), reward_func, alpha=kwargs.pop("alpha", 0.5),
+                                gamma=kwargs.pop("gamma", 0.9), epsilon=1.0, step_limit=20, **kwargs)
+
+def get_q_values(env: QLearningEnvironment) -> np.ndarray:
+    count = env.get_graph().get_node_count()
+    states, actions = np.divmod(np.arange(count * count), count)
+    return np.asarray(env.get_q_table().get_many(states, actions))
+
+@pytest.mark.parametrize("batch_episodes", [1, 3])
+def test_convergence_on_the_final_episode_is_recorded(build_tree, batch_episodes):
+    # Any change is within the tolerance, so training converges once the window is full twice over
+    env = make_env(build_tree, PAGE, batch_episodes=batch_episodes, convergence_tolerance=float("inf"),
+                   convergence_window=3)
+    env.train(6)
+    assert env.get_stats().get(QLearningEnvironment.STAT_CONVERGED_EPISODE) == [6]
+    assert env.get_trained_episode_count() == 6
+
+@pytest.mark.parametrize("batch_episodes", [1, 3])
+def test_early_convergence_stops_training(build_tree, batch_episodes):
+    env = make_env(build_tree, PAGE, batch_episodes=batch_episodes, convergence_tolerance=float("inf"),
+                   convergence_window=3)
+    env.train(12)
+    assert env.get_stats().get(QLearningEnvironment.STAT_CONVERGED_EPISODE) == [6]
+    assert len(env.get_training_rewards_history()) == 6
+
+def test_unconverged_training_records_no_convergence(build_tree):
+    env = make_env(build_tree, PAGE, convergence_tolerance=0.0, convergence_window=3)
+    env.train(6)
+    assert env.get_stats().get(QLearningEnvironment.STAT_CONVERGED_EPISODE) == []
+
+def test_batch_trainer_matches_sequential_trainer(build_tree):
+    # With alpha 1 and gamma 0, updates don't depend on earlier ones, so reading the Q-table as it was at the start of
+    # a step, as batches do, gives the same Q-values
+    sequential = make_env(build_tree, CHAIN_PAGE, reward_func=CHAIN_RULES, alpha=1.0, gamma=0.0)
+    batched = make_env(build_tree, CHAIN_PAGE, reward_func=CHAIN_RULES, alpha=1.0, gamma=0.0, batch_episodes=4)
+    sequential.train(10)
+    batched.train(10)
+    assert np.count_nonzero(get_q_values(sequential)) > 4
+    assert np.array_equal(get_q_values(batched), get_q_values(sequential))
+    assert batched.get_training_rewards_history() == sequential.get_training_rewards_history()
+    assert np.allclose(batched.get_epsilon_history(), sequential.get_epsilon_history())
+    sequential.test(5)
+    batched.test(5)
+    assert batched.get_testing_rewards_history() == sequential.get_testing_rewards_history()
+    assert batched.get_testing_penalties_history() == sequential.get_testing_penalties_history()
+
+def get_q_values_by_hash(env: QLearningEnvironment):
+    graph = env.get_graph()
+    states, actions, values = env.get_q_table().get_entries()
+    return {(graph.get_hash(state), graph.get_hash(action)): value
+            for state, action, value in zip(states.tolist(), actions.tolist(), values.tolist())}
+
+@pytest.mark.parametrize("sparse_q_table", [False, True])
+def test_saved_runs_load_back(build_tree, tmp_path, sparse_q_table):
+    env = make_env(build_tree, PAGE)
+    env.train(20)
+    # The suffix is added if missing
+    env.save(str(tmp_path / "q_table"))
+    assert (tmp_path / "q_table.npz").exists()
+    loaded = make_env(build_tree, PAGE, sparse_q_table=sparse_q_table)
+    assert loaded.load(str(tmp_path / "q_table.npz")) == 1.0
+    assert get_q_values_by_hash(loaded) == get_q_values_by_hash(env)
+    assert loaded.get_trained_episode_count() == 20
+    assert sorted(loaded._get_history_counts()) == sorted(env._get_history_counts())
+    # Training goes on with the epsilon left by the saved run
+    loaded.train(1)
+    env.train(1)
+    assert loaded.get_epsilon_history() == env.get_epsilon_history()[-1:]
+
+def test_saved_runs_load_onto_changed_trees(build_tree, tmp_path):
+    env = make_env(build_tree, PAGE)
+    env.train(50)
+    env.save(str(tmp_path / "q_table"))
+    saved_values = get_q_values_by_hash(env)
+    changed_page = PAGE.replace("</body>", "<span>5</span></body>")
+    loaded = make_env(build_tree, changed_page)
+    overlap = loaded.load(str(tmp_path / "q_table"))
+    # Only the <html> and <body> elements, which contain the new one, and the new one changed
+    node_count = loaded.get_graph().get_node_count()
+    assert overlap == (node_count - 3) / node_count
+    loaded_values = get_q_values_by_hash(loaded)
+    assert loaded_values
+    for key, value in loaded_values.items():
+        assert saved_values[key] == value
+    unchanged_hashes = {node.get_hash() for _, node in build_tree(PAGE).get_hash().values()
+                        if node.get_tag_name() not in ("html", "body")}
+    assert {key for key in saved_values if set(key) <= unchanged_hashes} == set(loaded_values.keys())
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from qubot.environment.q_table import QTable, DenseQTable, SparseQTable
+from qubot.ui.ui_tree_graph import UITreeGraph
+
+PAGE = "<html><body><div><a>1</a><a>2</a></div><p>3</p><form><input><button>4</button></form></body></html>"
+
+def make_tables(build_tree):
+    graph = UITreeGraph(build_tree(PAGE))
+    count = graph.get_node_count()
+    return graph, DenseQTable(count, count), SparseQTable.from_graph(graph)
+
+def get_edges(graph: UITreeGraph):
+    return [(state, action) for action in range(graph.get_node_count()) for state in [int(graph.parents[action])]
+            if state != UITreeGraph.NO_NODE] + \
+           [(action, state) for action in range(graph.get_node_count()) for state in [int(graph.parents[action])]
+            if state != UITreeGraph.NO_NODE]
+
+def test_q_table_is_abstract():
+    with pytest.raises(TypeError):
+        QTable()
+
+def test_sparse_table_only_stores_edges(build_tree):
+    graph, dense, sparse = make_tables(build_tree)
+    states, actions, values = sparse.get_entries()
+    assert len(values) == 0
+    assert sparse.get_size_bytes() < dense.get_size_bytes()
+    state, action = get_edges(graph)[0]
+    sparse.set(state, action, 1.5)
+    assert sparse.get(state, action) == 1.5
+    with pytest.raises(Exception):
+        sparse.set(0, graph.get_node_count() - 1, 1.0)
+    # Missing entries read as zero
+    assert sparse.get(0, graph.get_node_count() - 1) == 0.0
+
+@pytest.mark.parametrize("seed", range(5))
+def test_sparse_table_matches_dense_table(build_tree, seed):
+    graph, dense, sparse = make_tables(build_tree)
+    rng = np.random.default_rng(seed)
+    edges = get_edges(graph)
+    states = np.array([state for state, _ in edges])
+    actions = np.array([action for _, action in edges])
+    # Mix negative, zero and positive values, so the implicit zeros of the sparse table decide some maxima
+    values = rng.choice([-2.0, -1.0, 0.0, 0.5, 3.0], size=len(edges))
+    dense.set_many(states, actions, values)
+    sparse.set_many(states, actions, values)
+
+    all_states = np.arange(graph.get_node_count())
+    assert np.array_equal(sparse.get_many(states, actions), dense.get_many(states, actions))
+    assert np.array_equal(sparse.max_many(all_states), dense.max_many(all_states))
+    assert np.array_equal(sparse.argmax_many(all_states), dense.argmax_many(all_states))
+    for state in all_states.tolist():
+        assert sparse.max(state) == dense.max(state)
+        assert sparse.argmax(state) == dense.argmax(state)
+    sparse_entries, dense_entries = sparse.get_entries(), dense.get_entries()
+    assert sorted(zip(*[entry.tolist() for entry in sparse_entries])) == sorted(zip(*[entry.tolist() for entry in dense_entries]))
+
+def test_many_operations_accept_no_states(build_tree):
+    _, dense, sparse = make_tables(build_tree)
+    for table in (dense, sparse):
+        assert len(table.max_many(np.zeros(0, dtype=np.int64))) == 0
+        assert len(table.argmax_many(np.zeros(0, dtype=np.int64))) == 0
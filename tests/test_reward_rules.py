@@ -0,0 +1,92 @@
+from itertools import product
+import numpy as np
+import pytest
+
+from qubot.ui.ui_action import UIAction
+from qubot.environment.reward_rules import RewardRule, RewardRules, get_reward_rules
+from qubot.config.preset_rewards import encourage_exploration, discourage_exploration, heavily_encourage_exploration, \
+    heavily_discourage_exploration, reward_repeat_visits, penalize_repeat_visits, encourage_success
+
+class FakeNode:
+    def __init__(self, is_terminal: bool, is_leaf: bool, visits: int):
+        self.__is_terminal = is_terminal
+        self.__children = [] if is_leaf else [None]
+        self.__visits = visits
+
+    def is_terminal(self):
+        return self.__is_terminal
+
+    def get_children(self):
+        return self.__children
+
+    def get_visits(self):
+        return self.__visits
+
+def make_baseline(terminal: float, click: float, default: float = 0):
+    def reward_func(action: UIAction, is_terminal: bool, is_leaf: bool, prior_visits: int):
+        if is_terminal:
+            return terminal
+        elif is_leaf:
+            return -1
+        elif action == UIAction.LEFT_CLICK:
+            return click
+        return default
+    return reward_func
+
+def make_repeat_baseline(repeat: float):
+    encourage = make_baseline(-100, 10)
+    def reward_func(action: UIAction, is_terminal: bool, is_leaf: bool, prior_visits: int):
+        return repeat if prior_visits else encourage(action, is_terminal, is_leaf, prior_visits)
+    return reward_func
+
+# The presets as they were written before being declared as rules, checking the visits before the current one
+BASELINES = {
+    encourage_exploration: make_baseline(-100, 10),
+    discourage_exploration: make_baseline(100, 10),
+    heavily_encourage_exploration: make_baseline(-1, 100, -1),
+    heavily_discourage_exploration: make_baseline(-1, 100, -1),
+    reward_repeat_visits: make_repeat_baseline(100),
+    penalize_repeat_visits: make_repeat_baseline(-100),
+    encourage_success: make_baseline(100, 10),
+}
+
+CASES = list(product(UIAction, [False, True], [False, True], [1, 2, 3]))
+
+@pytest.mark.parametrize("preset", list(BASELINES))
+def test_presets_match_their_baselines(preset):
+    reward_func, baseline = preset, BASELINES[preset]
+    rules = get_reward_rules(reward_func)
+    assert rules is not None
+    for action, is_terminal, is_leaf, visits in CASES:
+        node = FakeNode(is_terminal, is_leaf, visits)
+        expected = baseline(action, is_terminal, is_leaf, visits - 1)
+        assert reward_func(action, node) == expected
+        assert rules(action, node) == expected
+
+@pytest.mark.parametrize("preset", list(BASELINES))
+def test_evaluate_matches_single_nodes(preset):
+    rules = get_reward_rules(preset)
+    cases = list(product(UIAction, [False, True], [False, True]))
+    actions = np.array([action.value for action, _, _ in cases])
+    terminals = np.array([is_terminal for _, is_terminal, _ in cases])
+    leaves = np.array([is_leaf for _, _, is_leaf in cases])
+    for visits in [1, 2, 3]:
+        rewards = rules.evaluate(actions, terminals, leaves, visits)
+        assert rewards.tolist() == [rules(action, FakeNode(is_terminal, is_leaf, visits))
+                                    for action, is_terminal, is_leaf in cases]
+
+def test_visit_levels():
+    assert get_reward_rules(encourage_exploration).get_visit_levels() == 1
+    assert not get_reward_rules(encourage_exploration).is_visit_dependent()
+    assert get_reward_rules(penalize_repeat_visits).get_visit_levels() == 2
+    assert RewardRules([RewardRule(1, min_visits=3), RewardRule(2, min_visits=2)]).get_visit_levels() == 3
+
+def test_first_matching_rule_wins():
+    rules = RewardRules([RewardRule(1, is_terminal=True), RewardRule(2, is_terminal=True)], default=7)
+    assert rules(UIAction.NAVIGATE, FakeNode(True, True, 1)) == 1
+    assert rules(UIAction.NAVIGATE, FakeNode(False, True, 1)) == 7
+
+def test_arbitrary_functions_have_no_rules():
+    rules = RewardRules([])
+    assert get_reward_rules(lambda action, node: 0) is None
+    assert get_reward_rules(rules) is rules
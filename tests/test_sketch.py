@@ -0,0 +1,57 @@
+import json
+import numpy as np
+import pytest
+
+from qubot.stats.sketch import QuantileSketch
+
+def assert_within(estimate: float, exact: float, relative_accuracy: float):
+    assert abs(estimate - exact) <= relative_accuracy * abs(exact) + 1e-12
+
+@pytest.mark.parametrize("quantile", [0, 0.1, 0.5, 0.9, 0.99, 1])
+def test_quantiles_are_within_the_relative_accuracy(quantile):
+    values = np.random.default_rng(0).lognormal(0, 2, 10000)
+    sketch = QuantileSketch(0.01)
+    for value in values.tolist():
+        sketch.add(value)
+    exact = float(np.sort(values)[int(quantile * (len(values) - 1))])
+    assert_within(sketch.get_quantile(quantile), exact, 0.01)
+
+def test_negative_and_zero_values():
+    sketch = QuantileSketch(0.01)
+    for value in [-100, -10, -1, 0, 0, 1, 10, 100]:
+        sketch.add(value)
+    assert sketch.get_count() == 8
+    assert_within(sketch.get_quantile(0), -100, 0.01)
+    assert sketch.get_quantile(3 / 7) == 0.0
+    assert_within(sketch.get_quantile(1), 100, 0.01)
+
+def test_empty_sketch_has_no_quantiles():
+    assert QuantileSketch().get_quantile(0.5) is None
+
+def test_merging_equals_adding_everything_to_one_sketch():
+    values = np.random.default_rng(1).normal(0, 50, 2000).tolist()
+    whole, left, right = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for index, value in enumerate(values):
+        whole.add(value)
+        (left if index % 2 else right).add(value)
+    merged = left.copy()
+    merged.merge(right)
+    assert merged.get_count() == whole.get_count() == len(values)
+    for quantile in [0, 0.25, 0.5, 0.75, 1]:
+        assert merged.get_quantile(quantile) == whole.get_quantile(quantile)
+    # Copies don't share buckets with the sketch they were copied from
+    assert left.get_count() == len(values) // 2
+
+def test_sketches_of_different_accuracies_dont_merge():
+    with pytest.raises(Exception):
+        QuantileSketch(0.01).merge(QuantileSketch(0.05))
+
+def test_serialized_sketches_keep_their_quantiles():
+    sketch = QuantileSketch(0.02)
+    for value in [-5, -0.5, 0, 1, 2, 3, 1000]:
+        sketch.add(value)
+    restored = QuantileSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+    assert restored.get_count() == sketch.get_count()
+    for quantile in [0, 0.2, 0.5, 0.8, 1]:
+        assert restored.get_quantile(quantile) == sketch.get_quantile(quantile)
+    restored.merge(QuantileSketch(0.02))
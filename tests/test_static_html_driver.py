@@ -0,0 +1,94 @@
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import pytest
+
+from qubot.driver.base_driver import BaseDriver
+from qubot.driver.static_html_driver import StaticHTMLDriver
+from qubot.ui.ui_tree import UITree
+
+SITE = {
+    "index.html": "<html><body><a href='a.html'>A</a><a href='a.html#top'>A again</a><a href='b.html'>B</a>"
+                  "<a href='javascript:void(0)'>Script</a><a href='mailto:qubot@example.com'>Mail</a>"
+                  "<a href='../outside.html'>Outside</a><a href='missing.html'>Missing</a>"
+                  "<input type='text'><button>Go</button></body></html>",
+    "a.html": "<html><body><p id='a'>A page</p><a href='index.html'>Home</a></body></html>",
+    "b.html": "<html><body><p id='b'>B page</p></body></html>",
+}
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def site(tmp_path):
+    """
+    :return: The directory of the site, next to a page outside of it.
+    """
+    (tmp_path / "site").mkdir()
+    (tmp_path / "outside.html").write_text("<html><body><p id='outside'>Outside</p></body></html>")
+    for name, html in SITE.items():
+        (tmp_path / "site" / name).write_text(html)
+    return tmp_path / "site"
+
+@pytest.fixture
+def server(site):
+    """
+    :return: The URL of a local HTTP server serving the site.
+    """
+    (site / "sub").mkdir()
+    (site / "sub" / "index.html").write_text("<html><body><p id='sub'>Sub page</p></body></html>")
+    (site / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+    (site / "served.html").write_text("<html><body><a href='sub'>Sub</a><a href='image.png'>Image</a></body></html>")
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(site)))
+    Thread(target=http_server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:%d/" % http_server.server_address[1]
+    http_server.shutdown()
+    http_server.server_close()
+
+def find_by_html_id(tree: UITree, html_id: str):
+    return [node for _, node in tree.get_hash().values() if node.get_html_id() == html_id]
+
+def test_links_in_scope_are_followed(site):
+    driver = StaticHTMLDriver()
+    tree = driver.construct_tree(str(site / "index.html"), max_urls_to_visit=10)
+    stats = driver.get_stats()
+    assert sorted(stats.get(BaseDriver.STAT_URLS_VISITED)) == [(site / "a.html").as_uri(), (site / "b.html").as_uri()]
+    assert len(find_by_html_id(tree, "a")) == 1
+    assert len(find_by_html_id(tree, "b")) == 1
+    # Links out of the start file's directory, scripts and mail links lead nowhere
+    assert find_by_html_id(tree, "outside") == []
+    # Missing pages are crashes, and the crawl goes on past them
+    assert stats.get_count(BaseDriver.STAT_CRASH_DETECTED) == 1
+    assert stats.get_count(BaseDriver.STAT_ELEMENTS_INPUTTED) == 1
+
+def test_links_out_of_scope_are_followed_when_allowed(site):
+    tree = StaticHTMLDriver(same_origin_only=False).construct_tree(str(site / "index.html"), max_urls_to_visit=10)
+    assert len(find_by_html_id(tree, "outside")) == 1
+
+def test_crawls_stop_at_the_url_budget(site):
+    driver = StaticHTMLDriver()
+    driver.construct_tree(str(site / "index.html"), max_urls_to_visit=2)
+    assert driver.get_stats().get(BaseDriver.STAT_URLS_VISITED) == [(site / "a.html").as_uri()]
+
+def test_shallow_crawls_only_load_the_start_page(site):
+    driver = StaticHTMLDriver()
+    tree = driver.construct_tree(str(site / "index.html"), deep=False)
+    assert driver.get_stats().get_count(BaseDriver.STAT_URLS_VISITED) == 0
+    assert find_by_html_id(tree, "a") == []
+    assert len(tree.get_hash()) > 1
+
+def test_http_redirects_and_non_html_pages(server):
+    driver = StaticHTMLDriver()
+    tree = driver.construct_tree(server + "served.html", max_urls_to_visit=10)
+    stats = driver.get_stats()
+    # The directory link redirects to its index
+    assert stats.get(BaseDriver.STAT_URLS_VISITED) == [server + "sub/"]
+    assert len(find_by_html_id(tree, "sub")) == 1
+    assert stats.get_count(BaseDriver.STAT_CRASH_DETECTED) == 1
+    assert "not an HTML page" in stats.get(BaseDriver.STAT_CRASH_DETECTED)[0]["error"]
+
+def test_local_paths_become_file_urls(site, monkeypatch):
+    monkeypatch.chdir(site)
+    assert StaticHTMLDriver.to_url("index.html") == (site / "index.html").as_uri()
+    assert StaticHTMLDriver.to_url("http://localhost/") == "http://localhost/"
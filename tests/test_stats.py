@@ -0,0 +1,71 @@
+import json
+import pytest
+
+from qubot.stats.stats import Stats
+
+def make_stats(max_events=None, spill_path=None) -> Stats:
+    stats = Stats("test", max_events, spill_path)
+    for value in range(1, 11):
+        stats.record("values", value)
+        stats.record("pages", {"url": "page-%d" % value})
+        stats.start_timer("timer")
+        stats.stop_timer("timer")
+    stats.increment("counter", 3)
+    return stats
+
+def round_trip(stats: Stats, **kwargs) -> Stats:
+    # Stats are written to JSON files by sweeps and batches, so round-trip them through JSON
+    return Stats.from_dict(stats.stat_class, json.loads(json.dumps(stats.to_dict())), **kwargs)
+
+@pytest.mark.parametrize("max_events", [None, 3])
+def test_round_trip_keeps_the_aggregates(max_events):
+    stats = make_stats(max_events)
+    restored = round_trip(stats, max_events=max_events)
+    assert restored.get_count("values") == 10
+    assert restored.get_sum("values") == 55
+    assert restored.get_mean("values") == 5.5
+    assert restored.get_percentile("values", 50) == stats.get_percentile("values", 50)
+    assert restored.get_percentile("values", 100) == stats.get_percentile("values", 100)
+    assert restored.get_count("pages") == 10
+    assert restored.get_count("timer") == 10
+    assert restored.get_mean("timer") == stats.get_mean("timer")
+    assert restored.get_count("counter") == 3
+    assert restored.get("values") == stats.get("values") == list(range(1, 11))[-(max_events or 10):]
+    assert restored.to_dict() == stats.to_dict()
+
+def test_round_trip_keeps_the_retention_limit():
+    restored = round_trip(make_stats(3), max_events=3)
+    assert restored.get_max_events() == 3
+    restored.record("values", 11)
+    assert restored.get("values") == [9, 10, 11]
+    assert restored.get_count("values") == 11
+    assert restored.get_mean("values") == 6
+
+def test_round_trip_doesnt_spill_again(tmp_path):
+    spill_path = str(tmp_path / "events.jsonl")
+    stats = make_stats(spill_path=spill_path)
+    stats.close()
+    with open(spill_path) as file:
+        line_count = len(file.readlines())
+    restored = round_trip(stats, spill_path=spill_path)
+    assert restored.get_spill_path() == spill_path
+    restored.record("values", 11)
+    restored.close()
+    with open(spill_path) as file:
+        lines = file.readlines()
+    assert len(lines) == line_count + 1
+    assert json.loads(lines[-1])["event"] == 11
+
+def test_stats_written_without_aggregates_are_aggregated_from_their_events():
+    restored = Stats.from_dict("test", {"values": {"count": 2, "events": [2, 4]},
+                                        "timer": {"avg_millis": 0, "max_millis": 0, "min_millis": 0, "times": [1, 3]}})
+    assert restored.get_mean("values") == 3
+    assert restored.get_count("timer") == 2
+    assert restored.to_dict()["timer"]["avg_millis"] == 2
+
+def test_merge_keeps_existing_stats():
+    stats = Stats("test")
+    stats.record("values", 1)
+    stats.merge(round_trip(make_stats()))
+    assert stats.get("values") == [1]
+    assert stats.get_count("timer") == 10
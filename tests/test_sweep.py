@@ -0,0 +1,61 @@
+import pytest
+
+from qubot.config.config import QubotConfigTerminalInfo, QubotConfigModelParameters, QubotStatsParameters
+from qubot.config.preset_rewards import QubotPresetRewardFunc
+from qubot.config.sweep import run_sweep, expand_model_params_grid, sweep_grid_from_dict, get_reward_func_name
+from qubot.environment.q_learning_environment import QLearningEnvironment
+
+# Every element has a single child, so every policy takes the same path and each configuration's rewards are fixed
+CHAIN_PAGE = "<html><body><div><form><button id='submit'>Submit</button></form></div></body></html>"
+
+def sweep(build_tree, **kwargs):
+    grid = expand_model_params_grid(QubotConfigModelParameters(train_episodes=8, test_episodes=3, step_limit=10),
+                                    {"alpha": [0.2, 0.8], "gamma": [0.5]})
+    reward_funcs = [QubotPresetRewardFunc.ENCOURAGE_EXPLORATION, QubotPresetRewardFunc.ENCOURAGE_SUCCESS]
+    terminal_info = QubotConfigTerminalInfo(terminal_ids=["submit"])
+    return run_sweep("http://localhost/", build_tree(CHAIN_PAGE), terminal_info, terminal_info, grid, reward_funcs,
+                     **kwargs)
+
+def get_outcomes(results):
+    return [(result.model_params.alpha, get_reward_func_name(result.reward_func),
+             result.stats.get(QLearningEnvironment.STAT_TRAINING_REWARDS),
+             result.stats.get(QLearningEnvironment.STAT_TESTING_REWARDS)) for result in results]
+
+def test_model_params_grids_expand_to_every_combination():
+    grid = expand_model_params_grid(QubotConfigModelParameters(epsilon=0.5), {"alpha": [0.1, 0.2], "gamma": [0.3, 0.4, 0.5]})
+    assert [(params.alpha, params.gamma) for params in grid] == [(0.1, 0.3), (0.1, 0.4), (0.1, 0.5),
+                                                                 (0.2, 0.3), (0.2, 0.4), (0.2, 0.5)]
+    assert all(params.epsilon == 0.5 for params in grid)
+    with pytest.raises(Exception):
+        expand_model_params_grid(QubotConfigModelParameters(), {"learning_rate": [0.1]})
+
+def test_sweeps_are_read_from_configs():
+    grid, reward_funcs = sweep_grid_from_dict({
+        "model_parameters": {"train_episodes": 50},
+        "sweep": {"model_parameters": {"alpha": [0.1, 0.9]}, "reward_funcs": ["ENCOURAGE_SUCCESS", 2]},
+    })
+    assert [(params.alpha, params.train_episodes) for params in grid] == [(0.1, 50), (0.9, 50)]
+    assert reward_funcs == [QubotPresetRewardFunc.ENCOURAGE_SUCCESS, QubotPresetRewardFunc.DISCOURAGE_EXPLORATION]
+    with pytest.raises(Exception):
+        sweep_grid_from_dict({})
+    with pytest.raises(Exception):
+        sweep_grid_from_dict({"sweep": {"reward_funcs": ["UNKNOWN"]}})
+
+def test_workers_match_a_sequential_sweep(build_tree, monkeypatch):
+    results = sweep(build_tree, processes=2)
+    # Without fork, every configuration runs in this process
+    monkeypatch.setattr("qubot.config.sweep.multiprocessing.get_all_start_methods", lambda: ["spawn"])
+    sequential_results = sweep(build_tree)
+    outcomes = get_outcomes(results)
+    assert [(alpha, reward_func) for alpha, reward_func, _, _ in outcomes] == [
+        (0.2, "ENCOURAGE_EXPLORATION"), (0.2, "ENCOURAGE_SUCCESS"), (0.8, "ENCOURAGE_EXPLORATION"), (0.8, "ENCOURAGE_SUCCESS")
+    ]
+    assert all(len(training) == 8 and len(testing) == 3 for _, _, training, testing in outcomes)
+    assert outcomes == get_outcomes(sequential_results)
+
+def test_stats_params_are_carried_to_the_results(build_tree):
+    results = sweep(build_tree, processes=2, stats_params=QubotStatsParameters(max_events=2))
+    for result in results:
+        assert len(result.stats.get(QLearningEnvironment.STAT_TRAINING_REWARDS)) == 2
+        assert result.stats.get_count(QLearningEnvironment.STAT_TRAINING_REWARDS) == 8
+        assert result.stats.get_max_events() == 2
@@ -0,0 +1,56 @@
+PAGE = """
+<html><body>
+    <form id="login-form" class="Form card">
+        <input id="login" placeholder="Email address">
+        <a id="signin" class="btn btn-primary">Sign <b>in</b></a>
+        <button class="btn secondary">Sign up now</button>
+    </form>
+    <p>Forgot your password?</p>
+</body></html>
+"""
+
+def describe(nodes):
+    return [(node.get_tag_name(), node.get_html_id() or None, node.get_html_class() or None) for node in nodes]
+
+def test_id_matches_exactly_before_falling_back_to_substrings(build_tree):
+    index = build_tree(PAGE).get_metadata_index()
+    assert describe(index.find_nodes(html_id="login")) == [("input", "login", None)]
+    assert describe(index.find_nodes(html_id="LOG")) == [("form", "login-form", "Form card"), ("input", "login", None)]
+    assert index.find_nodes(html_id="missing") == []
+
+def test_class_matches_tokens_before_falling_back_to_substrings(build_tree):
+    index = build_tree(PAGE).get_metadata_index()
+    assert describe(index.find_nodes(html_class="btn")) == [("a", "signin", "btn btn-primary"), ("button", None, "btn secondary")]
+    assert describe(index.find_nodes(html_class="form")) == [("form", "login-form", "Form card")]
+    # No token is "prim", so any class containing it matches
+    assert describe(index.find_nodes(html_class="prim")) == [("a", "signin", "btn btn-primary")]
+
+def test_text_matches_own_markup_only(build_tree):
+    index = build_tree(PAGE).get_metadata_index()
+    # The text is split by a child element, so it isn't the own text of any element
+    assert index.find_nodes(contains_text="Sign in") == []
+    # Only the elements containing the text match, not their ancestors
+    assert describe(index.find_nodes(contains_text="sign")) == [("a", "signin", "btn btn-primary"), ("button", None, "btn secondary")]
+    assert describe(index.find_nodes(contains_text="up now")) == [("button", None, "btn secondary")]
+    assert describe(index.find_nodes(contains_text="password?")) == [("p", None, None)]
+
+def test_text_matches_start_tags(build_tree):
+    index = build_tree(PAGE).get_metadata_index()
+    assert describe(index.find_nodes(contains_text="email ADDRESS")) == [("input", "login", None)]
+    assert describe(index.find_nodes(contains_text='class="btn secondary"')) == [("button", None, "btn secondary")]
+
+def test_texts_indexed_up_front_or_on_demand_match_the_same(build_tree):
+    tree = build_tree(PAGE)
+    upfront = tree.get_metadata_index(["sign up", "forgot"])
+    assert describe(upfront.find_nodes(contains_text="Sign up")) == [("button", None, "btn secondary")]
+    on_demand = build_tree(PAGE).get_metadata_index()
+    for text in ["sign up", "forgot", "sign"]:
+        assert describe(on_demand.find_nodes(contains_text=text)) == describe(upfront.find_nodes(contains_text=text))
+
+def test_index_is_rebuilt_when_the_tree_grows(build_tree):
+    tree = build_tree(PAGE)
+    assert tree.find_nodes_by_metadata(html_id="welcome") == []
+    body = [node for node in tree.get_root().get_children() if node.get_tag_name() == "body"][0]
+    page = build_tree('<html><body><div id="welcome">Hi</div></body></html>').get_root().get_snapshot()
+    body.add_transition(page.find_element_by_path((0, 0)))
+    assert describe(tree.find_nodes_by_metadata(html_id="welcome")) == [("div", "welcome", None)]